@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+Utilidades compartidas por los benchmarks: percentiles, commit actual y el informe
+de métricas comparables entre ejecuciones (--baseline).
+"""
+
+import subprocess
+from pathlib import Path
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+
+
+def percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * (len(ordered) - 1)))))
+    return ordered[idx]
+
+
+def git_commit() -> str:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, capture_output=True, text=True
+        )
+        return out.stdout.strip()
+    except OSError:
+        return ""
+
+
+def key_metrics(report: dict) -> dict[str, float]:
+    # Métricas comparables entre commits (menor = mejor salvo chars_per_s y rps).
+    metrics = {}
+    for row in report.get("asr") or []:
+        if "rtf" in row:
+            metrics[f"asr.{row['size']}.{row['compute_type']}.rtf_p50"] = row["rtf"]["p50"]
+    for row in report.get("tts") or []:
+        if "chars_per_s" in row:
+            metrics[f"tts.{row['model']}.chars_per_s_p50"] = row["chars_per_s"]["p50"]
+    e2e = report.get("e2e") or {}
+    if e2e:
+        metrics["e2e.turn_ms_p50"] = e2e["turn_ms"]["p50"]
+        metrics["e2e.turn_ms_p95"] = e2e["turn_ms"]["p95"]
+        for stage, summ in e2e["stages_ms"].items():
+            metrics[f"e2e.{stage}.ms_p50"] = summ["p50"]
+    for name, row in (report.get("micro") or {}).items():
+        if "p50_ms" in row:
+            metrics[f"micro.{name}.p50_ms"] = row["p50_ms"]
+    for row in report.get("load") or []:
+        metrics[f"load.{row['path']}.rps"] = row["rps"]
+        metrics[f"load.{row['path']}.p95_ms"] = row["p95_ms"]
+    return metrics
+
+
+def _report_errors(report: dict) -> list[str]:
+    errors = []
+    for section in ("asr", "tts"):
+        for row in report.get(section) or []:
+            if "error" in row:
+                label = row.get("model") or f"{row.get('size')}.{row.get('compute_type')}"
+                errors.append(f"{section}.{label}: {row['error']}")
+    for name, row in (report.get("micro") or {}).items():
+        if "error" in row:
+            errors.append(f"micro.{name}: {row['error']}")
+    e2e = report.get("e2e") or {}
+    if e2e.get("errors"):
+        errors.append(f"e2e: {e2e['errors']} turnos fallidos ({e2e.get('last_error', '')})")
+    for row in report.get("load") or []:
+        if row.get("errors"):
+            errors.append(f"load.{row['path']}: {row['errors']} peticiones fallidas")
+    return errors
+
+
+def print_report(report: dict, baseline: dict | None = None):
+    metrics = key_metrics(report)
+    base = key_metrics(baseline) if baseline else {}
+    width = max([len("métrica"), *(len(name) for name in metrics)]) + 2
+    print(f"{'métrica':<{width}} {'valor':>10} {'base':>10} {'Δ%':>8}")
+    for name, value in metrics.items():
+        old = base.get(name)
+        delta = f"{(value - old) / old * 100:+.1f}" if old else ""
+        print(f"{name:<{width}} {value:>10} {'' if old is None else old:>10} {delta:>8}")
+    for err in _report_errors(report):
+        print(err)
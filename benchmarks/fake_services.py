@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Servidores HTTP falsos de ComfyUI y Ollama para los benchmarks.
+
+Corren en un hilo dentro del propio proceso, en un puerto libre, con latencia
+configurable por petición. FakeComfyUI genera un /object_info del tamaño que se
+pida (nodos reales que usa la landing + nodos de relleno) para medir cuánto
+cuesta descargarlo y parsearlo.
+
+    with FakeComfyUI(object_info_nodes=3000, latency=0.02) as comfy:
+        print(comfy.url, comfy.port)
+"""
+
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FAKE_REPLY = "Claro. Mañana por la tarde se esperan nubes y algo de viento, sin lluvia."
+
+# Nodos que consulta la landing (opciones de modelos y comprobación de nodos Wan).
+_COMFY_REAL_NODES = {
+    "CheckpointLoaderSimple": {"ckpt_name": ["RealVisXL_V5.0.safetensors", "wai-nsfw-illustrious-sdxl.safetensors"]},
+    "ADE_AnimateDiffLoaderWithContext": {"model_name": ["mm_sdxl_v10_beta.ckpt"]},
+    "WanVideoModelLoader": {"model": ["Wan2_1-T2V-1_3B_bf16.safetensors", "Wan2_1-T2V-14B_fp8_e4m3fn.safetensors"]},
+    "LoadWanVideoT5TextEncoder": {"model_name": ["umt5-xxl-enc-bf16.safetensors"]},
+    "WanVideoVAELoader": {"model_name": ["Wan2_1_VAE_bf16.safetensors"]},
+    "WanVideoTextEncode": {},
+    "WanVideoEmptyEmbeds": {},
+    "WanVideoImageClipEncode": {},
+    "WanVideoSampler": {},
+    "WanVideoDecode": {},
+    "VHS_VideoCombine": {},
+    "LoadImage": {"image": ["input.png"]},
+}
+
+# Tipos de salida reales: la validación local de grafos comprueba los enlaces.
+_COMFY_REAL_OUTPUTS = {
+    "CheckpointLoaderSimple": ["MODEL", "CLIP", "VAE"],
+    "ADE_AnimateDiffLoaderWithContext": ["MODEL"],
+    "WanVideoModelLoader": ["WANVIDEOMODEL"],
+    "LoadWanVideoT5TextEncoder": ["WANTEXTENCODER"],
+    "WanVideoVAELoader": ["WANVAE"],
+    "WanVideoTextEncode": ["WANVIDEOTEXTEMBEDS"],
+    "WanVideoEmptyEmbeds": ["WANVIDIMAGE_EMBEDS"],
+    "WanVideoImageClipEncode": ["WANVIDIMAGE_EMBEDS"],
+    "WanVideoSampler": ["LATENT"],
+    "WanVideoDecode": ["IMAGE"],
+    "VHS_VideoCombine": ["VHS_FILENAMES"],
+    "LoadImage": ["IMAGE", "MASK"],
+}
+
+
+def build_object_info(nodes: int, options_per_input: int = 20) -> dict:
+    info = {}
+    for name, inputs in _COMFY_REAL_NODES.items():
+        info[name] = {
+            "input": {"required": {k: [v] for k, v in inputs.items()}},
+            "output": _COMFY_REAL_OUTPUTS.get(name, ["MODEL"]),
+            "name": name,
+            "category": "loaders",
+        }
+    for i in range(max(0, nodes - len(info))):
+        name = f"FakeNode{i:05d}"
+        info[name] = {
+            "input": {
+                "required": {
+                    "model": [[f"model_{i}_{j}.safetensors" for j in range(options_per_input)]],
+                    "steps": ["INT", {"default": 20, "min": 1, "max": 200}],
+                    "cfg": ["FLOAT", {"default": 7.0, "min": 0.0, "max": 30.0, "step": 0.1}],
+                },
+                "optional": {"note": ["STRING", {"multiline": True}]},
+            },
+            "output": ["LATENT", "IMAGE"],
+            "name": name,
+            "display_name": f"Fake node {i}",
+            "description": "Nodo de relleno para inflar object_info.",
+            "category": f"fake/{i % 37}",
+        }
+    return info
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def _reply(self, status: int, payload):
+        data = payload if isinstance(payload, bytes) else json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _dispatch(self, method: str):
+        service = self.server.service
+        length = int(self.headers.get("Content-Length") or 0)
+        body = {}
+        if length:
+            try:
+                body = json.loads(self.rfile.read(length) or b"{}")
+            except ValueError:
+                body = {}
+        if service.latency:
+            time.sleep(service.latency)
+        with service.lock:
+            service.requests[self.path.split("?")[0]] = service.requests.get(self.path.split("?")[0], 0) + 1
+        status, payload = service.handle(method, self.path.split("?")[0], body)
+        self._reply(status, payload)
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def log_message(self, *args):
+        pass
+
+
+class FakeService:
+    def __init__(self, latency: float = 0.0, host: str = "127.0.0.1", port: int = 0):
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.requests: dict[str, int] = {}
+        self._server = ThreadingHTTPServer((host, port), _Handler)
+        self._server.daemon_threads = True
+        self._server.service = self
+        self._thread = None
+
+    @property
+    def port(self) -> int:
+        return self._server.server_address[1]
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def handle(self, method: str, path: str, body: dict):
+        return 404, {"error": f"{method} {path} no simulado"}
+
+
+class FakeComfyUI(FakeService):
+    def __init__(self, object_info_nodes: int = 2000, options_per_input: int = 20, **kwargs):
+        super().__init__(**kwargs)
+        # Serializado una vez: el coste que se mide es el del cliente (landing).
+        self.object_info = json.dumps(build_object_info(object_info_nodes, options_per_input)).encode("utf-8")
+        self.history: dict[str, dict] = {}
+
+    def handle(self, method: str, path: str, body: dict):
+        if method == "GET" and path == "/object_info":
+            return 200, self.object_info
+        if method == "GET" and path == "/system_stats":
+            return 200, {"system": {"os": "fake"}, "devices": []}
+        if method == "GET" and path == "/queue":
+            return 200, {"queue_running": [], "queue_pending": []}
+        if method == "GET" and path.startswith("/history"):
+            prompt_id = path[len("/history/"):] if path.startswith("/history/") else ""
+            if prompt_id:
+                return 200, {prompt_id: self.history[prompt_id]} if prompt_id in self.history else {}
+            return 200, self.history
+        if method == "POST" and path == "/prompt":
+            prompt_id = uuid.uuid4().hex
+            with self.lock:
+                self.history[prompt_id] = {"prompt": body.get("prompt", {}), "outputs": {}, "status": {"completed": True}}
+            return 200, {"prompt_id": prompt_id, "number": len(self.history), "node_errors": {}}
+        if method == "POST" and path == "/free":
+            return 200, {}
+        return super().handle(method, path, body)
+
+
+class FakeOllama(FakeService):
+    def __init__(self, models: list[str] | None = None, reply: str = FAKE_REPLY, **kwargs):
+        super().__init__(**kwargs)
+        self.models = models or ["llama3.1:latest", "mistral:latest", "qwen2.5:7b"]
+        self.reply = reply
+        self.loaded: set[str] = set()
+
+    def _durations(self) -> dict:
+        # Reparto aproximado de la latencia simulada entre prompt-eval y eval (en ns).
+        return {
+            "load_duration": 0,
+            "prompt_eval_count": 48,
+            "prompt_eval_duration": int(self.latency * 0.2 * 1e9),
+            "eval_count": len(self.reply.split()),
+            "eval_duration": int(self.latency * 0.8 * 1e9),
+        }
+
+    def handle(self, method: str, path: str, body: dict):
+        if method == "GET" and path == "/api/version":
+            return 200, {"version": "0.0.0-fake"}
+        if method == "GET" and path == "/api/tags":
+            return 200, {"models": [{"name": m, "model": m, "size": 4_700_000_000} for m in self.models]}
+        if method == "GET" and path == "/api/ps":
+            return 200, {"models": [{"name": m, "model": m, "size_vram": 4_700_000_000} for m in sorted(self.loaded)]}
+        if method == "POST" and path in ("/api/chat", "/api/generate"):
+            model = body.get("model", "")
+            with self.lock:
+                if body.get("keep_alive") in (0, "0"):
+                    self.loaded.discard(model)
+                else:
+                    self.loaded.add(model)
+            out = {"model": model, "done": True, **self._durations()}
+            if path == "/api/chat":
+                out["message"] = {"role": "assistant", "content": self.reply}
+            else:
+                out["response"] = self.reply if body.get("prompt") else ""
+            return 200, out
+        return super().handle(method, path, body)
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Micro-benchmarks y prueba de carga de la landing contra ComfyUI/Ollama falsos.
+
+Arranca en el propio proceso un FakeComfyUI (object_info del tamaño pedido) y un
+FakeOllama, importa landing_manager con un AI_SUITE_HOME temporal poblado con
+personajes, modelfiles y modelos Piper de prueba, y mide:
+
+  - micro: coste por llamada de las funciones calientes (check_all_status,
+    get_comfy_object_info, check_comfy_nodes, loaders de presets,
+    patch_api_workflow, render de páginas...).
+  - load: peticiones/s y p50/p95 de las rutas Flask servidas por el servidor
+    de producción (PooledWSGIServer) con clientes concurrentes.
+
+Uso:
+    python benchmarks/landing_bench.py --json /tmp/landing.json
+    python benchmarks/landing_bench.py --object-info-nodes 8000 --comfy-latency 0.05
+    python benchmarks/landing_bench.py --skip load --baseline /tmp/landing.json
+"""
+
+import argparse
+import importlib
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from _common import REPO_DIR, git_commit, percentile, print_report
+from fake_services import FakeComfyUI, FakeOllama
+from landing_load import DEFAULT_PATHS, run_load
+
+
+def populate_home(home: Path, characters: int, piper_models: int):
+    chars = home / "manga_chatbot" / "characters"
+    for i in range(characters):
+        d = chars / f"character_{i:03d}"
+        d.mkdir(parents=True, exist_ok=True)
+        (d / "profile.md").write_text(
+            f"# Character AI Prompt: Personaje {i}\n\n" + ("Descripción del personaje. " * 60),
+            encoding="utf-8",
+        )
+        (d / "stable_diffusion_prompt.txt").write_text(
+            "masterpiece, best quality, 1girl, " + ", ".join(f"tag{j}" for j in range(40)),
+            encoding="utf-8",
+        )
+    modelfiles = home / "modelfiles"
+    modelfiles.mkdir(parents=True, exist_ok=True)
+    for name in ("security-auditor", "python-expert", "devops-expert", "voice-assistant"):
+        (modelfiles / name).write_text(
+            f'FROM llama3.1\nPARAMETER temperature 0.7\nSYSTEM """Eres {name}. ' + "Instrucciones. " * 80 + '"""\n',
+            encoding="utf-8",
+        )
+    piper = home / "piper"
+    piper.mkdir(parents=True, exist_ok=True)
+    for i in range(piper_models):
+        (piper / f"es_ES-voice{i}-medium.onnx").write_bytes(b"")
+        (piper / f"es_ES-voice{i}-medium.onnx.json").write_text('{"audio": {"sample_rate": 22050}}')
+
+
+def time_calls(fn, iterations: int, warmup: int = 1) -> dict:
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(iterations):
+        t = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t) * 1000)
+    return {
+        "iterations": iterations,
+        "mean_ms": round(sum(samples) / len(samples), 4),
+        "p50_ms": round(percentile(samples, 50), 4),
+        "p95_ms": round(percentile(samples, 95), 4),
+        "min_ms": round(min(samples), 4),
+    }
+
+
+def micro_benchmarks(lm) -> dict:
+    video = lm.VIDEO_MODEL_PRESETS[0]
+    wan = lm.WAN_MODEL_PRESETS[0]
+    video_wf = lm.build_video_prompt(
+        video["checkpoint"], "mm_sdxl_v10_beta.ckpt", "linear (AnimateDiff-SDXL)",
+        "a cat", "blurry", 1024, 576, 16, 8, 20, 7.0, 1.0, 19, "yuv420p", 1, "bench/video",
+    )
+    wan_wf = lm.build_wan_prompt(
+        wan["model"], wan["text_encoder"], wan["vae"], "a cat", "blurry",
+        832, 480, 33, 16, 20, 6.0, 19, "yuv420p", 1, 5.0, "bench/wan",
+    )
+
+    def _patch(wf):
+        return lambda: lm.patch_api_workflow(
+            wf, "a dog", "ugly", video["checkpoint"], 768, 432, 24, 12, 25, 6.5, 0.9,
+            18, "yuv420p", 42, "bench/out", wan_model=wan["model"],
+        )
+
+    def _nodes_cold():
+        lm.comfy_pool_invalidate()
+        lm.check_comfy_nodes(lm.WAN_REQUIRED_NODES)
+
+    def _object_info_cold():
+        lm.comfy_pool_invalidate()
+        lm.get_comfy_object_info()
+
+    def _render(name, **ctx):
+        def _go():
+            with lm.app.test_request_context("/"):
+                lm.render_page(name, **ctx)
+        return _go
+
+    cases = {
+        "check_all_status": lm.check_all_status,
+        "get_comfy_object_info.cold": _object_info_cold,
+        "get_comfy_object_info.warm": lm.get_comfy_object_info,
+        "check_comfy_nodes.cold": _nodes_cold,
+        "check_comfy_nodes.warm": lambda: lm.check_comfy_nodes(lm.WAN_REQUIRED_NODES),
+        "ollama_list_models": lm.ollama_list_models,
+        "load_ollama_prompt_presets": lm.load_ollama_prompt_presets,
+        "load_character_prompt_presets": lm.load_character_prompt_presets,
+        "load_character_video_prompt_presets": lm.load_character_video_prompt_presets,
+        "load_game_tts_character_presets": lm.load_game_tts_character_presets,
+        "list_piper_models": lm.list_piper_models,
+        "patch_api_workflow.video": _patch(video_wf),
+        "patch_api_workflow.wan": _patch(wan_wf),
+        "validate_comfy_prompt.wan": lambda: lm.validate_comfy_prompt(wan_wf, lm.get_comfy_object_info()),
+        "render_page.index": _render("index", comfy_port=lm.COMFY_PORT, ollama_port=lm.OLLAMA_PORT),
+    }
+    return cases
+
+
+def run_micro(lm, iterations: int, only: set[str]) -> dict:
+    results = {}
+    for name, fn in micro_benchmarks(lm).items():
+        if only and name not in only:
+            continue
+        try:
+            results[name] = time_calls(fn, iterations)
+        except Exception as exc:
+            results[name] = {"error": f"{type(exc).__name__}: {exc}"}
+    return results
+
+
+def run_load_test(lm, paths: list[str], concurrency: int, duration: float, threads: int) -> list[dict]:
+    server = lm.PooledWSGIServer("127.0.0.1", 0, lm.app, threads)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        return run_load(f"http://127.0.0.1:{server.server_port}", paths, concurrency, duration)
+    finally:
+        server.shutdown()
+        server.pool.shutdown(wait=False)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--object-info-nodes", type=int, default=2000)
+    ap.add_argument("--options-per-input", type=int, default=20)
+    ap.add_argument("--comfy-latency", type=float, default=0.0, help="segundos por petición a ComfyUI")
+    ap.add_argument("--ollama-latency", type=float, default=0.0, help="segundos por petición a Ollama")
+    ap.add_argument("--characters", type=int, default=30)
+    ap.add_argument("--piper-models", type=int, default=6)
+    ap.add_argument("-n", "--iterations", type=int, default=50, help="llamadas por micro-benchmark")
+    ap.add_argument("--only", default="", help="micro-benchmarks a ejecutar (separados por comas)")
+    ap.add_argument("--paths", default=",".join(DEFAULT_PATHS), help="rutas de la prueba de carga")
+    ap.add_argument("-c", "--concurrency", type=int, default=8)
+    ap.add_argument("-d", "--duration", type=float, default=5.0, help="segundos por ruta")
+    ap.add_argument("--threads", type=int, default=16, help="hilos del servidor de la landing")
+    ap.add_argument("--skip", default="", help="micro,load a omitir")
+    ap.add_argument("--json", default="", help="guarda el informe en este fichero")
+    ap.add_argument("--baseline", default="", help="informe JSON anterior con el que comparar")
+    args = ap.parse_args()
+    skip = {s.strip() for s in args.skip.split(",") if s.strip()}
+
+    home = Path(tempfile.mkdtemp(prefix="landing_bench_"))
+    populate_home(home, args.characters, args.piper_models)
+    comfy = FakeComfyUI(
+        object_info_nodes=args.object_info_nodes,
+        options_per_input=args.options_per_input,
+        latency=args.comfy_latency,
+    ).start()
+    ollama = FakeOllama(latency=args.ollama_latency).start()
+
+    # landing_manager resuelve rutas al importarse y usa los puertos como globales.
+    os.environ["AI_SUITE_HOME"] = str(home)
+    sys.path.insert(0, str(REPO_DIR))
+    lm = importlib.import_module("landing_manager")
+    logging.getLogger().setLevel(logging.WARNING)
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    lm.COMFY_PORT = comfy.port
+    lm.OLLAMA_PORT = ollama.port
+    for svc in lm.SERVICES:
+        if svc["key"] == "comfy":
+            svc["port"] = comfy.port
+        elif svc["key"] == "ollama":
+            svc["port"] = ollama.port
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": git_commit(),
+        "host": {"platform": platform.platform(), "python": platform.python_version(), "cpus": os.cpu_count()},
+        "config": {
+            "object_info_nodes": args.object_info_nodes,
+            "object_info_bytes": len(comfy.object_info),
+            "comfy_latency_s": args.comfy_latency,
+            "ollama_latency_s": args.ollama_latency,
+            "characters": args.characters,
+            "piper_models": args.piper_models,
+        },
+    }
+    if "micro" not in skip:
+        only = {s.strip() for s in args.only.split(",") if s.strip()}
+        report["micro"] = run_micro(lm, args.iterations, only)
+    if "load" not in skip:
+        paths = [p.strip() for p in args.paths.split(",") if p.strip()]
+        report["load"] = run_load_test(lm, paths, args.concurrency, args.duration, args.threads)
+    report["fake_requests"] = {"comfy": comfy.requests, "ollama": ollama.requests}
+    comfy.stop()
+    ollama.stop()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as fh:
+            baseline = json.load(fh)
+    print_report(report, baseline)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as fh:
+            json.dump(report, fh, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Prueba de carga de la landing: lanza peticiones GET concurrentes contra una
+landing en marcha y reporta peticiones/s y latencias p50/p95 por ruta.
+
+Uso:
+    python benchmarks/landing_load.py --url http://127.0.0.1:5000 -c 16 -d 10
+    python benchmarks/landing_load.py --paths /api/status --json /tmp/load.json
+    python benchmarks/landing_load.py --baseline /tmp/load.json
+"""
+
+import argparse
+import json
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib import request as urlrequest, error as urlerror
+
+from _common import git_commit, percentile, print_report
+
+DEFAULT_PATHS = [
+    "/api/status",
+    "/",
+    "/tools/video-scene",
+    "/tools/wan-video",
+    "/tools/wan-i2v",
+    "/tools/game-tts",
+    "/tools/ollama-models",
+]
+
+
+def _fetch(url: str, timeout: float) -> tuple[bool, float]:
+    t0 = time.perf_counter()
+    try:
+        with urlrequest.urlopen(url, timeout=timeout) as resp:
+            resp.read()
+            ok = 200 <= resp.status < 400
+    except (urlerror.URLError, OSError):
+        ok = False
+    return ok, time.perf_counter() - t0
+
+
+def load_path(base_url: str, path: str, concurrency: int, duration: float, timeout: float = 30.0) -> dict:
+    url = base_url.rstrip("/") + path
+    deadline = time.perf_counter() + duration
+
+    def _worker(_):
+        lat, errors = [], 0
+        while time.perf_counter() < deadline:
+            ok, elapsed = _fetch(url, timeout)
+            lat.append(elapsed)
+            if not ok:
+                errors += 1
+        return lat, errors
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as ex:
+        results = list(ex.map(_worker, range(concurrency)))
+    wall = time.perf_counter() - t0
+
+    latencies = [x for lat, _ in results for x in lat]
+    errors = sum(e for _, e in results)
+    return {
+        "path": path,
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / wall, 2) if wall else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 2) if latencies else 0.0,
+    }
+
+
+def run_load(base_url: str, paths: list[str], concurrency: int, duration: float) -> list[dict]:
+    return [load_path(base_url, p, concurrency, duration) for p in paths]
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--url", default="http://127.0.0.1:5000")
+    ap.add_argument("--paths", default=",".join(DEFAULT_PATHS), help="rutas separadas por comas")
+    ap.add_argument("-c", "--concurrency", type=int, default=16)
+    ap.add_argument("-d", "--duration", type=float, default=10.0, help="segundos por ruta")
+    ap.add_argument("--json", default="", help="guarda el informe en este fichero")
+    ap.add_argument("--baseline", default="", help="informe JSON anterior con el que comparar")
+    args = ap.parse_args()
+
+    paths = [p.strip() for p in args.paths.split(",") if p.strip()]
+    report = {
+        "url": args.url,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": git_commit(),
+        "load": run_load(args.url, paths, args.concurrency, args.duration),
+    }
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as fh:
+            baseline = json.load(fh)
+    print_report(report, baseline)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as fh:
+            json.dump(report, fh, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark del bucle de voz STT → LLM → TTS, sin UI y reproducible.
+
+Mide:
+  - ASR: factor de tiempo real (RTF) de Whisper por tamaño y compute_type.
+  - TTS: caracteres/s y RTF de Piper por modelo.
+  - Extremo a extremo: latencia por turno de voice_assistant_ui.pipeline (la
+    función que llama la UI) contra el FakeOllama de fake_services (o un Ollama
+    real con --ollama-url), con el desglose por etapa de sus trazas.
+
+Los audios de prueba se generan con Piper si está disponible (voz real) o se
+sintetizan (ráfagas moduladas con silencios). También vale una carpeta de WAV.
+
+Uso:
+    python benchmarks/voice_pipeline.py --json /tmp/voice.json
+    python benchmarks/voice_pipeline.py --whisper-sizes tiny,base,small --compute-types int8,float32
+    python benchmarks/voice_pipeline.py --fixtures ~/ai/voice_out --turns 10 --baseline /tmp/voice.json
+"""
+
+import argparse
+import importlib
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import wave
+from pathlib import Path
+
+from _common import REPO_DIR, git_commit, percentile, print_report
+from fake_services import FakeOllama
+
+FIXTURE_TEXTS = [
+    "Hola, ¿qué tiempo va a hacer mañana por la tarde?",
+    "Resume en dos frases la historia de la península ibérica.",
+    "Necesito una receta rápida con arroz, tomate y un par de huevos.",
+]
+TTS_TEXTS = [
+    "Buenos días. El sistema está listo.",
+    "La escena se ha renderizado correctamente y el vídeo ya está disponible en la carpeta de salida.",
+    (
+        "Para continuar, revisa la configuración del modelo, comprueba que la GPU tiene memoria libre "
+        "y vuelve a lanzar el trabajo desde la landing. Si el problema persiste, consulta los registros."
+    ),
+]
+
+
+def _summary(values: list[float], digits: int = 3) -> dict:
+    return {
+        "n": len(values),
+        "mean": round(statistics.fmean(values), digits) if values else 0.0,
+        "p50": round(percentile(values, 50), digits),
+        "p95": round(percentile(values, 95), digits),
+    }
+
+
+# --- Fixtures -----------------------------------------------------------------
+def _write_wav(path: Path, rate: int, samples, channels: int = 1):
+    import numpy as np
+
+    pcm = np.clip(samples, -1.0, 1.0)
+    if channels > 1:
+        pcm = np.repeat(pcm[:, None], channels, axis=1)
+    with wave.open(str(path), "wb") as wf:
+        wf.setnchannels(channels)
+        wf.setsampwidth(2)
+        wf.setframerate(rate)
+        wf.writeframes((pcm * 32767).astype(np.int16).tobytes())
+
+
+def _synthetic_speechlike(rate: int, seconds: float, seed: int):
+    # Ráfagas de ruido filtrado con envolvente silábica (~4 Hz) y silencio en los extremos.
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    n = int(rate * seconds)
+    t = np.arange(n) / rate
+    carrier = np.convolve(rng.standard_normal(n), np.ones(8) / 8, mode="same")
+    envelope = np.clip(np.sin(2 * np.pi * 4.0 * t), 0, None) ** 2
+    voiced = carrier * envelope * 0.6
+    pad = np.zeros(int(rate * 0.5))
+    return np.concatenate([pad, voiced, pad])
+
+
+def build_fixtures(out_dir: Path, piper_bin: str, piper_model: str) -> list[Path]:
+    out_dir.mkdir(parents=True, exist_ok=True)
+    fixtures = []
+    for i, text in enumerate(FIXTURE_TEXTS):
+        path = out_dir / f"fixture_{i}.wav"
+        if Path(piper_model).exists():
+            proc = subprocess.run(
+                [piper_bin, "--model", piper_model, "--output_file", str(path)],
+                input=text.encode("utf-8"),
+                capture_output=True,
+            )
+            if proc.returncode == 0 and path.exists():
+                fixtures.append(path)
+                continue
+        # Sin Piper: audio sintético a 48 kHz estéreo (como un micro de navegador),
+        # así el preprocesado tiene que remuestrear y mezclar a mono.
+        _write_wav(path, 48000, _synthetic_speechlike(48000, 2.0 + i, seed=i), channels=2)
+        fixtures.append(path)
+    return fixtures
+
+
+def load_fixtures(folder: Path) -> list[Path]:
+    return sorted(p for p in folder.glob("*.wav") if p.is_file())
+
+
+# --- Benchmarks ---------------------------------------------------------------
+def bench_asr(fixtures: list[Path], sizes: list[str], compute_types: list[str], device: str) -> list[dict]:
+    fw = importlib.import_module("faster_whisper")
+    audios = [fw.decode_audio(str(p), sampling_rate=16000) for p in fixtures]
+    rows = []
+    for size in sizes:
+        for compute_type in compute_types:
+            t0 = time.perf_counter()
+            try:
+                model = fw.WhisperModel(size, device=device, compute_type=compute_type)
+            except Exception as exc:
+                rows.append({"size": size, "compute_type": compute_type, "error": str(exc)})
+                continue
+            load_s = time.perf_counter() - t0
+            rtfs = []
+            for audio in audios:
+                t = time.perf_counter()
+                segments, info = model.transcribe(audio)
+                "".join(s.text for s in segments)
+                rtfs.append((time.perf_counter() - t) / max(info.duration, 1e-6))
+            rows.append({
+                "size": size,
+                "compute_type": compute_type,
+                "device": device,
+                "load_s": round(load_s, 2),
+                "rtf": _summary(rtfs),
+            })
+            del model
+    return rows
+
+
+def bench_tts(va, piper_models: list[str], repeats: int) -> list[dict]:
+    rows = []
+    for model_path in piper_models:
+        if not Path(model_path).exists():
+            rows.append({"model": model_path, "error": "modelo no encontrado"})
+            continue
+        config_path = f"{model_path}.json"
+        cps, rtfs, spawn = [], [], []
+        try:
+            for _ in range(repeats):
+                for text in TTS_TEXTS:
+                    stats = {}
+                    t = time.perf_counter()
+                    sr, samples = va.tts_piper_pcm(text, model_path=model_path, config_path=config_path, stats=stats)
+                    wall = time.perf_counter() - t
+                    cps.append(len(text) / wall)
+                    rtfs.append(wall / max(len(samples) / sr, 1e-6))
+                    spawn.append(stats.get("spawn_ms", 0.0))
+        except Exception as exc:
+            rows.append({"model": Path(model_path).name, "error": str(exc)})
+            continue
+        rows.append({
+            "model": Path(model_path).name,
+            "chars_per_s": _summary(cps, 1),
+            "rtf": _summary(rtfs),
+            "spawn_ms": _summary(spawn, 1),
+        })
+    return rows
+
+
+def bench_e2e(va, fixtures: list[Path], turns: int, asr_model: str, device: str, trace_log: Path) -> dict:
+    start = trace_log.stat().st_size if trace_log.exists() else 0
+    totals = []
+    errors, last_error = 0, ""
+    for i in range(turns):
+        fixture = fixtures[i % len(fixtures)]
+        t = time.perf_counter()
+        reply_audio, _user_text, assistant, _table = va.pipeline(
+            str(fixture), asr_model, device, "transcribe", "es", va.DEFAULT_MODEL, 0.7, 1.0, keep_reply=False
+        )
+        totals.append((time.perf_counter() - t) * 1000)
+        # Un turno fallido devuelve gr.update() en vez de (sr, muestras) y el error como texto.
+        if not isinstance(reply_audio, tuple):
+            errors += 1
+            last_error = assistant
+
+    stages: dict[str, list[float]] = {}
+    if trace_log.exists():
+        with open(trace_log, "r", encoding="utf-8") as fh:
+            fh.seek(start)
+            for line in fh:
+                for span in json.loads(line).get("spans", []):
+                    stages.setdefault(span["stage"], []).append(span["ms"])
+    return {
+        "turns": turns,
+        "errors": errors,
+        "last_error": last_error,
+        "asr_model": asr_model,
+        "turn_ms": _summary(totals, 1),
+        "stages_ms": {k: _summary(v, 1) for k, v in stages.items()},
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--fixtures", default="", help="carpeta con WAV propios (por defecto se generan)")
+    ap.add_argument("--whisper-sizes", default="tiny,base")
+    ap.add_argument("--compute-types", default="int8,float32")
+    ap.add_argument("--device", default="cpu")
+    ap.add_argument("--piper-models", default="", help="rutas .onnx separadas por comas (por defecto, el de la UI)")
+    ap.add_argument("--tts-repeats", type=int, default=2)
+    ap.add_argument("--turns", type=int, default=6, help="turnos extremo a extremo")
+    ap.add_argument("--asr-model", default="tiny", help="modelo Whisper para los turnos extremo a extremo")
+    ap.add_argument("--ollama-url", default="", help="Ollama real; vacío = servidor simulado")
+    ap.add_argument("--llm-delay", type=float, default=0.3, help="segundos por respuesta del Ollama simulado")
+    ap.add_argument("--skip", default="", help="asr,tts,e2e a omitir")
+    ap.add_argument("--json", default="", help="guarda el informe en este fichero")
+    ap.add_argument("--baseline", default="", help="informe JSON anterior con el que comparar")
+    args = ap.parse_args()
+    skip = {s.strip() for s in args.skip.split(",") if s.strip()}
+
+    workdir = Path(tempfile.mkdtemp(prefix="voice_bench_"))
+    trace_log = workdir / "traces.jsonl"
+    fake = None
+    ollama_url = args.ollama_url
+    if not ollama_url:
+        fake = FakeOllama(latency=args.llm_delay).start()
+        ollama_url = fake.url
+    # voice_assistant_ui y voice_common leen esto al importarse
+    os.environ["OLLAMA_URL"] = ollama_url
+    os.environ["VOICE_TRACE_LOG"] = str(trace_log)
+    sys.path.insert(0, str(REPO_DIR))
+    va = importlib.import_module("voice_assistant_ui")
+
+    if args.fixtures:
+        fixtures = load_fixtures(Path(args.fixtures).expanduser())
+    else:
+        fixtures = build_fixtures(workdir / "fixtures", "piper", va.PIPER_MODEL)
+    if not fixtures:
+        sys.exit("No hay audios de prueba.")
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": git_commit(),
+        "host": {"platform": platform.platform(), "python": platform.python_version(), "cpus": os.cpu_count()},
+        "ollama": args.ollama_url or f"simulado ({args.llm_delay}s)",
+        "fixtures": [p.name for p in fixtures],
+    }
+    if "asr" not in skip:
+        sizes = [s.strip() for s in args.whisper_sizes.split(",") if s.strip()]
+        ctypes = [c.strip() for c in args.compute_types.split(",") if c.strip()]
+        report["asr"] = bench_asr(fixtures, sizes, ctypes, args.device)
+    if "tts" not in skip:
+        models = [m.strip() for m in args.piper_models.split(",") if m.strip()] or [va.PIPER_MODEL]
+        report["tts"] = bench_tts(va, models, args.tts_repeats)
+    if "e2e" not in skip:
+        report["e2e"] = bench_e2e(va, fixtures, args.turns, args.asr_model, args.device, trace_log)
+    if fake is not None:
+        fake.stop()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as fh:
+            baseline = json.load(fh)
+    print_report(report, baseline)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as fh:
+            json.dump(report, fh, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -17,23 +17,35 @@ Puertos por defecto:
 - Voice UI:     7862  (tu script voice_assistant_ui.py)
 """
 
+import cProfile
+import hashlib
+import heapq
 import json
 import inspect
 import importlib
+import io
 import logging
 import os
+import pstats
 import sys
 import random
 import re
+import shutil
+import signal
 import socket
+import sqlite3
 import subprocess
+import tarfile
 import time
 import threading
 from typing import Any
+from contextlib import closing
 from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from urllib import request as urlrequest, error as urlerror
-from flask import Flask, render_template_string, request, jsonify, send_from_directory
+from urllib.parse import urlencode, urlparse
+from flask import Flask, abort, g, request, jsonify, send_file
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
 
 logging.basicConfig(
     level=logging.INFO,
@@ -106,6 +118,17 @@ MANGA_CHATBOT_CMD = (
 
 LANDING_HOST = os.environ.get("LANDING_HOST", "127.0.0.1")
 LANDING_DEBUG = os.environ.get("LANDING_DEBUG", "0") == "1"
+LANDING_PORT = int(os.environ.get("LANDING_PORT", "5000"))
+# dev = servidor de desarrollo de Flask | threaded = pool acotado | waitress (si está instalado)
+LANDING_SERVER = os.environ.get("LANDING_SERVER", "threaded").strip().lower()
+LANDING_THREADS = int(os.environ.get("LANDING_THREADS", "16"))
+# Peticiones aceptadas esperando hilo libre (servidor threaded); por encima se responde 503.
+LANDING_MAX_PENDING = int(os.environ.get("LANDING_MAX_PENDING", "64"))
+LANDING_REQUEST_TIMEOUT_S = float(os.environ.get("LANDING_REQUEST_TIMEOUT_S", "120"))
+LANDING_SHUTDOWN_TIMEOUT_S = float(os.environ.get("LANDING_SHUTDOWN_TIMEOUT_S", "300"))
+# Perfilado bajo demanda (?_profile=1 / cabecera X-Profile y /admin/profiles); apagado por defecto.
+LANDING_PROFILING = os.environ.get("LANDING_PROFILING", "0") == "1"
+LANDING_PROFILE_KEEP = int(os.environ.get("LANDING_PROFILE_KEEP", "100"))
 
 WAN_WRAPPER_DIR = COMFY_DIR / "custom_nodes" / "ComfyUI-WanVideoWrapper"
 OLLAMA_MODELFILES_DIR = AI_DIR / "modelfiles"
@@ -116,6 +139,19 @@ PIPER_CONFIG_PATH = os.environ.get("PIPER_CONFIG", f"{PIPER_MODEL_PATH}.json")
 PIPER_BIN = os.environ.get("PIPER_BIN", str(AI_DIR / "venv" / "bin" / "piper"))
 XTTS_MODEL_NAME = os.environ.get("XTTS_MODEL", "tts_models/multilingual/multi-dataset/xtts_v2")
 XTTS_PYTHON = os.environ.get("XTTS_PYTHON", str(AI_DIR / "venv_xtts311" / "bin" / "python"))
+FFMPEG_BIN = os.environ.get("FFMPEG_BIN", "ffmpeg")
+AUDIO_OPUS_BITRATE = os.environ.get("LANDING_OPUS_BITRATE", "48k")
+AUDIO_CACHE_DIR = VOICE_OUT_DIR / ".opus_cache"
+
+# Modelos Ollama que se mantienen residentes (por defecto, el del asistente de voz).
+OLLAMA_PINNED_MODELS = [
+    m.strip()
+    for m in os.environ.get(
+        "LANDING_PINNED_MODELS", os.environ.get("OLLAMA_MODEL", "llama3.1")
+    ).split(",")
+    if m.strip()
+]
+OLLAMA_PIN_KEEP_ALIVE = os.environ.get("OLLAMA_PIN_KEEP_ALIVE", "-1")
 
 GAME_TTS_PERSONALITY_PRESETS = [
     {
@@ -229,6 +265,9 @@ VIDEO_SMOOTH_PROFILES = [
         "denoise": 0.7,
         "crf": 18,
         "pix_fmt": "yuv420p",
+        "interpolate": 1,
+        "upscale": 1.0,
+        "upscaler": "lanczos",
     },
     {
         "id": "fluid_dynamic",
@@ -243,6 +282,43 @@ VIDEO_SMOOTH_PROFILES = [
         "denoise": 0.7,
         "crf": 18,
         "pix_fmt": "yuv420p",
+        "interpolate": 1,
+        "upscale": 1.0,
+        "upscaler": "lanczos",
+    },
+    {
+        "id": "smooth_24fps",
+        "name": "Suave 24 fps",
+        "desc": "640x960, 20 frames a 6 fps + interpolación x4",
+        "width": 640,
+        "height": 960,
+        "frames": 20,
+        "fps": 6,
+        "steps": 20,
+        "cfg": 7.0,
+        "denoise": 0.7,
+        "crf": 18,
+        "pix_fmt": "yuv420p",
+        "interpolate": 4,
+        "upscale": 1.0,
+        "upscaler": "lanczos",
+    },
+    {
+        "id": "latent_detail",
+        "name": "Detalle Latente",
+        "desc": "512x768 + escalado latente x1.5, 16 frames, 8 fps",
+        "width": 512,
+        "height": 768,
+        "frames": 16,
+        "fps": 8,
+        "steps": 20,
+        "cfg": 7.0,
+        "denoise": 0.7,
+        "crf": 18,
+        "pix_fmt": "yuv420p",
+        "interpolate": 1,
+        "upscale": 1.5,
+        "upscaler": "latent",
     },
 ]
 
@@ -278,6 +354,9 @@ WAN_VIDEO_PROFILES = [
         "shift": 5.0,
         "crf": 18,
         "pix_fmt": "yuv420p",
+        "interpolate": 1,
+        "upscale": 1.0,
+        "upscaler": "lanczos",
     },
     {
         "id": "portrait_quality",
@@ -292,6 +371,9 @@ WAN_VIDEO_PROFILES = [
         "shift": 5.0,
         "crf": 18,
         "pix_fmt": "yuv420p",
+        "interpolate": 1,
+        "upscale": 1.0,
+        "upscaler": "lanczos",
     },
     {
         "id": "landscape_quality",
@@ -306,54 +388,59 @@ WAN_VIDEO_PROFILES = [
         "shift": 5.0,
         "crf": 18,
         "pix_fmt": "yuv420p",
+        "interpolate": 1,
+        "upscale": 1.0,
+        "upscaler": "lanczos",
+    },
+    {
+        "id": "portrait_smooth",
+        "name": "Portrait Smooth 24 fps (480x832)",
+        "desc": "33 frames a 12 fps + interpolación x2",
+        "width": 480,
+        "height": 832,
+        "frames": 33,
+        "fps": 12,
+        "steps": 20,
+        "cfg": 6.0,
+        "shift": 5.0,
+        "crf": 18,
+        "pix_fmt": "yuv420p",
+        "interpolate": 2,
+        "upscale": 1.0,
+        "upscaler": "lanczos",
+    },
+    {
+        "id": "portrait_hd",
+        "name": "Portrait HD (720x1248)",
+        "desc": "480x832 + upscaler ESRGAN x1.5",
+        "width": 480,
+        "height": 832,
+        "frames": 24,
+        "fps": 8,
+        "steps": 30,
+        "cfg": 6.0,
+        "shift": 5.0,
+        "crf": 18,
+        "pix_fmt": "yuv420p",
+        "interpolate": 1,
+        "upscale": 1.5,
+        "upscaler": "model",
     },
 ]
 
+# Serializados una sola vez: son estáticos y se incrustan en cada página.
+VIDEO_SMOOTH_PROFILES_JSON = json.dumps(VIDEO_SMOOTH_PROFILES)
+WAN_VIDEO_PROFILES_JSON = json.dumps(WAN_VIDEO_PROFILES)
+GAME_TTS_PERSONALITY_PRESETS_JSON = json.dumps(GAME_TTS_PERSONALITY_PRESETS, ensure_ascii=False)
+
 # --- HTML PRINCIPAL -----------------------------------------------------------
 HTML = """
 <!doctype html>
 <html lang="es"><head>
 <meta charset="utf-8"><title>Centro de IA Local — Gestor</title>
 <meta name="viewport" content="width=device-width, initial-scale=1">
-<style>
-:root{color-scheme:dark;--bg:#06070d;--panel:#0d1220;--panel2:#090d18;--line:#3efc9a;--line2:#38a8ff;--text:#d5ffe6;--warn:#ff4f81}
-body{font-family:"VT323","Press Start 2P","Lucida Console",monospace;background:radial-gradient(1200px 700px at 20% -10%,#152241 0%,#06070d 55%),radial-gradient(1000px 600px at 120% 120%,#101b32 0%,#06070d 60%);color:var(--text);margin:0;letter-spacing:.02em;position:relative}
-body:before{content:"";position:fixed;inset:0;background:repeating-linear-gradient(to bottom,rgba(255,255,255,.03) 0 1px,transparent 1px 4px);pointer-events:none;mix-blend-mode:soft-light}
-.wrap{max-width:1100px;margin:44px auto;padding:0 18px}
-h1{font-size:30px;margin:0 0 12px;text-shadow:0 0 8px rgba(62,252,154,.45)}
-.sub{opacity:.9;margin-bottom:26px;color:#b5d8ff}
-.grid{display:grid;gap:14px;grid-template-columns:repeat(auto-fit,minmax(280px,1fr))}
-.card,.tool-card{background:linear-gradient(160deg,var(--panel) 0%,var(--panel2) 100%);border:2px solid #1f7eaf;border-radius:6px;padding:14px;box-shadow:0 0 0 1px rgba(62,252,154,.18) inset,0 0 18px rgba(56,168,255,.12)}
-.head{display:flex;align-items:center;justify-content:space-between;margin-bottom:8px}
-.name{font-weight:700;color:#bfffe0;text-transform:uppercase}
-.url{font-size:13px;opacity:.92;color:#8bc7ff}
-.status{font-size:12px;padding:4px 8px;border-radius:4px;border:1px solid}
-.up{background:rgba(62,252,154,.14);color:#96ffcb;border-color:#3efc9a}
-.down{background:rgba(255,79,129,.14);color:#ff9fbe;border-color:#ff4f81}
-.btns{display:flex;gap:8px;flex-wrap:wrap;margin-top:10px}
-a.btn{text-decoration:none;padding:10px 12px;border-radius:4px;background:linear-gradient(180deg,#10233d 0%,#0d1a2d 100%);border:1px solid #2b9cff;color:#d8eeff;font-size:14px;cursor:pointer;box-shadow:0 0 0 1px rgba(62,252,154,.14) inset}
-a.btn:hover{background:linear-gradient(180deg,#15345f 0%,#10233d 100%);transform:translateY(-1px)}
-.help{margin-top:24px;font-size:14px;opacity:.95}
-code{background:#0f1c2f;padding:2px 6px;border-radius:4px;border:1px solid #2d7bc2;color:#b8f6d9}
-pre{background:#050a14;border:1px solid #246eab;border-radius:6px;padding:14px;overflow:auto;color:#bdf2ff}
-</style>
-<script>
-async function doAction(svc,action){
-  try{await fetch(`/svc/${svc}/${action}`,{method:"POST"})}catch(e){alert("Error: "+e)}
-}
-async function pollStatus(){
-  try{
-    const r=await fetch("/api/status");if(!r.ok)return;
-    const data=await r.json();
-    for(const[key,up]of Object.entries(data)){
-      document.querySelectorAll(`[data-svc="${key}"]`).forEach(el=>{
-        el.textContent=up?"UP":"DOWN";el.className="status "+(up?"up":"down");
-      });
-    }
-  }catch(e){}
-}
-setInterval(pollStatus,5000);
-</script>
+<link rel="stylesheet" href="/static/css/landing.css?v={{ asset_version }}">
+<script src="/static/js/landing.js?v={{ asset_version }}"></script>
 </head><body>
 <div class="wrap">
 <h1>🤖 Centro de IA Local — Gestor</h1>
@@ -465,23 +552,7 @@ VIDEO_TOOL_HTML = """
 <!doctype html><html lang="es"><head>
 <meta charset="utf-8"><title>AnimateDiff SDXL — Generar Vídeo</title>
 <meta name="viewport" content="width=device-width, initial-scale=1">
-<style>
-:root{color-scheme:dark}
-body{font-family:"VT323","Press Start 2P","Lucida Console",monospace;background:radial-gradient(900px 500px at 10% -10%,#1a2748 0%,#06070d 60%);color:#d5ffe6;margin:0}
-.wrap{max-width:800px;margin:36px auto;padding:0 18px}
-h1{font-size:28px;margin:0 0 8px;text-shadow:0 0 8px rgba(62,252,154,.35)}
-.back{font-size:14px;opacity:.9;margin-bottom:18px}.back a{color:#78c7ff;text-decoration:none}
-label{display:block;font-size:13px;opacity:.95;margin:10px 0 3px;color:#9fd0ff}
-input,textarea,select{width:100%;box-sizing:border-box;background:#081122;border:1px solid #2a8fd6;border-radius:4px;color:#d5ffe6;padding:9px 10px;font-size:16px;box-shadow:0 0 0 1px rgba(62,252,154,.12) inset}
-input:focus,textarea:focus,select:focus{outline:none;border-color:#3efc9a;box-shadow:0 0 0 1px rgba(62,252,154,.4),0 0 12px rgba(62,252,154,.2)}
-textarea{height:96px;resize:vertical}.row{display:flex;gap:10px}.row>div{flex:1}
-button,a.btn{margin-top:8px;background:linear-gradient(180deg,#15345f 0%,#10233d 100%);border:1px solid #2ea8ff;color:#e5f4ff;padding:10px 18px;border-radius:4px;font-size:15px;cursor:pointer;text-decoration:none;display:inline-block}
-button:hover,a.btn:hover{background:linear-gradient(180deg,#1d4b88 0%,#15345f 100%)}
-.result{margin-top:16px;background:#091227;border:1px solid #2b87cf;border-radius:4px;padding:12px;font-size:15px;white-space:pre-wrap}
-.ok{color:#8effb8}.err{color:#ff9bbb}
-.section{background:linear-gradient(160deg,#0b1326 0%,#09101f 100%);border:2px solid #1f79b5;border-radius:6px;padding:12px;margin-bottom:12px}
-.section-title{font-size:13px;font-weight:700;opacity:.95;text-transform:uppercase;letter-spacing:.08em;color:#8ec9ff}
-</style></head><body><div class="wrap">
+<link rel="stylesheet" href="/static/css/video_tool.css?v={{ asset_version }}"></head><body><div class="wrap">
 <h1>🎬 AnimateDiff SDXL — Generar Vídeo</h1>
 <div class="back"><a href="/">← Volver al gestor</a></div>
 <form id="vf" method="post" onsubmit="return handleVideoSubmit(event)">
@@ -523,86 +594,42 @@ button:hover,a.btn:hover{background:linear-gradient(180deg,#1d4b88 0%,#15345f 10
         <option value="yuv420p10le" {% if form.pix_fmt=='yuv420p10le' %}selected{% endif %}>yuv420p10le</option>
       </select></div>
     </div>
+    <div class="row">
+      <div><label>Interpolación</label><select name="interpolate">
+        {% for n in (1, 2, 4) %}<option value="{{ n }}" {% if form.interpolate|int==n %}selected{% endif %}>{{ 'Ninguna' if n==1 else 'x%d (RIFE)'|format(n) }}</option>{% endfor %}
+      </select></div>
+      <div><label>Escalado</label><input name="upscale" type="number" min="1" max="4" step="0.5" value="{{ form.upscale }}"></div>
+      <div><label>Upscaler</label><select name="upscaler">
+        <option value="lanczos" {% if form.upscaler=='lanczos' %}selected{% endif %}>Lanczos</option>
+        <option value="model" {% if form.upscaler=='model' %}selected{% endif %}>Modelo (ESRGAN)</option>
+        <option value="latent" {% if form.upscaler=='latent' %}selected{% endif %}>Latente (2ª pasada)</option>
+      </select></div>
+    </div>
   </div>
     <div style="margin-top:18px;display:flex;gap:10px;flex-wrap:wrap">
         <button type="submit">🎬 Generar vídeo</button>
         <a class="btn" href="http://localhost:8188" target="_blank" rel="noopener noreferrer">📋 Abrir ComfyUI (cola)</a>
+        <label class="chk"><input type="checkbox" name="draft" value="1"> Borrador rápido</label>
+        <label class="chk"><input type="checkbox" name="force" value="1"> Re-render (ignorar caché)</label>
+        <label class="chk"><input type="checkbox" name="post_web" value="1"> MP4 web</label>
+        <input name="post_audio" class="post-audio" placeholder="WAV de voice_out a mezclar (opcional)">
     </div>
 </form>
 {% if server_result %}
-<div id="result" class="result {{ 'ok' if server_result_ok else 'err' }}">{{ server_result }}</div>
+<div id="result" class="result {{ 'ok' if server_result_ok else 'err' }}"{% if server_job_id %} data-job-id="{{ server_job_id }}"{% endif %}>{{ server_result }}</div>
 {% else %}
 <div id="result" class="result" style="display:none"></div>
 {% endif %}
+<div id="promote" class="promote" style="display:none">
+    <button type="button" onclick="promoteDraft('full')">⬆️ Promocionar a final (perfil completo)</button>
+    <button type="button" class="sec" onclick="promoteDraft('finish')">✨ Final rápido (borrador + interpolación x2 + escalado x2)</button>
+</div>
 </div>
 <script>
 const profiles={{smooth_profiles_json|safe}};
-function applyProfile(sel){
-  const p=profiles.find(x=>x.id===sel.value);if(!p)return;
-  const f=document.getElementById('vf');
-  ['width','height','frames','fps','steps','cfg','denoise','crf'].forEach(k=>{if(f[k]&&p[k]!==undefined)f[k].value=p[k];});
-}
-async function applyCharacterPrompt(sel, formId){
-    const id=sel.value;
-    const f=document.getElementById(formId);if(!f)return;
-    const pos=f.querySelector('[name="positive_prompt"]');
-    const neg=f.querySelector('[name="negative_prompt"]');
-        const r=document.getElementById('result');
-    if(!id){
-        if(pos) pos.value='';
-        if(neg) neg.value='';
-                if(r){
-                    r.style.display='block';
-                    r.className='result ok';
-                    r.textContent='Perfil manual: prompts limpiados.';
-                }
-        return;
-    }
-    try{
-        const resp=await fetch('/tools/character-video-prompt/'+encodeURIComponent(id));
-        const data=await resp.json();
-        if(!data.ok)return;
-        if(pos && data.positive_prompt) pos.value=data.positive_prompt;
-        if(neg && data.negative_prompt) neg.value=data.negative_prompt;
-                if(r){
-                    r.style.display='block';
-                    r.className='result ok';
-                    r.textContent='Perfil cargado: '+(data.name||id)+'\\nPrompt+ y Prompt- actualizados.';
-                }
-    }catch(_err){
-                if(r){
-                    r.style.display='block';
-                    r.className='result err';
-                    r.textContent='Error cargando perfil '+id+'. Revisa /tmp/landing-trace.log';
-                }
-        // El fallback de backend al enviar mantiene funcionalidad incluso si falla la UI.
-    }
-}
-async function handleVideoSubmit(e){
-  e.preventDefault();const r=document.getElementById('result');
-  r.style.display='block';r.className='result';r.textContent='Enviando a ComfyUI...';
-  const fd=new FormData(e.target);
-  try{
-        const resp=await fetch('/tools/video-scene',{
-            method:'POST',
-            headers:{'X-Requested-With':'XMLHttpRequest'},
-            body:new URLSearchParams(fd)
-        });
-    const data=await resp.json();r.className='result '+(data.ok?'ok':'err');
-        let msg=data.message||'';
-    if(data.prompt_id)msg+='\\nPrompt ID: '+data.prompt_id;
-    if(data.output_prefix)msg+='\\nOutput: '+data.output_prefix;
-        if(data.workflow_mode)msg+='\\nWorkflow mode: '+data.workflow_mode;
-        if(data.workflow_file)msg+='\\nWorkflow file: '+data.workflow_file;
-        if(data.used_checkpoint)msg+='\\nCheckpoint: '+data.used_checkpoint;
-        if(data.used_motion_model)msg+='\\nMotion model: '+data.used_motion_model;
-        if(data.used_positive_prompt)msg+='\\nPrompt+: '+data.used_positive_prompt;
-        if(data.ok && data.prompt_id)msg+='\\nComfyUI: http://localhost:8188 (abre Queue en la barra lateral)';
-    r.textContent=msg;
-    }catch(err){r.className='result err';r.textContent='Error: '+err;}
-    return false;
-}
-</script></body></html>
+</script>
+<script src="/static/js/jobs.js?v={{ asset_version }}"></script>
+<script src="/static/js/video_tool.js?v={{ asset_version }}"></script></body></html>
 """
 
 # --- HTML WAN2.1 VIDEO TOOL ---------------------------------------------------
@@ -610,25 +637,7 @@ WAN_TOOL_HTML = """
 <!doctype html><html lang="es"><head>
 <meta charset="utf-8"><title>Wan2.1 — Generar Vídeo</title>
 <meta name="viewport" content="width=device-width, initial-scale=1">
-<style>
-:root{color-scheme:dark}
-body{font-family:"VT323","Press Start 2P","Lucida Console",monospace;background:radial-gradient(950px 520px at 90% -20%,#1a2748 0%,#06070d 62%);color:#d5ffe6;margin:0}
-.wrap{max-width:800px;margin:36px auto;padding:0 18px}
-h1{font-size:28px;margin:0 0 8px;text-shadow:0 0 8px rgba(62,252,154,.35)}
-.back{font-size:14px;opacity:.9;margin-bottom:18px}.back a{color:#78c7ff;text-decoration:none}
-label{display:block;font-size:13px;opacity:.95;margin:10px 0 3px;color:#9fd0ff}
-input,textarea,select{width:100%;box-sizing:border-box;background:#081122;border:1px solid #2a8fd6;border-radius:4px;color:#d5ffe6;padding:9px 10px;font-size:16px;box-shadow:0 0 0 1px rgba(62,252,154,.12) inset}
-input:focus,textarea:focus,select:focus{outline:none;border-color:#3efc9a;box-shadow:0 0 0 1px rgba(62,252,154,.4),0 0 12px rgba(62,252,154,.2)}
-textarea{height:96px;resize:vertical}.row{display:flex;gap:10px}.row>div{flex:1}
-button,a.btn{margin-top:6px;background:linear-gradient(180deg,#15345f 0%,#10233d 100%);border:1px solid #2ea8ff;color:#e5f4ff;padding:10px 18px;border-radius:4px;font-size:15px;cursor:pointer;text-decoration:none;display:inline-block}
-button:hover,a.btn:hover{background:linear-gradient(180deg,#1d4b88 0%,#15345f 100%)}
-button.sec{background:linear-gradient(180deg,#2a2056 0%,#20193f 100%);border-color:#7c6bff}
-.result{margin-top:16px;background:#091227;border:1px solid #2b87cf;border-radius:4px;padding:12px;font-size:15px;white-space:pre-wrap}
-.ok{color:#8effb8}.err{color:#ff9bbb}
-.section{background:linear-gradient(160deg,#0b1326 0%,#09101f 100%);border:2px solid #1f79b5;border-radius:6px;padding:12px;margin-bottom:12px}
-.section-title{font-size:13px;font-weight:700;opacity:.95;text-transform:uppercase;letter-spacing:.08em;color:#8ec9ff}
-.note{font-size:12px;opacity:.85;margin-top:4px;color:#95cfff}
-</style></head><body><div class="wrap">
+<link rel="stylesheet" href="/static/css/wan_tool.css?v={{ asset_version }}"></head><body><div class="wrap">
 <h1>🎞️ Wan2.1 — Text to Video</h1>
 <div class="back"><a href="/">← Volver al gestor</a></div>
 <div class="note" style="margin-bottom:16px">Requiere: ComfyUI-WanVideoWrapper + modelos en <code>diffusion_models/</code>, <code>text_encoders/</code> y <code>vae/</code></div>
@@ -670,98 +679,44 @@ button.sec{background:linear-gradient(180deg,#2a2056 0%,#20193f 100%);border-col
         <option value="yuv420p" {% if form.pix_fmt=='yuv420p' %}selected{% endif %}>yuv420p</option>
         <option value="yuv420p10le" {% if form.pix_fmt=='yuv420p10le' %}selected{% endif %}>yuv420p10le</option>
       </select></div>
+      <div><label>Duración larga (s, 0 = un solo lote)</label><input name="long_duration" type="number" min="0" max="600" step="0.5" value="{{ form.long_duration }}"></div>
+    </div>
+    <div class="row">
+      <div><label>Interpolación</label><select name="interpolate">
+        {% for n in (1, 2, 4) %}<option value="{{ n }}" {% if form.interpolate|int==n %}selected{% endif %}>{{ 'Ninguna' if n==1 else 'x%d (RIFE)'|format(n) }}</option>{% endfor %}
+      </select></div>
+      <div><label>Escalado</label><input name="upscale" type="number" min="1" max="4" step="0.5" value="{{ form.upscale }}"></div>
+      <div><label>Upscaler</label><select name="upscaler">
+        <option value="lanczos" {% if form.upscaler=='lanczos' %}selected{% endif %}>Lanczos</option>
+        <option value="model" {% if form.upscaler=='model' %}selected{% endif %}>Modelo (ESRGAN)</option>
+      </select></div>
     </div>
   </div>
   <div style="margin-top:18px;display:flex;gap:10px;flex-wrap:wrap">
     <button type="submit">🎞️ Generar vídeo</button>
         <a class="btn" href="http://localhost:8188" target="_blank" rel="noopener noreferrer">📋 Abrir ComfyUI (cola)</a>
     <button type="button" class="sec" onclick="exportWf()">📤 Exportar workflow JSON</button>
+    <label class="chk"><input type="checkbox" name="draft" value="1"> Borrador rápido</label>
+        <label class="chk"><input type="checkbox" name="force" value="1"> Re-render (ignorar caché)</label>
+        <label class="chk"><input type="checkbox" name="post_web" value="1"> MP4 web</label>
+        <input name="post_audio" class="post-audio" placeholder="WAV de voice_out a mezclar (opcional)">
   </div>
 </form>
 {% if server_result %}
-<div id="result" class="result {{ 'ok' if server_result_ok else 'err' }}">{{ server_result }}</div>
+<div id="result" class="result {{ 'ok' if server_result_ok else 'err' }}"{% if server_job_id %} data-job-id="{{ server_job_id }}"{% endif %}>{{ server_result }}</div>
 {% else %}
 <div id="result" class="result" style="display:none"></div>
 {% endif %}
+<div id="promote" class="promote" style="display:none">
+    <button type="button" onclick="promoteDraft('full')">⬆️ Promocionar a final (perfil completo)</button>
+    <button type="button" class="sec" onclick="promoteDraft('finish')">✨ Final rápido (borrador + interpolación x2 + escalado x2)</button>
+</div>
 </div>
 <script>
 const profiles={{video_profiles_json|safe}};
-function applyProfile(sel){
-  const p=profiles.find(x=>x.id===sel.value);if(!p)return;
-  const f=document.getElementById('wf');
-  ['width','height','frames','fps','steps','cfg','shift','crf'].forEach(k=>{if(f[k]&&p[k]!==undefined)f[k].value=p[k];});
-}
-async function applyCharacterPrompt(sel, formId){
-    const id=sel.value;
-    const f=document.getElementById(formId);if(!f)return;
-    const pos=f.querySelector('[name="positive_prompt"]');
-    const neg=f.querySelector('[name="negative_prompt"]');
-        const r=document.getElementById('result');
-    if(!id){
-        if(pos) pos.value='';
-        if(neg) neg.value='';
-                if(r){
-                    r.style.display='block';
-                    r.className='result ok';
-                    r.textContent='Perfil manual: prompts limpiados.';
-                }
-        return;
-    }
-    try{
-        const resp=await fetch('/tools/character-video-prompt/'+encodeURIComponent(id));
-        const data=await resp.json();
-        if(!data.ok)return;
-        if(pos && data.positive_prompt) pos.value=data.positive_prompt;
-        if(neg && data.negative_prompt) neg.value=data.negative_prompt;
-                if(r){
-                    r.style.display='block';
-                    r.className='result ok';
-                    r.textContent='Perfil cargado: '+(data.name||id)+'\\nPrompt+ y Prompt- actualizados.';
-                }
-    }catch(_err){
-                if(r){
-                    r.style.display='block';
-                    r.className='result err';
-                    r.textContent='Error cargando perfil '+id+'. Revisa /tmp/landing-trace.log';
-                }
-        // El fallback de backend al enviar mantiene funcionalidad incluso si falla la UI.
-    }
-}
-async function handleWanSubmit(e){
-  e.preventDefault();const r=document.getElementById('result');
-  r.style.display='block';r.className='result';r.textContent='Enviando a ComfyUI...';
-  const fd=new FormData(e.target);
-  try{
-        const resp=await fetch('/tools/wan-video',{
-            method:'POST',
-            headers:{'X-Requested-With':'XMLHttpRequest'},
-            body:new URLSearchParams(fd)
-        });
-    const data=await resp.json();r.className='result '+(data.ok?'ok':'err');
-        let msg=data.message||'';
-    if(data.prompt_id)msg+='\\nPrompt ID: '+data.prompt_id;
-    if(data.output_prefix)msg+='\\nOutput: '+data.output_prefix;
-        if(data.workflow_mode)msg+='\\nWorkflow mode: '+data.workflow_mode;
-        if(data.workflow_file)msg+='\\nWorkflow file: '+data.workflow_file;
-        if(data.used_model)msg+='\\nModel: '+data.used_model;
-        if(data.used_text_encoder)msg+='\\nText encoder: '+data.used_text_encoder;
-        if(data.used_vae)msg+='\\nVAE: '+data.used_vae;
-        if(data.used_positive_prompt)msg+='\\nPrompt+: '+data.used_positive_prompt;
-    if(data.ok)msg+='\\n→ ComfyUI: http://localhost:8188 (Queue en barra lateral)';
-    r.textContent=msg;
-    }catch(err){r.className='result err';r.textContent='Error: '+err;}
-    return false;
-}
-async function exportWf(){
-  const r=document.getElementById('result');r.style.display='block';r.className='result';r.textContent='Exportando...';
-  const fd=new FormData(document.getElementById('wf'));
-  try{
-    const resp=await fetch('/tools/wan-video/export',{method:'POST',body:new URLSearchParams(fd)});
-    const data=await resp.json();r.className='result '+(data.ok?'ok':'err');
-    r.textContent=data.message+(data.path?'\\n'+data.path:'');
-  }catch(err){r.className='result err';r.textContent='Error: '+err;}
-}
-</script></body></html>
+</script>
+<script src="/static/js/jobs.js?v={{ asset_version }}"></script>
+<script src="/static/js/wan_tool.js?v={{ asset_version }}"></script></body></html>
 """
 
 # --- HTML WAN2.1 I2V TOOL ----------------------------------------------------
@@ -769,24 +724,7 @@ WAN_I2V_TOOL_HTML = """
 <!doctype html><html lang="es"><head>
 <meta charset="utf-8"><title>Wan2.1 I2V — Escena desde imagen</title>
 <meta name="viewport" content="width=device-width, initial-scale=1">
-<style>
-:root{color-scheme:dark}
-body{font-family:"VT323","Press Start 2P","Lucida Console",monospace;background:radial-gradient(950px 520px at 90% -20%,#1a2748 0%,#06070d 62%);color:#d5ffe6;margin:0}
-.wrap{max-width:860px;margin:36px auto;padding:0 18px}
-h1{font-size:28px;margin:0 0 8px;text-shadow:0 0 8px rgba(62,252,154,.35)}
-.back{font-size:14px;opacity:.9;margin-bottom:18px}.back a{color:#78c7ff;text-decoration:none}
-label{display:block;font-size:13px;opacity:.95;margin:10px 0 3px;color:#9fd0ff}
-input,textarea,select{width:100%;box-sizing:border-box;background:#081122;border:1px solid #2a8fd6;border-radius:4px;color:#d5ffe6;padding:9px 10px;font-size:16px;box-shadow:0 0 0 1px rgba(62,252,154,.12) inset}
-input:focus,textarea:focus,select:focus{outline:none;border-color:#3efc9a;box-shadow:0 0 0 1px rgba(62,252,154,.4),0 0 12px rgba(62,252,154,.2)}
-textarea{height:96px;resize:vertical}.row{display:flex;gap:10px}.row>div{flex:1}
-button,a.btn{margin-top:8px;background:linear-gradient(180deg,#15345f 0%,#10233d 100%);border:1px solid #2ea8ff;color:#e5f4ff;padding:10px 18px;border-radius:4px;font-size:15px;cursor:pointer;text-decoration:none;display:inline-block}
-button:hover,a.btn:hover{background:linear-gradient(180deg,#1d4b88 0%,#15345f 100%)}
-.result{margin-top:16px;background:#091227;border:1px solid #2b87cf;border-radius:4px;padding:12px;font-size:15px;white-space:pre-wrap}
-.ok{color:#8effb8}.err{color:#ff9bbb}
-.section{background:linear-gradient(160deg,#0b1326 0%,#09101f 100%);border:2px solid #1f79b5;border-radius:6px;padding:12px;margin-bottom:12px}
-.section-title{font-size:13px;font-weight:700;opacity:.95;text-transform:uppercase;letter-spacing:.08em;color:#8ec9ff}
-.note{font-size:12px;opacity:.85;margin-top:6px;color:#95cfff}
-</style></head><body><div class="wrap">
+<link rel="stylesheet" href="/static/css/wan_i2v_tool.css?v={{ asset_version }}"></head><body><div class="wrap">
 <h1>🖼️ Wan2.1 I2V — Escena desde imagen</h1>
 <div class="back"><a href="/">← Volver al gestor</a></div>
 <div class="note" style="margin-bottom:16px">Usa una imagen base estable en <code>ComfyUI/input</code> para reducir carrusel y flicker.</div>
@@ -795,6 +733,7 @@ button:hover,a.btn:hover{background:linear-gradient(180deg,#1d4b88 0%,#15345f 10
         <label>Imágenes detectadas en ComfyUI/input</label>
         <div class="row">
             <div style="flex:3">
+                <input id="image_search" placeholder="Buscar por nombre..." oninput="searchInputImages()">
                 <select id="image_name_select" onchange="syncImageName()">
                     {% if input_images|length == 0 %}
                     <option value="">(sin imágenes detectadas)</option>
@@ -807,6 +746,12 @@ button:hover,a.btn:hover{background:linear-gradient(180deg,#1d4b88 0%,#15345f 10
                 <button type="button" onclick="refreshInputImages()">Actualizar lista</button>
             </div>
         </div>
+        <img id="image_preview" class="thumb" alt="" style="display:none">
+        <label>Subir imagen (se deduplica y se ajusta a la resolución del perfil)</label>
+        <div class="row">
+            <div style="flex:3"><input id="image_upload" type="file" accept="image/png,image/jpeg,image/webp,image/bmp"></div>
+            <div style="flex:1"><button type="button" onclick="uploadInputImage()">Subir</button></div>
+        </div>
         <label>Imagen base (nombre de archivo en ComfyUI/input)</label>
         <input name="image_name" placeholder="ej: akika_base.png" value="{{ form.image_name }}">
         <label>Prompt positivo</label><textarea name="positive_prompt">{{ form.positive_prompt }}</textarea>
@@ -840,84 +785,22 @@ button:hover,a.btn:hover{background:linear-gradient(180deg,#1d4b88 0%,#15345f 10
     <div style="margin-top:18px;display:flex;gap:10px;flex-wrap:wrap">
         <button type="submit">🎞️ Generar escena I2V</button>
         <a class="btn" href="http://localhost:8188" target="_blank" rel="noopener noreferrer">📋 Abrir ComfyUI (cola)</a>
+        <label class="chk"><input type="checkbox" name="draft" value="1"> Borrador rápido</label>
+        <label class="chk"><input type="checkbox" name="force" value="1"> Re-render (ignorar caché)</label>
+        <label class="chk"><input type="checkbox" name="post_web" value="1"> MP4 web</label>
+        <input name="post_audio" class="post-audio" placeholder="WAV de voice_out a mezclar (opcional)">
     </div>
 </form>
 <div id="result" class="result" style="display:none"></div>
+<div id="promote" class="promote" style="display:none">
+    <button type="button" onclick="promoteDraft('full')">⬆️ Promocionar a final (perfil completo)</button>
+    <button type="button" class="sec" onclick="promoteDraft('finish')">✨ Final rápido (borrador + interpolación x2 + escalado x2)</button>
+</div>
 <script>
 const profiles={{video_profiles_json|safe}};
-function syncImageName(){
-    const sel=document.getElementById('image_name_select');
-    const f=document.getElementById('i2vf');
-    if(!sel||!f||!f.image_name)return;
-    if(sel.value)f.image_name.value=sel.value;
-}
-async function refreshInputImages(){
-    const r=document.getElementById('result');
-    const sel=document.getElementById('image_name_select');
-    if(!sel)return;
-
-    const previous=sel.value;
-    if(r){
-        r.style.display='block';
-        r.className='result';
-        r.textContent='Refrescando imágenes de ComfyUI/input...';
-    }
-    try{
-        const resp=await fetch('/tools/wan-i2v/input-images');
-        const data=await resp.json();
-        sel.innerHTML='';
-        const images=Array.isArray(data.images)?data.images:[];
-        if(images.length===0){
-            const opt=document.createElement('option');
-            opt.value='';
-            opt.textContent='(sin imágenes detectadas)';
-            sel.appendChild(opt);
-        }else{
-            for(const img of images){
-                const opt=document.createElement('option');
-                opt.value=img;
-                opt.textContent=img;
-                sel.appendChild(opt);
-            }
-            const exists=images.includes(previous);
-            sel.value=exists?previous:images[0];
-        }
-        syncImageName();
-        if(r){
-            r.className='result ok';
-            r.textContent='Lista actualizada ('+images.length+' imágenes).';
-        }
-    }catch(err){
-        if(r){
-            r.className='result err';
-            r.textContent='Error refrescando lista: '+err;
-        }
-    }
-}
-function applyProfile(sel){
-    const p=profiles.find(x=>x.id===sel.value);if(!p)return;
-    const f=document.getElementById('i2vf');
-    ['frames','fps','steps','cfg','shift','crf'].forEach(k=>{if(f[k]&&p[k]!==undefined)f[k].value=p[k];});
-}
-async function handleI2VSubmit(e){
-    e.preventDefault();const r=document.getElementById('result');
-    r.style.display='block';r.className='result';r.textContent='Enviando I2V a ComfyUI...';
-    const fd=new FormData(e.target);
-    try{
-        const resp=await fetch('/tools/wan-i2v',{method:'POST',headers:{'X-Requested-With':'XMLHttpRequest'},body:new URLSearchParams(fd)});
-        const data=await resp.json();r.className='result '+(data.ok?'ok':'err');
-        let msg=data.message||'';
-        if(data.prompt_id)msg+='\\nPrompt ID: '+data.prompt_id;
-        if(data.output_prefix)msg+='\\nOutput: '+data.output_prefix;
-        if(data.workflow_file)msg+='\\nWorkflow file: '+data.workflow_file;
-        if(data.used_image)msg+='\\nImage: '+data.used_image;
-        if(data.ok)msg+='\\n→ ComfyUI: http://localhost:8188 (Queue en barra lateral)';
-        r.textContent=msg;
-    }catch(err){r.className='result err';r.textContent='Error: '+err;}
-    return false;
-}
-syncImageName();
-</script></div></body></html>
+</script>
+<script src="/static/js/jobs.js?v={{ asset_version }}"></script>
+<script src="/static/js/wan_i2v_tool.js?v={{ asset_version }}"></script></div></body></html>
 """
 
 # --- HTML GAME TTS TOOL -------------------------------------------------------
@@ -925,26 +808,7 @@ GAME_TTS_HTML = """
 <!doctype html><html lang="es"><head>
 <meta charset="utf-8"><title>Game TTS Personality</title>
 <meta name="viewport" content="width=device-width, initial-scale=1">
-<style>
-:root{color-scheme:dark}
-body{font-family:"VT323","Press Start 2P","Lucida Console",monospace;background:radial-gradient(980px 560px at 0% -20%,#10295a 0%,#06070d 62%);color:#d5ffe6;margin:0}
-.wrap{max-width:920px;margin:36px auto;padding:0 18px}
-h1{font-size:28px;margin:0 0 8px;text-shadow:0 0 8px rgba(62,252,154,.35)}
-.back{font-size:14px;opacity:.9;margin-bottom:18px}.back a{color:#78c7ff;text-decoration:none}
-.section{background:linear-gradient(160deg,#0b1326 0%,#09101f 100%);border:2px solid #1f79b5;border-radius:6px;padding:12px;margin-bottom:12px}
-.section-title{font-size:13px;font-weight:700;opacity:.95;text-transform:uppercase;letter-spacing:.08em;color:#8ec9ff;margin-bottom:8px}
-label{display:block;font-size:13px;opacity:.95;margin:10px 0 3px;color:#9fd0ff}
-input,textarea,select{width:100%;box-sizing:border-box;background:#081122;border:1px solid #2a8fd6;border-radius:4px;color:#d5ffe6;padding:9px 10px;font-size:16px;box-shadow:0 0 0 1px rgba(62,252,154,.12) inset}
-input:focus,textarea:focus,select:focus{outline:none;border-color:#3efc9a;box-shadow:0 0 0 1px rgba(62,252,154,.4),0 0 12px rgba(62,252,154,.2)}
-textarea{height:180px;resize:vertical}
-.row{display:flex;gap:10px}.row>div{flex:1}
-button{margin-top:10px;background:linear-gradient(180deg,#15345f 0%,#10233d 100%);border:1px solid #2ea8ff;color:#e5f4ff;padding:10px 18px;border-radius:4px;font-size:15px;cursor:pointer}
-button:hover{background:linear-gradient(180deg,#1d4b88 0%,#15345f 100%)}
-.result{margin-top:14px;background:#091227;border:1px solid #2b87cf;border-radius:4px;padding:12px;font-size:15px;white-space:pre-wrap}
-.ok{color:#8effb8}.err{color:#ff9bbb}.note{font-size:12px;opacity:.85;margin-top:4px;color:#95cfff}
-audio{width:100%;margin-top:10px}
-.hint{font-size:12px;color:#9cc5ea;opacity:.9;margin-top:5px}
-</style></head><body><div class="wrap">
+<link rel="stylesheet" href="/static/css/game_tts.css?v={{ asset_version }}"></head><body><div class="wrap">
 <h1>🎮 Game TTS Personality</h1>
 <div class="back"><a href="/">← Volver al gestor</a></div>
 
@@ -1003,90 +867,15 @@ audio{width:100%;margin-top:10px}
 </form>
 
 <div id="result" class="result" style="display:none"></div>
-<audio id="audio" controls style="display:none"></audio>
+<audio id="audio" controls preload="metadata" style="display:none"></audio>
 <div id="saved" class="hint" style="display:none"></div>
 
 <script>
 const personalities={{personalities_json|safe}};
 const piperRecommendations={{piper_recommendations_json|safe}};
-function applyEngineMode(){
-    const engine=document.getElementById('engine').value;
-    const pRow=document.getElementById('piper-model-row');
-    const eHint=document.getElementById('engine-hint');
-    const speakerHint=document.getElementById('speaker-hint');
-    if(engine==='piper'){
-        if(pRow) pRow.style.display='flex';
-        if(eHint) eHint.textContent='Piper usa el modelo seleccionado arriba.';
-    }else{
-        if(pRow) pRow.style.display='none';
-        if(eHint) eHint.textContent='XTTS ignora el modelo Piper y usa speaker WAV del personaje.';
-    }
-    if(speakerHint) speakerHint.style.display=(engine==='xtts')?'block':'none';
-}
-function applyPreset(){
-    const id=document.getElementById('personality_id').value;
-    const p=personalities.find(x=>x.id===id);if(!p)return;
-    document.getElementById('voice_id').value=p.voice_id||'';
-    document.getElementById('speed').value=p.speed||1.0;
-    document.getElementById('pitch').value=p.pitch||1.0;
-    document.getElementById('energy').value=p.energy||1.0;
-    document.getElementById('emotion_tags').value=p.emotion_tags||'';
-    document.getElementById('pauses').value=p.pauses||'medium';
-}
-function applyCharacterMeta(){
-    const sel=document.getElementById('character_id');
-    const opt=sel.options[sel.selectedIndex];
-    const characterId=(opt&&opt.value)||'';
-    const speaker=(opt&&opt.dataset&&opt.dataset.speaker)||'';
-    const piperSel=document.getElementById('piper_model');
-    const hint=document.getElementById('speaker-hint');
-    const eHint=document.getElementById('engine-hint');
-
-    if(piperSel && characterId && piperRecommendations[characterId]){
-        const target=piperRecommendations[characterId];
-        const hasOption=[...piperSel.options].some(o=>o.value===target);
-        if(hasOption){
-            piperSel.value=target;
-            if(eHint && document.getElementById('engine').value==='piper'){
-                eHint.textContent='Modelo recomendado para '+characterId+': '+target;
-            }
-        }
-    }
-
-    hint.textContent=speaker?('speaker WAV: '+speaker):'speaker WAV: no detectado (necesario para XTTS)';
-}
-async function generateGameTTS(e){
-    e.preventDefault();
-    const res=document.getElementById('result');
-    const audio=document.getElementById('audio');
-    const saved=document.getElementById('saved');
-    res.style.display='block';res.className='result';res.textContent='Generando audio...';
-    audio.style.display='none';saved.style.display='none';
-    const fd=new FormData(document.getElementById('tts-form'));
-    try{
-        const resp=await fetch('/tools/game-tts/generate',{
-            method:'POST',
-            headers:{'X-Requested-With':'XMLHttpRequest'},
-            body:new URLSearchParams(fd)
-        });
-        const data=await resp.json();
-        res.className='result '+(data.ok?'ok':'err');
-        res.textContent=data.message||'';
-        if(data.ok&&data.audio_url){
-            audio.src=data.audio_url+'?t='+Date.now();
-            audio.style.display='block';
-            saved.style.display='block';
-            saved.textContent='Guardado en: '+(data.path||'');
-        }
-    }catch(err){
-        res.className='result err';res.textContent='Error: '+err;
-    }
-    return false;
-}
-applyPreset();
-applyCharacterMeta();
-applyEngineMode();
 </script>
+<script src="/static/js/jobs.js?v={{ asset_version }}"></script>
+<script src="/static/js/game_tts.js?v={{ asset_version }}"></script>
 </div></body></html>
 """
 
@@ -1095,24 +884,7 @@ OLLAMA_MODELS_HTML = """
 <!doctype html><html lang="es"><head>
 <meta charset="utf-8"><title>Ollama Custom Models</title>
 <meta name="viewport" content="width=device-width, initial-scale=1">
-<style>
-:root{color-scheme:dark}
-body{font-family:"VT323","Press Start 2P","Lucida Console",monospace;background:radial-gradient(900px 500px at 50% -10%,#1a2748 0%,#06070d 60%);color:#d5ffe6;margin:0}
-.wrap{max-width:920px;margin:36px auto;padding:0 18px}
-h1{font-size:28px;margin:0 0 8px;text-shadow:0 0 8px rgba(62,252,154,.35)}
-.back{font-size:14px;opacity:.9;margin-bottom:18px}.back a{color:#78c7ff;text-decoration:none}
-.section{background:linear-gradient(160deg,#0b1326 0%,#09101f 100%);border:2px solid #1f79b5;border-radius:6px;padding:12px;margin-bottom:12px}
-.section-title{font-size:13px;font-weight:700;opacity:.95;text-transform:uppercase;letter-spacing:.08em;color:#8ec9ff;margin-bottom:8px}
-label{display:block;font-size:13px;opacity:.95;margin:10px 0 3px;color:#9fd0ff}
-input,textarea,select{width:100%;box-sizing:border-box;background:#081122;border:1px solid #2a8fd6;border-radius:4px;color:#d5ffe6;padding:9px 10px;font-size:16px;box-shadow:0 0 0 1px rgba(62,252,154,.12) inset}
-input:focus,textarea:focus,select:focus{outline:none;border-color:#3efc9a;box-shadow:0 0 0 1px rgba(62,252,154,.4),0 0 12px rgba(62,252,154,.2)}
-textarea{height:140px;resize:vertical}.row{display:flex;gap:10px}.row>div{flex:1}
-button{margin-top:10px;background:linear-gradient(180deg,#15345f 0%,#10233d 100%);border:1px solid #2ea8ff;color:#e5f4ff;padding:10px 18px;border-radius:4px;font-size:15px;cursor:pointer}
-button:hover{background:linear-gradient(180deg,#1d4b88 0%,#15345f 100%)}
-.result{margin-top:14px;background:#091227;border:1px solid #2b87cf;border-radius:4px;padding:12px;font-size:15px;white-space:pre-wrap}
-.ok{color:#8effb8}.err{color:#ff9bbb}
-ul{margin:0;padding-left:18px}
-</style></head><body><div class="wrap">
+<link rel="stylesheet" href="/static/css/ollama_models.css?v={{ asset_version }}"></head><body><div class="wrap">
 <h1>🧠 Ollama Custom Models</h1>
 <div class="back"><a href="/">← Volver al gestor</a></div>
 
@@ -1122,6 +894,16 @@ ul{margin:0;padding-left:18px}
     <div id="models" class="result" style="margin-top:10px">Cargando...</div>
 </div>
 
+<div class="section">
+    <div class="section-title">Modelos en memoria (/api/ps)</div>
+    <div class="row">
+        <div><input id="warm_model" placeholder="ej: llama3.1" /></div>
+        <div><button type="button" style="margin-top:0" onclick="warmModel()">Precargar</button>
+        <button type="button" style="margin-top:0" onclick="evictModel('')">Liberar todos</button></div>
+    </div>
+    <div id="loaded" class="result" style="margin-top:10px">Cargando...</div>
+</div>
+
 <div class="section">
     <div class="section-title">Descargar modelo base (pull)</div>
     <label>Modelo</label>
@@ -1157,64 +939,10 @@ ul{margin:0;padding-left:18px}
 
 </div>
 <script>
-const PROMPT_PRESETS={{prompt_presets_json}};
-
-function show(msg, ok=true){
-    const r=document.getElementById('result');
-    r.style.display='block';
-    r.className='result '+(ok?'ok':'err');
-    r.textContent=msg;
-}
-
-function applyPromptPreset(){
-    const id=document.getElementById('prompt_preset').value;
-    if(!id)return;
-    const preset=PROMPT_PRESETS.find(p=>p.id===id);
-    if(!preset)return;
-    if(preset.base_model) document.getElementById('base_model').value=preset.base_model;
-    if(preset.system_prompt) document.getElementById('system_prompt').value=preset.system_prompt;
-}
-
-async function refreshModels(){
-    const out=document.getElementById('models');
-    out.textContent='Cargando modelos...';
-    try{
-        const resp=await fetch('/tools/ollama-models/list');
-        const data=await resp.json();
-        if(!data.ok){out.textContent='Error: '+(data.message||'');return;}
-        if(!data.models || !data.models.length){out.textContent='No hay modelos locales todavía.';return;}
-        out.innerHTML='<ul>'+data.models.map(m=>`<li>${m}</li>`).join('')+'</ul>';
-    }catch(err){out.textContent='Error: '+err;}
-}
-
-async function pullModel(){
-    const model=document.getElementById('pull_model').value.trim();
-    if(!model){show('Indica un modelo para descargar.', false);return;}
-    show('Descargando modelo en Ollama... puede tardar.');
-    try{
-        const resp=await fetch('/tools/ollama-models/pull',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({model})});
-        const data=await resp.json();
-        show(data.message||'OK', !!data.ok);
-        if(data.ok) refreshModels();
-    }catch(err){show('Error: '+err, false);}
-}
-
-async function createCustom(){
-    const model=document.getElementById('new_model').value.trim();
-    const base=document.getElementById('base_model').value.trim();
-    const system=document.getElementById('system_prompt').value.trim();
-    if(!model || !base){show('Completa nombre y modelo base.', false);return;}
-    show('Creando modelo custom en Ollama...');
-    try{
-        const resp=await fetch('/tools/ollama-models/create',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({model_name:model,base_model:base,system_prompt:system})});
-        const data=await resp.json();
-        show(data.message||'OK', !!data.ok);
-        if(data.ok) refreshModels();
-    }catch(err){show('Error: '+err, false);}
-}
-
-refreshModels();
+const PROMPT_PRESETS={{prompt_presets|tojson}};
 </script>
+<script src="/static/js/jobs.js?v={{ asset_version }}"></script>
+<script src="/static/js/ollama_models.js?v={{ asset_version }}"></script>
 </body></html>
 """
 
@@ -1290,6 +1018,10 @@ def _wait_for_port(port: int, timeout: float = 30.0, interval: float = 0.5) -> b
     return False
 
 
+def _form_flag(form_data, key: str) -> bool:
+    return str(form_data.get(key, "") or "").strip().lower() in ("1", "on", "true", "yes")
+
+
 def slugify_text(text: str, max_len: int = 60) -> str:
     s = re.sub(r"[^\w\s-]", "", text.lower())
     s = re.sub(r"[\s_-]+", "_", s).strip("_")
@@ -1319,8 +1051,9 @@ def comfy_start():
 
 
 def comfy_stop():
-    global _comfy_nodes_cache
-    _comfy_nodes_cache = None
+    local = comfy_local_backend()
+    if local is not None:
+        comfy_pool_invalidate(local)
     kill_from_pidfile(COMFY_PID)
 
 
@@ -1337,7 +1070,10 @@ def comfy_restart(wait_timeout: float = 45.0) -> bool:
 
 
 def ensure_wan_runtime_ready() -> bool:
-    global _comfy_nodes_cache
+    local = comfy_local_backend()
+    if local is None:
+        # Sin ComfyUI local gestionado: los backends remotos se validan al encolar.
+        return True
     if not WAN_WRAPPER_DIR.exists():
         log.warning("Wan wrapper no encontrado en %s", WAN_WRAPPER_DIR)
         return False
@@ -1345,8 +1081,8 @@ def ensure_wan_runtime_ready() -> bool:
         log.warning("ComfyUI no está activo; no se puede verificar Wan")
         return False
 
-    _comfy_nodes_cache = None
-    missing = check_comfy_nodes(WAN_REQUIRED_NODES)
+    comfy_pool_invalidate(local)
+    missing = check_comfy_nodes(WAN_REQUIRED_NODES, backend=local)
     if not missing:
         log.info("Wan runtime OK (nodos cargados)")
         return True
@@ -1356,8 +1092,8 @@ def ensure_wan_runtime_ready() -> bool:
     if not comfy_restart(wait_timeout=60.0):
         return False
 
-    _comfy_nodes_cache = None
-    missing_after = check_comfy_nodes(WAN_REQUIRED_NODES)
+    comfy_pool_invalidate(local)
+    missing_after = check_comfy_nodes(WAN_REQUIRED_NODES, backend=local)
     if missing_after:
         log.warning(
             "Wan sigue incompleto tras restart: %s. Revisa dependencias/imports del wrapper.",
@@ -1470,7 +1206,9 @@ def autostart():
             log.info("Open WebUI UP")
         else:
             log.warning("Open WebUI no respondió en 30s")
-    if not port_open(COMFY_PORT):
+    if comfy_local_backend() is None:
+        log.info("ComfyUI local fuera del pool (COMFY_BACKENDS); no se arranca")
+    elif not port_open(COMFY_PORT):
         log.info("ComfyUI DOWN — arrancando...")
         comfy_start()
         if _wait_for_port(COMFY_PORT, timeout=30):
@@ -1490,21 +1228,89 @@ def autostart():
             log.info("Voice UI UP")
         else:
             log.warning("Voice UI no respondió en 30s")
+
+    # Precarga al final para no retrasar el arranque de los demás servicios.
+    if OLLAMA_PINNED_MODELS and port_open(OLLAMA_PORT):
+        warm_pinned_models()
     log.info("=== autostart fin ===")
 
 
 # --- COMFYUI API --------------------------------------------------------------
-_comfy_nodes_cache = None
+# Pool de instancias ComfyUI (COMFY_BACKENDS, puertos u hosts distintos). Cada backend
+# descubre sus nodos y modelos desde /object_info; cada prompt va al backend capaz con
+# menos cola en /queue y, si un backend cae con prompts pendientes, se reenvían a otro.
+# El backend local (127.0.0.1:COMFY_PORT) es el único que la landing arranca y arbitra.
+COMFY_OBJECT_INFO_TTL_S = float(os.environ.get("COMFY_OBJECT_INFO_TTL_S", "60"))
+COMFY_POOL_POLL_S = float(os.environ.get("COMFY_POOL_POLL_S", "3"))
+COMFY_BACKEND_MAX_FAILS = int(os.environ.get("COMFY_BACKEND_MAX_FAILS", "3"))
+COMFY_RESUBMIT_MAX_S = 4 * 3600.0
+COMFY_MODEL_EXTS = (".safetensors", ".ckpt", ".pt", ".pth", ".bin", ".gguf", ".sft")
+COMFY_DONE_LIMIT = 500
+
+_comfy_pool_lock = threading.Lock()
+_comfy_pool: dict[str, Any] = {"backends": None, "orphans": [], "monitor": None}
+# Prompts terminados (por prompt_id original) para quien espere su resultado.
+_comfy_done: dict[str, dict] = {}
+_comfy_done_cv = threading.Condition()
+
+
+def _parse_comfy_backends(raw: str) -> list[dict]:
+    urls = [u.strip().rstrip("/") for u in raw.split(",") if u.strip()]
+    if not urls:
+        urls = [f"http://127.0.0.1:{COMFY_PORT}"]
+    backends = []
+    for url in urls:
+        if "://" not in url:
+            url = "http://" + url
+        parsed = urlparse(url)
+        host = parsed.hostname or "127.0.0.1"
+        port = parsed.port or 80
+        backends.append(
+            {
+                "id": f"{host}:{port}",
+                "url": url,
+                "host": host,
+                "port": port,
+                "local": host in ("127.0.0.1", "localhost") and port == COMFY_PORT,
+                "alive": None,
+                "fails": 0,
+                "queue_depth": None,
+                "object_info": None,
+                "info_at": 0.0,
+                "nodes": set(),
+                "models": set(),
+                "info_lock": threading.Lock(),
+                "inflight": {},
+                "last_models": set(),
+            }
+        )
+    return backends
+
+
+def comfy_backends() -> list[dict]:
+    # Se construye en el primer uso para respetar COMFY_PORT/COMFY_BACKENDS ya resueltos.
+    with _comfy_pool_lock:
+        if _comfy_pool["backends"] is None:
+            _comfy_pool["backends"] = _parse_comfy_backends(os.environ.get("COMFY_BACKENDS", ""))
+        return _comfy_pool["backends"]
+
+
+def comfy_local_backend() -> dict | None:
+    return next((b for b in comfy_backends() if b["local"]), None)
+
 
+def comfy_primary_backend() -> dict:
+    return comfy_local_backend() or comfy_backends()[0]
 
-def comfy_api_get(path: str) -> dict:
-    url = f"http://127.0.0.1:{COMFY_PORT}{path}"
-    with urlrequest.urlopen(url, timeout=5) as resp:
+
+def comfy_api_get(path: str, backend: dict | None = None, timeout: float = 5) -> dict:
+    url = f"{(backend or comfy_primary_backend())['url']}{path}"
+    with urlrequest.urlopen(url, timeout=timeout) as resp:
         return json.loads(resp.read())
 
 
-def comfy_api_post(path: str, payload: dict) -> dict:
-    url = f"http://127.0.0.1:{COMFY_PORT}{path}"
+def comfy_api_post(path: str, payload: dict, backend: dict | None = None) -> dict:
+    url = f"{(backend or comfy_primary_backend())['url']}{path}"
     data = json.dumps(payload).encode()
     req = urlrequest.Request(
         url, data=data, headers={"Content-Type": "application/json"}
@@ -1513,24 +1319,381 @@ def comfy_api_post(path: str, payload: dict) -> dict:
         return json.loads(resp.read())
 
 
-def check_comfy_nodes(required):
-    global _comfy_nodes_cache
-    if _comfy_nodes_cache is None:
+def comfy_upload_image(backend: dict, name: str, data: bytes) -> str:
+    """Sube una imagen a ComfyUI/input del backend (POST /upload/image); devuelve su nombre."""
+    if backend["local"]:
+        ensure_dir(COMFY_DIR / "input")
+        (COMFY_DIR / "input" / name).write_bytes(data)
+        return name
+    boundary = os.urandom(12).hex()
+    body = (
+        f'--{boundary}\r\nContent-Disposition: form-data; name="image"; filename="{name}"\r\n'
+        "Content-Type: image/png\r\n\r\n"
+    ).encode() + data + (
+        f'\r\n--{boundary}\r\nContent-Disposition: form-data; name="overwrite"\r\n\r\ntrue\r\n--{boundary}--\r\n'
+    ).encode()
+    req = urlrequest.Request(
+        f"{backend['url']}/upload/image",
+        data=body,
+        headers={"Content-Type": f"multipart/form-data; boundary={boundary}"},
+    )
+    with urlrequest.urlopen(req, timeout=30) as resp:
+        return json.loads(resp.read()).get("name", name)
+
+
+def comfy_fetch_output(backend: dict, item: dict, dest: Path) -> Path:
+    """Ruta local de una salida de ComfyUI; las de backends remotos se descargan a dest."""
+    if backend["local"]:
+        return COMFY_DIR / "output" / item["subfolder"] / item["filename"]
+    query = urlencode({"filename": item["filename"], "subfolder": item["subfolder"], "type": "output"})
+    ensure_dir(dest.parent)
+    with urlrequest.urlopen(f"{backend['url']}/view?{query}", timeout=60) as resp, open(dest, "wb") as fh:
+        shutil.copyfileobj(resp, fh)
+    return dest
+
+
+def comfy_backend_up(backend: dict) -> bool:
+    return port_open(backend["port"], host=backend["host"], timeout=0.25 if backend["local"] else 1.0)
+
+
+def ensure_comfy_pool() -> bool:
+    """True si algún backend responde; si ninguno lo hace, arranca el ComfyUI local."""
+    if any(comfy_backend_up(b) for b in comfy_backends()):
+        return True
+    if comfy_local_backend() is None:
+        return False
+    comfy_start()
+    return _wait_for_port(COMFY_PORT, timeout=10.0)
+
+
+def _object_info_models(obj_info: dict) -> set[str]:
+    models = set()
+    for spec in obj_info.values():
+        inputs = spec.get("input", {}) if isinstance(spec, dict) else {}
+        for group in ("required", "optional"):
+            for cfg in (inputs.get(group) or {}).values():
+                if isinstance(cfg, list) and cfg and isinstance(cfg[0], list):
+                    models.update(
+                        o for o in cfg[0] if isinstance(o, str) and o.lower().endswith(COMFY_MODEL_EXTS)
+                    )
+    return models
+
+
+def comfy_backend_info(backend: dict, force: bool = False) -> dict:
+    """object_info del backend, cacheado COMFY_OBJECT_INFO_TTL_S; {} si no responde."""
+    with backend["info_lock"]:
+        fresh = time.time() - backend["info_at"] < COMFY_OBJECT_INFO_TTL_S
+        if backend["object_info"] is not None and fresh and not force:
+            return backend["object_info"]
         try:
-            obj_info = comfy_api_get("/object_info")
-            _comfy_nodes_cache = set(obj_info.keys())
+            obj_info = comfy_api_get("/object_info", backend, timeout=15)
         except Exception as exc:
-            log.warning(f"No se pudo consultar /object_info: {exc}")
-            return []
-    return [n for n in required if n not in _comfy_nodes_cache]
+            log.warning("No se pudo consultar /object_info de %s: %s", backend["id"], exc)
+            backend["object_info"] = None
+            backend["nodes"], backend["models"] = set(), set()
+            return {}
+        backend["object_info"] = obj_info
+        backend["info_at"] = time.time()
+        backend["nodes"] = set(obj_info.keys())
+        backend["models"] = _object_info_models(obj_info)
+        return obj_info
+
+
+def comfy_pool_invalidate(backend: dict | None = None):
+    for b in [backend] if backend else comfy_backends():
+        with b["info_lock"]:
+            b["object_info"] = None
+            b["info_at"] = 0.0
+
+
+def comfy_queue_depth(backend: dict) -> int | None:
+    try:
+        queue = comfy_api_get("/queue", backend, timeout=3)
+    except Exception:
+        backend["fails"] += 1
+        if backend["fails"] >= COMFY_BACKEND_MAX_FAILS:
+            backend["alive"] = False
+        return None
+    backend["fails"] = 0
+    backend["alive"] = True
+    backend["queue_depth"] = len(queue.get("queue_running", [])) + len(queue.get("queue_pending", []))
+    return backend["queue_depth"]
+
+
+def check_comfy_nodes(required, backend: dict | None = None):
+    """Nodos de required que no tiene ningún backend (o el indicado)."""
+    available = set()
+    answered = False
+    for b in [backend] if backend else comfy_backends():
+        if comfy_backend_info(b):
+            answered = True
+            available |= b["nodes"]
+    if not answered:
+        return []
+    return [n for n in required if n not in available]
 
 
 def get_comfy_object_info() -> dict:
+    """object_info combinado de los backends: nodos de todos y opciones de cada input unidas."""
+    infos = [info for info in (comfy_backend_info(b) for b in comfy_backends()) if info]
+    if len(infos) <= 1:
+        return infos[0] if infos else {}
+    merged = dict(infos[0])
+    copied = set()
+    for info in infos[1:]:
+        for node, spec in info.items():
+            if node not in merged:
+                merged[node] = spec
+                continue
+            for name, cfg in spec.get("input", {}).get("required", {}).items():
+                if not (isinstance(cfg, list) and cfg and isinstance(cfg[0], list)):
+                    continue
+                if node not in copied:
+                    merged[node] = json.loads(json.dumps(merged[node]))
+                    copied.add(node)
+                current = merged[node].setdefault("input", {}).setdefault("required", {})
+                mine = current.get(name)
+                if isinstance(mine, list) and mine and isinstance(mine[0], list):
+                    mine[0].extend(o for o in cfg[0] if o not in mine[0])
+                else:
+                    current[name] = cfg
+    return merged
+
+
+def _prompt_requirements(prompt: dict) -> tuple[set[str], set[str]]:
+    nodes, models = set(), set()
+    for node in prompt.values():
+        if not isinstance(node, dict):
+            continue
+        if node.get("class_type"):
+            nodes.add(node["class_type"])
+        for val in (node.get("inputs") or {}).values():
+            if isinstance(val, str) and val.lower().endswith(COMFY_MODEL_EXTS):
+                models.add(val)
+    return nodes, models
+
+
+def pick_comfy_backend(prompt: dict, exclude: set[str] | frozenset = frozenset()) -> dict | None:
+    """Backend vivo con los nodos y modelos del prompt y la cola más corta.
+
+    A igual cola se prefiere el que ejecutó por última vez los mismos modelos.
+    """
+    nodes, models = _prompt_requirements(prompt)
+    best, best_key = None, None
+    for idx, backend in enumerate(comfy_backends()):
+        if backend["id"] in exclude or not comfy_backend_up(backend):
+            continue
+        if not comfy_backend_info(backend):
+            continue
+        if not nodes <= backend["nodes"] or not models <= backend["models"]:
+            continue
+        depth = comfy_queue_depth(backend)
+        if depth is None:
+            continue
+        key = (depth, backend["last_models"] != models, len(backend["inflight"]), idx)
+        if best_key is None or key < best_key:
+            best, best_key = backend, key
+    return best
+
+
+def _track_comfy_prompt(backend: dict, prompt_id: str, entry: dict):
+    with _comfy_pool_lock:
+        backend["inflight"][prompt_id] = entry
+        monitor = _comfy_pool["monitor"]
+        if monitor is None or not monitor.is_alive():
+            monitor = threading.Thread(target=_comfy_pool_monitor, name="comfy-pool", daemon=True)
+            _comfy_pool["monitor"] = monitor
+            monitor.start()
+
+
+def _place_comfy_prompt(entry: dict, exclude: set[str] | frozenset = frozenset()) -> bool:
+    """Envía entry al mejor backend; el lease del árbitro solo aplica al ComfyUI local."""
+    backend = pick_comfy_backend(entry["prompt"], exclude=exclude)
+    if backend is None:
+        return False
+    acquired = ""
+    if backend["local"] and not entry.get("lease_id"):
+        lease = arbiter_acquire(entry["workload"], label=entry["label"], timeout=0)
+        if not lease.get("ok"):
+            return False
+        entry["lease_id"] = acquired = lease["lease_id"]
+    elif not backend["local"] and entry.get("lease_id"):
+        arbiter_release(entry.pop("lease_id"))
     try:
-        return comfy_api_get("/object_info")
+        prompt_id = comfy_api_post("/prompt", {"prompt": entry["prompt"]}, backend).get("prompt_id")
     except Exception as exc:
-        log.warning(f"No se pudo consultar object_info: {exc}")
-        return {}
+        log.warning("Reenvío a %s falló: %s", backend["id"], exc)
+        prompt_id = None
+    if not prompt_id:
+        if acquired:
+            arbiter_release(entry.pop("lease_id"))
+        return False
+    entry["attempts"] += 1
+    entry["backend"] = backend["id"]
+    backend["last_models"] = _prompt_requirements(entry["prompt"])[1]
+    _track_comfy_prompt(backend, prompt_id, entry)
+    log.info("Prompt %s reenviado a %s como %s", entry["origin_id"], backend["id"], prompt_id)
+    return True
+
+
+def _finish_comfy_prompt(entry: dict, history_entry: dict | None = None):
+    arbiter_release(entry.pop("lease_id", ""))
+    if history_entry is not None and entry.get("graph_hash"):
+        try:
+            record_render_outputs(
+                entry["graph_hash"], entry["origin_id"], entry["backend"], entry["label"], history_entry
+            )
+        except Exception as exc:
+            log.warning("No se pudo anotar la caché de render: %s", exc)
+    status = ((history_entry or {}).get("status") or {}).get("status_str", "success")
+    with _comfy_done_cv:
+        _comfy_done[entry["origin_id"]] = {
+            "ok": history_entry is not None and status == "success",
+            "backend": entry.get("backend"),
+            "history": history_entry,
+        }
+        while len(_comfy_done) > COMFY_DONE_LIMIT:
+            _comfy_done.pop(next(iter(_comfy_done)))
+        _comfy_done_cv.notify_all()
+        posts = _render_postproc.pop(entry["origin_id"], [])
+        done = _comfy_done[entry["origin_id"]]
+    invalidate_output_catalog()
+    for post in posts:
+        post_job = _enqueue_render_postproc(post, done)
+        with _jobs_cv:
+            render = _jobs.get(post["render_job"])
+            if render and render.get("result") is not None:
+                _set_render_postproc_job(render["result"], post_job)
+                _save_jobs_locked()
+            else:
+                # El worker aún no guardó el result: lo recoge al guardarlo.
+                _render_postproc_jobs[post["render_job"]] = post_job
+    # Hueco libre en el pool: el planificador de renders puede despachar el siguiente.
+    with _jobs_cv:
+        _jobs_cv.notify_all()
+
+
+def wait_comfy_prompt(prompt_id: str, timeout: float | None = None) -> dict | None:
+    """{"ok", "backend", "history"} cuando el prompt termina (o se descarta); None si vence timeout."""
+    with _comfy_done_cv:
+        _comfy_done_cv.wait_for(lambda: prompt_id in _comfy_done, timeout=timeout)
+        return _comfy_done.get(prompt_id)
+
+
+def comfy_prompt_state(prompt_id: str) -> str:
+    """"rendering", "done" o "failed". Lo que el pool ya no sigue (reinicio de la landing,
+    fuera de COMFY_DONE_LIMIT) se da por terminado."""
+    with _comfy_done_cv:
+        done = _comfy_done.get(prompt_id)
+    if done is not None:
+        return "done" if done["ok"] else "failed"
+    backends = comfy_backends()
+    with _comfy_pool_lock:
+        pending = [e for b in backends for e in b["inflight"].values()] + _comfy_pool["orphans"]
+        return "rendering" if any(e["origin_id"] == prompt_id for e in pending) else "done"
+
+
+def _check_backend_prompts(backend: dict) -> list[dict]:
+    """Revisa los prompts en curso del backend; devuelve los que hay que reenviar."""
+    with _comfy_pool_lock:
+        pending = dict(backend["inflight"])
+    if not pending:
+        return []
+    try:
+        queue = comfy_api_get("/queue", backend, timeout=3)
+    except Exception:
+        backend["fails"] += 1
+        if backend["fails"] < COMFY_BACKEND_MAX_FAILS:
+            return []
+        backend["alive"] = False
+        log.warning("Backend ComfyUI %s caído con %s prompts; se reenvían.", backend["id"], len(pending))
+        with _comfy_pool_lock:
+            for pid in pending:
+                backend["inflight"].pop(pid, None)
+        return list(pending.values())
+    backend["fails"] = 0
+    backend["alive"] = True
+    queued = {
+        item[1]
+        for key in ("queue_running", "queue_pending")
+        for item in queue.get(key, [])
+        if isinstance(item, list) and len(item) > 1
+    }
+    backend["queue_depth"] = len(queued)
+    lost = []
+    for pid, entry in pending.items():
+        if pid in queued:
+            continue
+        try:
+            history = comfy_api_get(f"/history/{pid}", backend, timeout=5)
+        except Exception:
+            continue
+        with _comfy_pool_lock:
+            backend["inflight"].pop(pid, None)
+        if pid in history:
+            _finish_comfy_prompt(entry, history[pid])
+        else:
+            # Ni en cola ni en historial: ComfyUI se reinició y perdió su cola.
+            log.warning("Prompt %s perdido en %s; se reenvía.", pid, backend["id"])
+            lost.append(entry)
+    return lost
+
+
+def _comfy_pool_monitor():
+    while True:
+        time.sleep(COMFY_POOL_POLL_S)
+        for backend in comfy_backends():
+            for entry in _check_backend_prompts(backend):
+                if not _place_comfy_prompt(entry, exclude={backend["id"]}):
+                    with _comfy_pool_lock:
+                        _comfy_pool["orphans"].append(entry)
+        with _comfy_pool_lock:
+            orphans, _comfy_pool["orphans"] = _comfy_pool["orphans"], []
+        for entry in orphans:
+            if _place_comfy_prompt(entry):
+                continue
+            if time.time() - entry["submitted"] > COMFY_RESUBMIT_MAX_S:
+                log.warning("Prompt %s descartado: ningún backend capaz en %.0fs.", entry["origin_id"], COMFY_RESUBMIT_MAX_S)
+                _finish_comfy_prompt(entry)
+                continue
+            with _comfy_pool_lock:
+                _comfy_pool["orphans"].append(entry)
+
+
+def comfy_pool_status(refresh: bool = False) -> dict:
+    backends = []
+    for b in comfy_backends():
+        if refresh:
+            comfy_backend_info(b, force=True)
+            comfy_queue_depth(b)
+        with _comfy_pool_lock:
+            inflight = [
+                {"prompt_id": pid, "origin_id": e["origin_id"], "label": e["label"], "attempts": e["attempts"]}
+                for pid, e in b["inflight"].items()
+            ]
+        backends.append(
+            {
+                "id": b["id"],
+                "url": b["url"],
+                "local": b["local"],
+                "alive": b["alive"],
+                "queue_depth": b["queue_depth"],
+                "nodes": len(b["nodes"]),
+                "models": sorted(b["models"]),
+                "inflight": inflight,
+            }
+        )
+    with _comfy_pool_lock:
+        orphans = [{"origin_id": e["origin_id"], "label": e["label"]} for e in _comfy_pool["orphans"]]
+    return {"ok": True, "backends": backends, "orphans": orphans}
+
+
+def comfy_pool_load() -> tuple[int, int]:
+    """(prompts de la landing en curso, backends no marcados como caídos)."""
+    backends = comfy_backends()
+    with _comfy_pool_lock:
+        inflight = sum(len(b["inflight"]) for b in backends) + len(_comfy_pool["orphans"])
+    return inflight, sum(1 for b in backends if b["alive"] is not False)
 
 
 def get_node_input_options(obj_info: dict, node_class: str, input_name: str):
@@ -1626,6 +1789,83 @@ def ollama_create_custom_model(model_name: str, base_model: str, system_prompt:
         return {"ok": False, "message": f"Error creando modelo custom: {exc}"}
 
 
+def _keep_alive_value(raw):
+    # Ollama acepta segundos (int) o duraciones Go ("30m"); "-1" a secas no parsea como string.
+    raw = str(raw).strip()
+    return int(raw) if re.fullmatch(r"-?\d+", raw) else raw
+
+
+def ollama_loaded_models():
+    if not port_open(OLLAMA_PORT):
+        return {"ok": False, "message": "Ollama no está disponible.", "pinned": OLLAMA_PINNED_MODELS}
+    try:
+        data = ollama_api_get("/api/ps")
+    except Exception as exc:
+        return {"ok": False, "message": f"Error consultando /api/ps: {exc}"}
+    models = [
+        {
+            "name": m.get("name", ""),
+            "size": m.get("size", 0),
+            "size_vram": m.get("size_vram", 0),
+            "expires_at": m.get("expires_at", ""),
+        }
+        for m in data.get("models", [])
+        if m.get("name")
+    ]
+    return {"ok": True, "models": models, "pinned": OLLAMA_PINNED_MODELS}
+
+
+def ollama_warm_model(model_name: str, keep_alive=None):
+    if not model_name:
+        return {"ok": False, "message": "Falta el nombre del modelo."}
+    if not _ensure_ollama_up():
+        return {"ok": False, "message": "Ollama no está disponible."}
+    # Un generate sin prompt solo carga el modelo en memoria.
+    payload = {
+        "model": model_name,
+        "keep_alive": _keep_alive_value(
+            OLLAMA_PIN_KEEP_ALIVE if keep_alive is None else keep_alive
+        ),
+    }
+    try:
+        ollama_api_post("/api/generate", payload, timeout=300.0)
+        return {"ok": True, "message": f"Modelo cargado en memoria: {model_name}"}
+    except Exception as exc:
+        return {"ok": False, "message": f"Error precargando {model_name}: {exc}"}
+
+
+def ollama_evict_model(model_name: str = ""):
+    """Descarga un modelo (o todos los cargados si model_name está vacío)."""
+    if not port_open(OLLAMA_PORT):
+        return {"ok": True, "message": "Ollama no está activo; nada que liberar.", "evicted": []}
+    if model_name:
+        names = [model_name]
+    else:
+        loaded = ollama_loaded_models()
+        names = [m["name"] for m in loaded.get("models", [])]
+    evicted, errors = [], []
+    for name in names:
+        try:
+            ollama_api_post("/api/generate", {"model": name, "keep_alive": 0}, timeout=60.0)
+            evicted.append(name)
+        except Exception as exc:
+            errors.append(f"{name}: {exc}")
+    if errors:
+        return {"ok": False, "message": "Error liberando: " + " ; ".join(errors), "evicted": evicted}
+    if not evicted:
+        return {"ok": True, "message": "No había modelos cargados.", "evicted": []}
+    return {"ok": True, "message": f"Modelos liberados: {', '.join(evicted)}", "evicted": evicted}
+
+
+def warm_pinned_models():
+    for name in OLLAMA_PINNED_MODELS:
+        result = ollama_warm_model(name)
+        if result.get("ok"):
+            log.info("Ollama: modelo fijado en memoria: %s", name)
+        else:
+            log.warning("Ollama: no se pudo precargar %s: %s", name, result.get("message"))
+
+
 def _parse_modelfile_preset(path: Path):
     try:
         raw = path.read_text(encoding="utf-8")
@@ -2064,6 +2304,9 @@ def generate_game_tts(
                 ),
             }
 
+        lease = arbiter_acquire("xtts", label=out_name)
+        if not lease.get("ok"):
+            return {"ok": False, "message": lease["message"]}
         try:
             xtts = _get_xtts_model()
             kwargs = {
@@ -2087,298 +2330,1689 @@ def generate_game_tts(
             )
             if not ext.get("ok"):
                 return ext
+        finally:
+            arbiter_release(lease["lease_id"])
     else:
         return {"ok": False, "message": f"Motor no soportado: {engine}"}
 
     if not out_path.exists():
         return {"ok": False, "message": "No se generó el audio de salida."}
 
+    schedule_opus_transcode(out_path)
+    try:
+        catalog_voice_file(
+            out_path,
+            meta={
+                "character": character.get("id", ""),
+                "personality": personality.get("id", ""),
+                "engine": engine,
+                "language": language,
+                "text": text[:200],
+            },
+        )
+    except Exception as exc:
+        log.warning("No se pudo catalogar %s: %s", out_name, exc)
     return {
         "ok": True,
         "path": str(out_path),
         "filename": out_name,
         "audio_url": f"/tools/game-tts/audio/{out_name}",
+        "opus_url": f"/tools/game-tts/audio/{out_name}?format=opus",
         "engine": engine,
         "piper_model": model_path.name if engine == "piper" else "",
     }
 
 
-# --- WORKFLOWS ----------------------------------------------------------------
-def patch_api_workflow(
-    workflow,
-    positive,
-    negative,
-    checkpoint,
-    width,
-    height,
-    frames,
-    fps,
-    steps,
-    cfg,
-    denoise,
-    crf,
-    pix_fmt,
-    seed,
-    output_prefix,
-    wan_model=None,
-    shift=5.0,
-    text_encoder=None,
-    vae=None,
-):
-    wf = json.loads(json.dumps(workflow))
-    ct_map = {}
-    for nid, node in wf.items():
-        if isinstance(node, dict):
-            ct = node.get("class_type", "")
-            ct_map.setdefault(ct, []).append(nid)
+# --- ENTREGA DE AUDIO ---------------------------------------------------------
+# El WAV es el original; para escuchar en remoto se sirve una copia Opus/OGG que se
+# codifica una vez (en segundo plano tras generar, o en la primera petición) y se cachea.
+_AUDIO_POOL = ThreadPoolExecutor(max_workers=1, thread_name_prefix="opus")
+_audio_locks: dict[str, threading.Lock] = {}
+_audio_locks_guard = threading.Lock()
 
-    def patch_node(ct, updates):
-        for nid in ct_map.get(ct, []):
-            wf[nid]["inputs"].update(updates)
 
-    if checkpoint:
-        patch_node("CheckpointLoaderSimple", {"ckpt_name": checkpoint})
+def ffmpeg_available() -> bool:
+    return shutil.which(FFMPEG_BIN) is not None
 
-    for nid in ct_map.get("KSampler", []) + ct_map.get("KSamplerAdvanced", []):
-        node = wf[nid]
-        p_ref = node["inputs"].get("positive")
-        n_ref = node["inputs"].get("negative")
-        if isinstance(p_ref, list) and len(p_ref) == 2:
-            pos_nid = str(p_ref[0])
-            if pos_nid in wf and wf[pos_nid].get("class_type") == "CLIPTextEncode":
-                wf[pos_nid]["inputs"]["text"] = positive
-        if isinstance(n_ref, list) and len(n_ref) == 2:
-            neg_nid = str(n_ref[0])
-            if neg_nid in wf and wf[neg_nid].get("class_type") == "CLIPTextEncode":
-                wf[neg_nid]["inputs"]["text"] = negative
-        node["inputs"].update(
-            {"steps": steps, "cfg": cfg, "seed": seed, "denoise": denoise}
-        )
 
-    patch_node(
-        "EmptyLatentImage", {"width": width, "height": height, "batch_size": frames}
-    )
-    for ct in ("ADE_AnimateDiffLoaderWithContext", "ADE_AnimateDiffLoaderGen1"):
-        patch_node(ct, {"context_length": frames})
-    patch_node(
-        "VHS_VideoCombine",
-        {
-            "frame_rate": fps,
-            "crf": crf,
-            "pix_fmt": pix_fmt,
-            "filename_prefix": output_prefix,
-        },
-    )
+def opus_cache_path(wav_path: Path) -> Path:
+    return AUDIO_CACHE_DIR / f"{wav_path.stem}.ogg"
 
-    if wan_model:
-        patch_node("WanVideoModelLoader", {"model": wan_model})
-    patch_node(
-        "WanVideoSampler", {"shift": shift, "steps": steps, "cfg": cfg, "seed": seed}
-    )
-    if text_encoder:
-        patch_node("LoadWanVideoT5TextEncoder", {"model_name": text_encoder})
-    if vae:
-        patch_node("WanVideoVAELoader", {"model_name": vae})
-    patch_node(
-        "WanVideoTextEncode", {"positive_prompt": positive, "negative_prompt": negative}
+
+def _opus_is_fresh(wav_path: Path, opus_path: Path) -> bool:
+    try:
+        return opus_path.stat().st_mtime >= wav_path.stat().st_mtime
+    except OSError:
+        return False
+
+
+def transcode_to_opus(wav_path: Path) -> Path | None:
+    opus_path = opus_cache_path(wav_path)
+    if _opus_is_fresh(wav_path, opus_path):
+        return opus_path
+    if not wav_path.is_file() or not ffmpeg_available():
+        return None
+    with _audio_locks_guard:
+        lock = _audio_locks.setdefault(opus_path.name, threading.Lock())
+    with lock:
+        if _opus_is_fresh(wav_path, opus_path):
+            return opus_path
+        ensure_dir(AUDIO_CACHE_DIR)
+        tmp_path = opus_path.with_suffix(".tmp.ogg")
+        proc = subprocess.run(
+            [
+                FFMPEG_BIN, "-y", "-loglevel", "error",
+                "-i", str(wav_path),
+                "-c:a", "libopus", "-b:a", AUDIO_OPUS_BITRATE,
+                str(tmp_path),
+            ],
+            text=True,
+            capture_output=True,
+        )
+        if proc.returncode != 0:
+            log.warning("No se pudo codificar %s a Opus: %s", wav_path.name, proc.stderr.strip())
+            tmp_path.unlink(missing_ok=True)
+            return None
+        os.replace(tmp_path, opus_path)
+    with _audio_locks_guard:
+        _audio_locks.pop(opus_path.name, None)
+    return opus_path
+
+
+def schedule_opus_transcode(wav_path: Path):
+    if ffmpeg_available():
+        _AUDIO_POOL.submit(transcode_to_opus, wav_path)
+
+
+def send_audio(path: Path, mimetype: str):
+    # conditional=True: Range (206) para buscar en el reproductor, ETag/Last-Modified (304).
+    resp = send_file(path, mimetype=mimetype, conditional=True, etag=True, max_age=0)
+    resp.headers["Accept-Ranges"] = "bytes"
+    resp.headers["Cache-Control"] = "no-cache"
+    return resp
+
+
+# --- RETENCIÓN DE AUDIO -------------------------------------------------------
+# voice_out recibe un WAV por turno (Game TTS y asistentes de voz). Un catálogo SQLite
+# indexa cada fichero (origen, metadatos, hash); la compactación empaqueta lo antiguo
+# en .tar.xz y las cuotas de edad y tamaño borran lo más viejo primero.
+VOICE_CATALOG_DB = RUN_DIR / "voice_catalog.sqlite"
+VOICE_ARCHIVE_DIR = VOICE_OUT_DIR / "archive"
+VOICE_RETENTION_MAX_GB = float(os.environ.get("VOICE_RETENTION_MAX_GB", "5"))
+VOICE_RETENTION_MAX_FILES = int(os.environ.get("VOICE_RETENTION_MAX_FILES", "2000"))
+VOICE_RETENTION_MAX_AGE_DAYS = float(os.environ.get("VOICE_RETENTION_MAX_AGE_DAYS", "90"))
+VOICE_ARCHIVE_AFTER_DAYS = float(os.environ.get("VOICE_ARCHIVE_AFTER_DAYS", "7"))
+VOICE_RETENTION_INTERVAL_S = float(os.environ.get("VOICE_RETENTION_INTERVAL_S", "3600"))
+
+_voice_catalog_lock = threading.Lock()
+
+
+def _voice_db() -> sqlite3.Connection:
+    ensure_dir(RUN_DIR)
+    conn = sqlite3.connect(VOICE_CATALOG_DB, timeout=10)
+    conn.row_factory = sqlite3.Row
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS voice_files (
+            name TEXT PRIMARY KEY,
+            source TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            mtime REAL NOT NULL,
+            sha1 TEXT NOT NULL,
+            meta TEXT NOT NULL DEFAULT '{}',
+            archive TEXT NOT NULL DEFAULT ''
+        )"""
     )
-    patch_node(
-        "WanVideoEmptyEmbeds", {"width": width, "height": height, "num_frames": frames}
+    conn.execute("CREATE INDEX IF NOT EXISTS voice_files_mtime ON voice_files(archive, mtime)")
+    return conn
+
+
+def _voice_source(name: str) -> str:
+    if name.startswith("game_tts_"):
+        return "game_tts"
+    if name.startswith("reply_"):
+        return "voice_assistant"
+    return "other"
+
+
+def _file_sha1(path: Path) -> str:
+    h = hashlib.sha1()
+    with path.open("rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _upsert_voice_file(conn: sqlite3.Connection, path: Path, meta: dict | None = None):
+    st = path.stat()
+    conn.execute(
+        """INSERT INTO voice_files (name, source, size, mtime, sha1, meta, archive)
+           VALUES (?, ?, ?, ?, ?, ?, '')
+           ON CONFLICT(name) DO UPDATE SET
+               size=excluded.size, mtime=excluded.mtime, sha1=excluded.sha1, archive='',
+               meta=CASE WHEN excluded.meta='{}' THEN voice_files.meta ELSE excluded.meta END""",
+        (
+            path.name,
+            _voice_source(path.name),
+            st.st_size,
+            st.st_mtime,
+            _file_sha1(path),
+            json.dumps(meta or {}, ensure_ascii=False),
+        ),
     )
 
-    return wf
 
+def catalog_voice_file(path: Path, meta: dict | None = None):
+    with _voice_catalog_lock, closing(_voice_db()) as conn:
+        _upsert_voice_file(conn, path, meta)
+        conn.commit()
 
-# --- VIDEO SDXL ---------------------------------------------------------------
-def get_video_preset(preset_id):
-    for p in VIDEO_MODEL_PRESETS:
-        if p["id"] == preset_id:
-            return p
-    return VIDEO_MODEL_PRESETS[0]
+
+def _scan_voice_out(conn: sqlite3.Connection) -> int:
+    # Solo se hashea lo nuevo o modificado; los WAV que escriben los asistentes de voz
+    # (otro proceso) entran aquí.
+    known = {
+        r["name"]: (r["size"], r["mtime"])
+        for r in conn.execute("SELECT name, size, mtime FROM voice_files WHERE archive=''")
+    }
+    seen = set()
+    indexed = 0
+    with os.scandir(VOICE_OUT_DIR) as it:
+        for entry in it:
+            if not entry.is_file() or not entry.name.endswith(".wav"):
+                continue
+            seen.add(entry.name)
+            st = entry.stat()
+            if known.get(entry.name) == (st.st_size, st.st_mtime):
+                continue
+            _upsert_voice_file(conn, Path(entry.path))
+            indexed += 1
+    gone = [(name,) for name in known if name not in seen]
+    conn.executemany("DELETE FROM voice_files WHERE name=? AND archive=''", gone)
+    conn.commit()
+    return indexed
+
+
+def _drop_voice_file(name: str):
+    path = VOICE_OUT_DIR / name
+    path.unlink(missing_ok=True)
+    opus_cache_path(path).unlink(missing_ok=True)
+
+
+def _archive_voice_files(rows: list[sqlite3.Row]) -> int:
+    """Empaqueta rows (name, mtime) en un tar.xz; se comprime sin _voice_catalog_lock."""
+    if not rows:
+        return 0
+    ensure_dir(VOICE_ARCHIVE_DIR)
+    archive_name = f"voice_out_{time.strftime('%Y%m%d_%H%M%S')}_{len(rows)}.tar.xz"
+    tmp_path = VOICE_ARCHIVE_DIR / f"{archive_name}.tmp"
+    packed = []
+    with tarfile.open(tmp_path, "w:xz") as tar:
+        for r in rows:
+            path = VOICE_OUT_DIR / r["name"]
+            if path.is_file():
+                tar.add(path, arcname=r["name"])
+                packed.append((r["name"], r["mtime"]))
+    if not packed:
+        tmp_path.unlink(missing_ok=True)
+        return 0
+    os.replace(tmp_path, VOICE_ARCHIVE_DIR / archive_name)
+    with _voice_catalog_lock, closing(_voice_db()) as conn:
+        # Un WAV reescrito mientras se comprimía conserva su versión nueva en voice_out.
+        packed = [
+            name
+            for name, mtime in packed
+            if conn.execute(
+                "UPDATE voice_files SET archive=? WHERE name=? AND mtime=? AND archive=''",
+                (archive_name, name, mtime),
+            ).rowcount
+        ]
+        conn.commit()
+    # Se borra después de confirmar el catálogo: un corte deja duplicados, no pérdidas.
+    for name in packed:
+        _drop_voice_file(name)
+    return len(packed)
 
 
-def get_smooth_profile(profile_id):
-    for p in VIDEO_SMOOTH_PROFILES:
-        if p["id"] == profile_id:
-            return p
-    return VIDEO_SMOOTH_PROFILES[0]
+def _enforce_voice_quotas(conn: sqlite3.Connection) -> int:
+    now = time.time()
+    age_cutoff = now - VOICE_RETENTION_MAX_AGE_DAYS * 86400
+    budget = VOICE_RETENTION_MAX_GB * 1024**3
+    candidates = [
+        (r["mtime"], "file", r["name"], r["size"])
+        for r in conn.execute("SELECT name, size, mtime FROM voice_files WHERE archive=''")
+    ]
+    # Un archivo cuenta con la fecha de su contenido más reciente, no la de su creación.
+    newest = {
+        r["archive"]: r["m"]
+        for r in conn.execute(
+            "SELECT archive, MAX(mtime) AS m FROM voice_files WHERE archive<>'' GROUP BY archive"
+        )
+    }
+    if VOICE_ARCHIVE_DIR.exists():
+        for p in VOICE_ARCHIVE_DIR.glob("*.tar.xz"):
+            st = p.stat()
+            candidates.append((newest.get(p.name, st.st_mtime), "archive", p.name, st.st_size))
+    total = sum(c[3] for c in candidates)
+    deleted = 0
+    for mtime, kind, name, size in sorted(candidates):
+        if mtime >= age_cutoff and total <= budget:
+            break
+        if kind == "archive":
+            (VOICE_ARCHIVE_DIR / name).unlink(missing_ok=True)
+            deleted += conn.execute("DELETE FROM voice_files WHERE archive=?", (name,)).rowcount
+        else:
+            _drop_voice_file(name)
+            conn.execute("DELETE FROM voice_files WHERE name=?", (name,))
+            deleted += 1
+        total -= size
+    conn.commit()
+    return deleted
+
+
+def voice_out_usage(conn: sqlite3.Connection | None = None) -> dict:
+    if conn is None:
+        with _voice_catalog_lock, closing(_voice_db()) as own:
+            return voice_out_usage(own)
+    usage = {"live": {"files": 0, "bytes": 0}, "archived": {"files": 0, "bytes": 0}, "by_source": {}}
+    for r in conn.execute(
+        "SELECT source, archive<>'' AS archived, COUNT(*) AS n, SUM(size) AS b "
+        "FROM voice_files GROUP BY source, archived"
+    ):
+        bucket = usage["archived" if r["archived"] else "live"]
+        bucket["files"] += r["n"]
+        bucket["bytes"] += r["b"] or 0
+        usage["by_source"][r["source"]] = usage["by_source"].get(r["source"], 0) + r["n"]
+    if VOICE_ARCHIVE_DIR.exists():
+        usage["archive_bytes_on_disk"] = sum(p.stat().st_size for p in VOICE_ARCHIVE_DIR.glob("*.tar.xz"))
+    return usage
+
+
+def compact_voice_out() -> dict:
+    if not VOICE_OUT_DIR.exists():
+        return {"ok": True, "message": "voice_out no existe todavía.", "indexed": 0, "archived": 0, "deleted": 0}
+    # El lock solo cubre el catálogo: la compresión no bloquea a Game TTS (catalog_voice_file).
+    old = []
+    with _voice_catalog_lock, closing(_voice_db()) as conn:
+        indexed = _scan_voice_out(conn)
+        if VOICE_ARCHIVE_AFTER_DAYS > 0:
+            cutoff = time.time() - VOICE_ARCHIVE_AFTER_DAYS * 86400
+            old = conn.execute(
+                "SELECT name, mtime FROM voice_files WHERE archive='' AND mtime<? ORDER BY mtime", (cutoff,)
+            ).fetchall()
+    archived = _archive_voice_files(old)
+    # Cuota de número: lo que sobra sale del directorio (se archiva) aunque sea reciente.
+    with _voice_catalog_lock, closing(_voice_db()) as conn:
+        live = conn.execute("SELECT COUNT(*) FROM voice_files WHERE archive=''").fetchone()[0]
+        extra = conn.execute(
+            "SELECT name, mtime FROM voice_files WHERE archive='' ORDER BY mtime LIMIT ?",
+            (max(0, live - VOICE_RETENTION_MAX_FILES),),
+        ).fetchall()
+    archived += _archive_voice_files(extra)
+    with _voice_catalog_lock, closing(_voice_db()) as conn:
+        deleted = _enforce_voice_quotas(conn)
+        usage = voice_out_usage(conn)
+    return {
+        "ok": True,
+        "message": f"voice_out: {indexed} indexados, {archived} archivados, {deleted} borrados.",
+        "indexed": indexed,
+        "archived": archived,
+        "deleted": deleted,
+        "usage": usage,
+    }
 
 
-def find_checkpoint(include_token):
-    ckpt_dir = COMFY_DIR / "models" / "checkpoints"
-    if not ckpt_dir.exists():
+def _voice_retention_loop():
+    while True:
+        with _jobs_cv:
+            pending = any(
+                j["kind"] == "voice_retention" and j["status"] in ("queued", "running")
+                for j in _jobs.values()
+            )
+        if not pending:
+            enqueue_job("voice_retention", {}, label="voice_out")
+        time.sleep(VOICE_RETENTION_INTERVAL_S)
+
+
+def start_voice_retention():
+    if VOICE_RETENTION_INTERVAL_S <= 0:
+        return
+    threading.Thread(target=_voice_retention_loop, name="voice-retention", daemon=True).start()
+
+
+# --- ARBITRAJE GPU/RAM --------------------------------------------------------
+# Cada trabajo pesado pide un "lease" con su huella aproximada. Los trabajos del mismo
+# grupo no se suman (ComfyUI ejecuta su cola en serie); grupos distintos sí. Si no cabe,
+# el trabajo espera; antes de arrancar se libera Ollama/ComfyUI si la memoria real no llega.
+WORKLOAD_PROFILES = {
+    # swap_s: coste aproximado de descargar y recargar sus modelos (métricas de afinidad).
+    "animatediff_sdxl": {"group": "comfy", "vram_gb": 10.0, "ram_gb": 12.0, "swap_s": 15.0},
+    "wan_1b": {"group": "comfy", "vram_gb": 8.0, "ram_gb": 12.0, "swap_s": 20.0},
+    "wan_14b": {"group": "comfy", "vram_gb": 20.0, "ram_gb": 32.0, "swap_s": 60.0},
+    "xtts": {"group": "tts", "vram_gb": 3.0, "ram_gb": 4.0},
+    "whisper": {
+        "group": "voice",
+        "vram_gb": 2.5 if os.environ.get("WHISPER_DEVICE_DEFAULT", "cpu") == "cuda" else 0.0,
+        "ram_gb": 3.0,
+    },
+}
+
+_arbiter_cv = threading.Condition()
+_arbiter_leases: dict[str, dict] = {}
+_arbiter_state = {"caps": None, "last_comfy_workload": None, "ollama_evicted": False}
+
+
+def _nvidia_smi_memory():
+    try:
+        proc = subprocess.run(
+            [
+                "nvidia-smi",
+                "--query-gpu=memory.total,memory.free",
+                "--format=csv,noheader,nounits",
+            ],
+            capture_output=True,
+            text=True,
+            timeout=5,
+        )
+    except Exception:
         return None
-    token_lower = include_token.lower()
-    for f in ckpt_dir.iterdir():
-        if token_lower in f.name.lower():
-            return f.name
-    return None
+    if proc.returncode != 0 or not proc.stdout.strip():
+        return None
+    total = free = 0.0
+    for line in proc.stdout.strip().splitlines():
+        parts = [x.strip() for x in line.split(",")]
+        if len(parts) != 2:
+            continue
+        try:
+            total += float(parts[0]) / 1024.0
+            free += float(parts[1]) / 1024.0
+        except ValueError:
+            continue
+    return (total, free) if total > 0 else None
 
 
-def resolve_checkpoint_name(obj_info: dict, preset: dict) -> str:
-    ckpt_options = get_node_input_options(
-        obj_info, "CheckpointLoaderSimple", "ckpt_name"
+def _meminfo_memory():
+    try:
+        raw = Path("/proc/meminfo").read_text()
+    except Exception:
+        return None
+    vals = {}
+    for line in raw.splitlines():
+        m = re.match(r"^(\w+):\s+(\d+)\s*kB", line)
+        if m:
+            vals[m.group(1)] = int(m.group(2)) / (1024.0 * 1024.0)
+    if "MemTotal" not in vals:
+        return None
+    return vals["MemTotal"], vals.get("MemAvailable", vals.get("MemFree", 0.0))
+
+
+def memory_capacity() -> dict:
+    """Modo (gpu/cpu) y capacidad total en GB; se detecta una vez."""
+    caps = _arbiter_state["caps"]
+    if caps is not None:
+        return caps
+    gpu = _nvidia_smi_memory()
+    mode = os.environ.get("LANDING_MEMORY_MODE", "gpu" if gpu else "cpu")
+    if mode == "gpu" and gpu:
+        total = gpu[0]
+    else:
+        mode = "cpu"
+        ram = _meminfo_memory()
+        total = ram[0] if ram else 0.0
+    override = os.environ.get("LANDING_MEMORY_BUDGET_GB", "").strip()
+    if override:
+        total = float(override)
+    caps = {"mode": mode, "total_gb": total}
+    _arbiter_state["caps"] = caps
+    log.info("Arbitraje de memoria: modo=%s total=%.1f GB", mode, total)
+    return caps
+
+
+def memory_free_gb():
+    reading = _nvidia_smi_memory() if memory_capacity()["mode"] == "gpu" else _meminfo_memory()
+    return reading[1] if reading else None
+
+
+def _workload_need(workload: str) -> float:
+    prof = WORKLOAD_PROFILES.get(workload, {})
+    key = "vram_gb" if memory_capacity()["mode"] == "gpu" else "ram_gb"
+    return float(prof.get(key, 0.0))
+
+
+def _committed_gb(extra_workload: str | None = None, voice_up: bool = False) -> float:
+    # Dentro de un grupo cuenta solo el trabajo más grande. voice_up se sondea antes de
+    # tomar _arbiter_cv: un connect bajo el lock serializaría todos los acquire/release.
+    per_group: dict[str, float] = {}
+    workloads = [lease["workload"] for lease in _arbiter_leases.values()]
+    if extra_workload:
+        workloads.append(extra_workload)
+    if voice_up:
+        workloads.append("whisper")
+    for w in workloads:
+        group = WORKLOAD_PROFILES.get(w, {}).get("group", w)
+        per_group[group] = max(per_group.get(group, 0.0), _workload_need(w))
+    return sum(per_group.values())
+
+
+def comfy_free_memory() -> bool:
+    local = comfy_local_backend()
+    if local is None:
+        return False
+    try:
+        comfy_api_post("/free", {"unload_models": True, "free_memory": True}, local)
+        return True
+    except Exception as exc:
+        log.warning("ComfyUI /free falló: %s", exc)
+        return False
+
+
+def _group_busy(group: str, exclude: str) -> bool:
+    return any(
+        WORKLOAD_PROFILES.get(lease["workload"], {}).get("group") == group
+        for lid, lease in _arbiter_leases.items()
+        if lid != exclude
     )
-    if not ckpt_options:
-        return preset["checkpoint"]
 
-    wanted = preset.get("checkpoint", "")
-    if wanted in ckpt_options:
-        return wanted
-    wanted_lower = wanted.lower()
-    for ck in ckpt_options:
-        if ck.lower() == wanted_lower:
-            return ck
 
-    include_token = preset.get("include_token", "").lower()
-    if include_token:
-        for ck in ckpt_options:
-            if include_token in ck.lower():
-                return ck
+def _reclaim_memory(lease_id: str, workload: str, voice_up: bool) -> list[str]:
+    need = _workload_need(workload)
+    group = WORKLOAD_PROFILES.get(workload, {}).get("group", workload)
+    actions = []
+    free = memory_free_gb()
+    if free is None or free >= need:
+        return actions
+
+    # Con la UI de voz abierta su LLM está en plena conversación (y whisper ya se cuenta
+    # en el presupuesto): no se le descarga el modelo.
+    if not voice_up and (OLLAMA_PINNED_MODELS or port_open(OLLAMA_PORT)):
+        res = ollama_evict_model("")
+        if res.get("evicted"):
+            actions.append("ollama_evict:" + ",".join(res["evicted"]))
+            with _arbiter_cv:
+                _arbiter_state["ollama_evicted"] = True
+        free = memory_free_gb()
+        if free is not None and free >= need:
+            return actions
+
+    # Solo liberamos ComfyUI si está ocioso y el trabajo no reutiliza sus modelos cargados.
+    with _arbiter_cv:
+        comfy_busy = _group_busy("comfy", lease_id)
+        same_models = group == "comfy" and _arbiter_state["last_comfy_workload"] == workload
+    if port_open(COMFY_PORT) and not comfy_busy and not same_models:
+        if comfy_free_memory():
+            actions.append("comfy_free")
+    return actions
+
+
+def arbiter_acquire(workload: str, label: str = "", timeout: float | None = None) -> dict:
+    """Reserva memoria para workload; espera si choca con otros trabajos."""
+    if timeout is None:
+        timeout = float(os.environ.get("LANDING_ARBITER_WAIT_S", "1800"))
+    caps = memory_capacity()
+    budget = caps["total_gb"] - float(os.environ.get("LANDING_MEMORY_RESERVE_GB", "1.0"))
+    lease_id = f"{workload}-{time.time_ns()}"
+    deadline = time.time() + timeout
+    while True:
+        voice_up = port_open(VOICE_PORT)
+        with _arbiter_cv:
+            # Entra si cabe, si no añade huella (mismo grupo) o si no hay nada activo.
+            committed_with = _committed_gb(workload, voice_up)
+            if (
+                not _arbiter_leases
+                or committed_with <= budget
+                or committed_with <= _committed_gb(voice_up=voice_up)
+            ):
+                _arbiter_leases[lease_id] = {
+                    "id": lease_id,
+                    "workload": workload,
+                    "label": label,
+                    "since": time.time(),
+                }
+                break
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return {
+                    "ok": False,
+                    "message": (
+                        f"Memoria ocupada por otros trabajos ({', '.join(sorted(l['workload'] for l in _arbiter_leases.values()))}); "
+                        f"{workload} no cabe en {caps['total_gb']:.1f} GB."
+                    ),
+                }
+            _arbiter_cv.wait(timeout=min(5.0, remaining))
 
-    return ckpt_options[0]
+    actions = _reclaim_memory(lease_id, workload, voice_up)
+    if WORKLOAD_PROFILES.get(workload, {}).get("group") == "comfy":
+        with _arbiter_cv:
+            _arbiter_state["last_comfy_workload"] = workload
+    if actions:
+        log.info("Arbitraje %s: %s", workload, ", ".join(actions))
+    return {"ok": True, "lease_id": lease_id, "actions": actions}
 
 
-def resolve_animatediff_motion(obj_info: dict, checkpoint_name: str = ""):
-    node_name = "ADE_AnimateDiffLoaderWithContext"
-    if node_name not in obj_info:
-        node_name = "ADE_AnimateDiffLoaderGen1"
-    model_options = get_node_input_options(obj_info, node_name, "model_name")
-    beta_options = get_node_input_options(obj_info, node_name, "beta_schedule")
+def arbiter_release(lease_id: str):
+    if not lease_id:
+        return
+    with _arbiter_cv:
+        lease = _arbiter_leases.pop(lease_id, None)
+        # Tras liberar el último trabajo pesado, devolvemos a memoria los modelos fijados.
+        rewarm = (
+            lease is not None and not _arbiter_leases and _arbiter_state["ollama_evicted"] and bool(OLLAMA_PINNED_MODELS)
+        )
+        if rewarm:
+            _arbiter_state["ollama_evicted"] = False
+        _arbiter_cv.notify_all()
+    if rewarm:
+        threading.Thread(target=warm_pinned_models, daemon=True).start()
 
-    model_name = ""
-    if model_options:
-        ckpt_lower = checkpoint_name.lower()
 
-        # Si el checkpoint es SDXL, forzamos motion model SDXL.
-        if "sdxl" in ckpt_lower or "xl" in ckpt_lower:
-            for preferred in ("mm_sdxl_v10_beta.ckpt", "mm_sdxl_v10_beta.safetensors"):
-                if preferred in model_options:
-                    model_name = preferred
-                    break
-            if not model_name:
-                for m in model_options:
-                    if "sdxl" in m.lower():
-                        model_name = m
-                        break
+def comfy_submit_prompt(prompt: dict, workload: str, label: str = "", force: bool = False) -> dict:
+    """POST /prompt al backend capaz menos cargado; en el local, bajo un lease del árbitro.
 
-        if not model_name:
-            model_name = model_options[0]
+    El lease y el seguimiento del prompt duran hasta que aparece en /history; si su
+    backend cae antes, el monitor del pool lo reenvía a otro con el mismo workflow.
+    Sin force, un grafo ya renderizado (o en curso) no se vuelve a enviar. Un grafo que
+    no pasa la validación local lanza ComfyPromptError sin llegar a ningún backend.
+    """
+    validate_before_submit(prompt)
+    graph_hash = render_graph_hash(prompt)
+    if RENDER_CACHE_ENABLED and not force:
+        hit = lookup_render_cache(graph_hash)
+        if hit:
+            return {
+                "prompt_id": hit["prompt_id"],
+                "cached": True,
+                "backend": hit["backend"],
+                "outputs": hit["outputs"],
+                "output_prefix": hit["label"],
+            }
+        pending = _inflight_render(graph_hash)
+        if pending:
+            return {
+                "prompt_id": pending["origin_id"],
+                "deduplicated": True,
+                "backend": pending["backend"],
+                "output_prefix": pending["label"],
+            }
+    backend = pick_comfy_backend(prompt)
+    if backend is None:
+        raise RuntimeError("Ningún backend ComfyUI activo tiene los nodos y modelos de este workflow.")
+    lease_id = ""
+    if backend["local"]:
+        lease = arbiter_acquire(workload, label=label)
+        if not lease.get("ok"):
+            raise RuntimeError(lease["message"])
+        lease_id = lease["lease_id"]
+    try:
+        response = comfy_api_post("/prompt", {"prompt": prompt}, backend)
+    except Exception:
+        arbiter_release(lease_id)
+        raise
+    prompt_id = response.get("prompt_id")
+    if not prompt_id:
+        arbiter_release(lease_id)
+        return response
+    entry = {
+        "origin_id": prompt_id,
+        "prompt": prompt,
+        "workload": workload,
+        "label": label,
+        "lease_id": lease_id,
+        "submitted": time.time(),
+        "attempts": 1,
+        "backend": backend["id"],
+        "graph_hash": graph_hash,
+    }
+    backend["last_models"] = _prompt_requirements(prompt)[1]
+    _track_comfy_prompt(backend, prompt_id, entry)
+    return {**response, "backend": backend["id"]}
 
-    beta_schedule = "autoselect"
-    if beta_options and beta_schedule not in beta_options:
-        beta_schedule = beta_options[0]
 
-    return model_name, beta_schedule
+def wan_workload_for(model_name: str) -> str:
+    return "wan_14b" if "14b" in (model_name or "").lower() else "wan_1b"
 
 
-def default_video_form():
-    profile = VIDEO_SMOOTH_PROFILES[0]
+def arbiter_status() -> dict:
+    caps = memory_capacity()
+    voice_up = port_open(VOICE_PORT)
+    with _arbiter_cv:
+        leases = [dict(lease) for lease in _arbiter_leases.values()]
+        committed = _committed_gb(voice_up=voice_up)
     return {
-        "model_preset": VIDEO_MODEL_PRESETS[0]["id"],
-        "smooth_profile": profile["id"],
-        "positive_prompt": "",
-        "negative_prompt": "worst quality, low quality, lowres, blurry, deformed, watermark",
-        "width": profile["width"],
-        "height": profile["height"],
-        "frames": profile["frames"],
-        "fps": profile["fps"],
-        "steps": profile["steps"],
-        "cfg": profile["cfg"],
-        "denoise": profile["denoise"],
-        "crf": profile["crf"],
-        "pix_fmt": profile["pix_fmt"],
-        "seed": random.randint(0, 2**31),
+        "ok": True,
+        "mode": caps["mode"],
+        "total_gb": round(caps["total_gb"], 2),
+        "free_gb": memory_free_gb(),
+        "committed_gb": round(committed, 2),
+        "leases": leases,
+        "workloads": WORKLOAD_PROFILES,
     }
 
 
-def build_video_prompt(
-    checkpoint,
-    motion_model,
-    beta_schedule,
-    positive,
-    negative,
-    width,
-    height,
-    frames,
-    fps,
-    steps,
-    cfg,
-    denoise,
-    crf,
-    pix_fmt,
-    seed,
-    output_prefix,
-):
+# --- CACHÉ DE RENDERS ---------------------------------------------------------
+# Un grafo API idéntico (mismo prompt, seed y parámetros) produce el mismo vídeo. Se indexa
+# el hash canónico del grafo, sin filename_prefix (lleva timestamp), con las salidas que
+# ComfyUI anota en /history; un envío repetido devuelve esas salidas sin renderizar.
+RENDER_CACHE_DB = RUN_DIR / "render_cache.sqlite"
+RENDER_CACHE_ENABLED = os.environ.get("RENDER_CACHE", "1") == "1"
+_RENDER_HASH_IGNORED = ("filename_prefix", "_meta")
+_render_cache_lock = threading.Lock()
+
+
+def render_graph_hash(prompt: dict) -> str:
+    def _canonical(value):
+        if isinstance(value, dict):
+            return {k: _canonical(v) for k, v in value.items() if k not in _RENDER_HASH_IGNORED}
+        if isinstance(value, list):
+            return [_canonical(v) for v in value]
+        return value
+
+    raw = json.dumps(_canonical(prompt), sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _render_cache_db() -> sqlite3.Connection:
+    ensure_dir(RUN_DIR)
+    conn = sqlite3.connect(RENDER_CACHE_DB, timeout=10)
+    conn.row_factory = sqlite3.Row
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS render_cache (
+            hash TEXT PRIMARY KEY,
+            prompt_id TEXT NOT NULL,
+            backend TEXT NOT NULL,
+            label TEXT NOT NULL DEFAULT '',
+            outputs TEXT NOT NULL,
+            created REAL NOT NULL,
+            hits INTEGER NOT NULL DEFAULT 0
+        )"""
+    )
+    return conn
+
+
+def _history_output_files(history_entry: dict) -> list[dict]:
+    files = []
+    for node_id, out in (history_entry.get("outputs") or {}).items():
+        for items in out.values():
+            if not isinstance(items, list):
+                continue
+            for item in items:
+                if isinstance(item, dict) and item.get("filename") and item.get("type", "output") == "output":
+                    files.append(
+                        {
+                            "node": node_id,
+                            "filename": item["filename"],
+                            "subfolder": item.get("subfolder", ""),
+                            "type": "output",
+                        }
+                    )
+    return files
+
+
+def record_render_outputs(graph_hash: str, prompt_id: str, backend_id: str, label: str, history_entry: dict):
+    status = (history_entry.get("status") or {}).get("status_str", "success")
+    files = _history_output_files(history_entry)
+    if status != "success" or not files:
+        return
+    with _render_cache_lock, closing(_render_cache_db()) as conn:
+        conn.execute(
+            """INSERT OR REPLACE INTO render_cache (hash, prompt_id, backend, label, outputs, created, hits)
+               VALUES (?, ?, ?, ?, ?, ?, 0)""",
+            (graph_hash, prompt_id, backend_id, label, json.dumps(files, ensure_ascii=False), time.time()),
+        )
+        conn.commit()
+
+
+def _render_output_exists(backend: dict | None, item: dict) -> bool:
+    if backend is None:
+        return False
+    if backend["local"]:
+        return (COMFY_DIR / "output" / item["subfolder"] / item["filename"]).is_file()
+    query = urlencode({"filename": item["filename"], "subfolder": item["subfolder"], "type": item["type"]})
+    req = urlrequest.Request(f"{backend['url']}/view?{query}", method="HEAD")
+    try:
+        with urlrequest.urlopen(req, timeout=5) as resp:
+            return resp.status == 200
+    except Exception:
+        return False
+
+
+def lookup_render_cache(graph_hash: str) -> dict | None:
+    """Entrada de caché cuyas salidas siguen existiendo; las huérfanas se eliminan."""
+    with _render_cache_lock, closing(_render_cache_db()) as conn:
+        row = conn.execute("SELECT * FROM render_cache WHERE hash=?", (graph_hash,)).fetchone()
+    if row is None:
+        return None
+    outputs = json.loads(row["outputs"])
+    backend = next((b for b in comfy_backends() if b["id"] == row["backend"]), None)
+    valid = all(_render_output_exists(backend, item) for item in outputs)
+    with _render_cache_lock, closing(_render_cache_db()) as conn:
+        if valid:
+            conn.execute("UPDATE render_cache SET hits=hits+1 WHERE hash=?", (graph_hash,))
+        else:
+            conn.execute("DELETE FROM render_cache WHERE hash=?", (graph_hash,))
+        conn.commit()
+    if not valid:
+        log.info("Caché de render %s descartada: faltan sus salidas.", graph_hash[:12])
+        return None
+    return {"prompt_id": row["prompt_id"], "backend": row["backend"], "label": row["label"], "outputs": outputs}
+
+
+def _inflight_render(graph_hash: str) -> dict | None:
+    backends = comfy_backends()
+    with _comfy_pool_lock:
+        for b in backends:
+            for entry in b["inflight"].values():
+                if entry.get("graph_hash") == graph_hash:
+                    return dict(entry)
+        return next((dict(e) for e in _comfy_pool["orphans"] if e.get("graph_hash") == graph_hash), None)
+
+
+def render_cache_result(result: dict, response: dict) -> dict:
+    """Ajusta el resultado de un submit cuando el grafo salió de caché o ya estaba en curso."""
+    result["backend"] = response.get("backend")
+    if response.get("cached"):
+        result.update(
+            message="Este grafo ya se renderizó: se devuelve el vídeo existente (marca re-render para repetirlo).",
+            cached=True,
+            output_prefix=response["output_prefix"],
+            outputs=[f"{o['subfolder']}/{o['filename']}".lstrip("/") for o in response["outputs"]],
+        )
+    elif response.get("deduplicated"):
+        result.update(
+            message="Este mismo grafo ya se está renderizando; se reutiliza ese prompt.",
+            deduplicated=True,
+            output_prefix=response["output_prefix"],
+        )
+    return result
+
+
+def render_cache_stats(limit: int = 20) -> dict:
+    with _render_cache_lock, closing(_render_cache_db()) as conn:
+        total = conn.execute("SELECT COUNT(*) AS n, COALESCE(SUM(hits), 0) AS hits FROM render_cache").fetchone()
+        recent = conn.execute(
+            "SELECT hash, prompt_id, backend, label, created, hits FROM render_cache ORDER BY created DESC LIMIT ?",
+            (limit,),
+        ).fetchall()
     return {
-        "1": {
-            "class_type": "CheckpointLoaderSimple",
-            "inputs": {"ckpt_name": checkpoint},
-        },
-        "2": {
-            "class_type": "CLIPTextEncode",
-            "inputs": {"text": positive, "clip": ["1", 1]},
-        },
-        "3": {
-            "class_type": "CLIPTextEncode",
-            "inputs": {"text": negative, "clip": ["1", 1]},
-        },
-        "4": {
-            "class_type": "EmptyLatentImage",
-            "inputs": {"width": width, "height": height, "batch_size": frames},
-        },
-        "5": {
-            "class_type": "ADE_AnimateDiffLoaderWithContext",
-            "inputs": {
-                "model": ["1", 0],
-                "model_name": motion_model,
-                "beta_schedule": beta_schedule,
-            },
-        },
-        "6": {
-            "class_type": "KSampler",
-            "inputs": {
-                "model": ["5", 0],
-                "positive": ["2", 0],
-                "negative": ["3", 0],
-                "latent_image": ["4", 0],
-                "seed": seed,
-                "steps": steps,
-                "cfg": cfg,
-                "sampler_name": "euler",
-                "scheduler": "karras",
-                "denoise": denoise,
-            },
-        },
-        "7": {
-            "class_type": "VAEDecode",
-            "inputs": {"samples": ["6", 0], "vae": ["1", 2]},
-        },
-        "8": {
-            "class_type": "VHS_VideoCombine",
-            "inputs": {
-                "images": ["7", 0],
-                "frame_rate": fps,
-                "loop_count": 0,
-                "filename_prefix": output_prefix,
-                "format": "video/h264-mp4",
-                "pix_fmt": pix_fmt,
-                "crf": crf,
-                "save_metadata": True,
-                "trim_to_audio": False,
-                "pingpong": False,
-                "save_output": True,
+        "ok": True,
+        "enabled": RENDER_CACHE_ENABLED,
+        "entries": total["n"],
+        "hits": total["hits"],
+        "recent": [dict(r) for r in recent],
+    }
+
+
+# --- GALERÍA DE RENDERS -------------------------------------------------------
+# Catálogo SQLite de los vídeos que deja ComfyUI (local) bajo los prefijos de la landing.
+# Se indexa por (tamaño, mtime) de forma incremental; el póster JPG y la vista previa
+# animada WebP se extraen una vez con ffmpeg en segundo plano y quedan en RUN_DIR/thumbs
+# con una clave que cambia si el vídeo cambia. La galería pagina sin cargar vídeos.
+GALLERY_DB = RUN_DIR / "output_catalog.sqlite"
+GALLERY_THUMB_DIR = RUN_DIR / "thumbs"
+GALLERY_PREFIXES = ("video_output", "wan_output", "wan_i2v", "wan_long", "postproc")
+GALLERY_SCAN_INTERVAL_S = float(os.environ.get("GALLERY_SCAN_INTERVAL_S", "30"))
+GALLERY_THUMB_WORKERS = max(1, int(os.environ.get("GALLERY_THUMB_WORKERS", "2")))
+GALLERY_THUMB_WIDTH = int(os.environ.get("GALLERY_THUMB_WIDTH", "320"))
+GALLERY_PREVIEW_S = float(os.environ.get("GALLERY_PREVIEW_S", "3"))
+VIDEO_EXTS = (".mp4", ".webm", ".mkv", ".mov")
+
+# ffmpeg corre en su propio proceso: los hilos del pool solo esperan a que termine.
+_GALLERY_POOL = ThreadPoolExecutor(max_workers=GALLERY_THUMB_WORKERS, thread_name_prefix="thumbs")
+_gallery_lock = threading.Lock()
+_gallery_state: dict[str, Any] = {"scanned": 0.0, "pending": set()}
+
+
+def _gallery_db() -> sqlite3.Connection:
+    ensure_dir(RUN_DIR)
+    conn = sqlite3.connect(GALLERY_DB, timeout=10)
+    conn.row_factory = sqlite3.Row
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS outputs (
+            path TEXT PRIMARY KEY,
+            prefix TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            mtime REAL NOT NULL,
+            thumb_key TEXT NOT NULL,
+            poster INTEGER NOT NULL DEFAULT 0,
+            preview INTEGER NOT NULL DEFAULT 0,
+            error TEXT NOT NULL DEFAULT ''
+        )"""
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS outputs_mtime ON outputs(prefix, mtime)")
+    return conn
+
+
+def _gallery_thumb_paths(thumb_key: str) -> tuple[Path, Path]:
+    return GALLERY_THUMB_DIR / f"{thumb_key}.jpg", GALLERY_THUMB_DIR / f"{thumb_key}.webp"
+
+
+def _drop_gallery_thumbs(thumb_key: str):
+    for path in _gallery_thumb_paths(thumb_key):
+        path.unlink(missing_ok=True)
+
+
+def _scan_gallery(conn: sqlite3.Connection) -> int:
+    known = {r["path"]: (r["size"], r["mtime"], r["thumb_key"]) for r in conn.execute("SELECT * FROM outputs")}
+    out_dir = COMFY_DIR / "output"
+    seen = set()
+    indexed = 0
+    for prefix in GALLERY_PREFIXES:
+        for root, dirs, files in os.walk(out_dir / prefix):
+            # Directorios de trabajo (.segmentos del vídeo largo) y ocultos fuera.
+            dirs[:] = [d for d in dirs if not d.startswith(".")]
+            for name in files:
+                if name.startswith(".") or not name.lower().endswith(VIDEO_EXTS):
+                    continue
+                full = Path(root) / name
+                rel = full.relative_to(out_dir).as_posix()
+                seen.add(rel)
+                st = full.stat()
+                old = known.get(rel)
+                if old and old[:2] == (st.st_size, st.st_mtime):
+                    continue
+                if old:
+                    _drop_gallery_thumbs(old[2])
+                key = hashlib.sha1(f"{rel}:{st.st_size}:{st.st_mtime}".encode()).hexdigest()[:20]
+                conn.execute(
+                    """INSERT OR REPLACE INTO outputs (path, prefix, size, mtime, thumb_key, poster, preview, error)
+                       VALUES (?, ?, ?, ?, ?, 0, 0, '')""",
+                    (rel, prefix, st.st_size, st.st_mtime, key),
+                )
+                indexed += 1
+    for rel, (_, _, key) in known.items():
+        if rel not in seen:
+            _drop_gallery_thumbs(key)
+            conn.execute("DELETE FROM outputs WHERE path=?", (rel,))
+    conn.commit()
+    return indexed
+
+
+def refresh_output_catalog(force: bool = False) -> int:
+    """Reindexa si el último escaneo tiene más de GALLERY_SCAN_INTERVAL_S (o si force)."""
+    with _gallery_lock:
+        if not force and time.time() - _gallery_state["scanned"] < GALLERY_SCAN_INTERVAL_S:
+            return 0
+        with closing(_gallery_db()) as conn:
+            indexed = _scan_gallery(conn)
+        _gallery_state["scanned"] = time.time()
+    if indexed:
+        log.info("Galería: %s vídeos nuevos o modificados indexados", indexed)
+    return indexed
+
+
+def invalidate_output_catalog():
+    # Un render terminado: el siguiente listado vuelve a escanear.
+    _gallery_state["scanned"] = 0.0
+
+
+def _run_ffmpeg(args: list[str], dest: Path) -> str:
+    tmp_path = dest.with_name(f".{dest.name}")
+    proc = subprocess.run(
+        [FFMPEG_BIN, "-y", "-loglevel", "error", *args, str(tmp_path)], text=True, capture_output=True
+    )
+    if proc.returncode != 0 or not tmp_path.is_file():
+        tmp_path.unlink(missing_ok=True)
+        return proc.stderr.strip() or "ffmpeg no generó salida"
+    os.replace(tmp_path, dest)
+    return ""
+
+
+def _make_gallery_thumbs(rel: str, thumb_key: str):
+    src = COMFY_DIR / "output" / rel
+    poster, preview = _gallery_thumb_paths(thumb_key)
+    ensure_dir(GALLERY_THUMB_DIR)
+    scale = f"scale={GALLERY_THUMB_WIDTH}:-2"
+    errors = []
+    try:
+        err = _run_ffmpeg(["-i", str(src), "-frames:v", "1", "-vf", scale, "-q:v", "4"], poster)
+        if err:
+            errors.append(f"póster: {err}")
+        err = _run_ffmpeg(
+            [
+                "-t", str(GALLERY_PREVIEW_S), "-i", str(src), "-an",
+                "-vf", f"fps=8,{scale}", "-c:v", "libwebp", "-quality", "60", "-loop", "0",
+            ],
+            preview,
+        )
+        if err:
+            errors.append(f"vista previa: {err}")
+        with _gallery_lock, closing(_gallery_db()) as conn:
+            conn.execute(
+                "UPDATE outputs SET poster=?, preview=?, error=? WHERE path=? AND thumb_key=?",
+                (int(poster.is_file()), int(preview.is_file()), "; ".join(errors)[:500], rel, thumb_key),
+            )
+            conn.commit()
+    finally:
+        with _gallery_lock:
+            _gallery_state["pending"].discard(thumb_key)
+
+
+def schedule_gallery_thumbs(rows: list[dict]) -> int:
+    """Encola la extracción de miniaturas de las filas que aún no tienen; devuelve cuántas."""
+    if not ffmpeg_available():
+        return 0
+    queued = 0
+    with _gallery_lock:
+        for row in rows:
+            if row["poster"] or row["error"] or row["thumb_key"] in _gallery_state["pending"]:
+                continue
+            _gallery_state["pending"].add(row["thumb_key"])
+            _GALLERY_POOL.submit(_make_gallery_thumbs, row["path"], row["thumb_key"])
+            queued += 1
+    return queued
+
+
+def gallery_page(page: int = 1, per_page: int = 24, prefix: str = "") -> dict:
+    refresh_output_catalog()
+    page = max(1, page)
+    per_page = max(1, min(100, per_page))
+    where, params = ("WHERE prefix=?", [prefix]) if prefix in GALLERY_PREFIXES else ("", [])
+    with _gallery_lock, closing(_gallery_db()) as conn:
+        total = conn.execute(f"SELECT COUNT(*) FROM outputs {where}", params).fetchone()[0]
+        rows = [
+            dict(r)
+            for r in conn.execute(
+                f"SELECT * FROM outputs {where} ORDER BY mtime DESC LIMIT ? OFFSET ?",
+                (*params, per_page, (page - 1) * per_page),
+            )
+        ]
+    # Solo se extraen miniaturas de lo que se está mirando.
+    schedule_gallery_thumbs(rows)
+    items = []
+    for r in rows:
+        name = r["path"].rsplit("/", 1)[-1]
+        items.append(
+            {
+                "path": r["path"],
+                "prefix": r["prefix"],
+                "take": next((t for t in ("draft", "final") if name.startswith(f"{t}_")), ""),
+                "size": r["size"],
+                "mtime": r["mtime"],
+                "video_url": f"/api/gallery/video/{r['path']}",
+                "poster_url": f"/api/gallery/thumbs/{r['thumb_key']}.jpg" if r["poster"] else None,
+                "preview_url": f"/api/gallery/thumbs/{r['thumb_key']}.webp" if r["preview"] else None,
+                "thumbs": "ready" if r["poster"] else "error" if r["error"] else "pending",
+            }
+        )
+    return {
+        "ok": True,
+        "page": page,
+        "per_page": per_page,
+        "total": total,
+        "pages": max(1, -(-total // per_page)),
+        "prefixes": list(GALLERY_PREFIXES),
+        "ffmpeg": ffmpeg_available(),
+        "items": items,
+    }
+
+
+def gallery_video_path(rel: str) -> Path | None:
+    out_dir = (COMFY_DIR / "output").resolve()
+    path = (out_dir / rel).resolve()
+    if not path.is_relative_to(out_dir):
+        return None
+    # rel "." o "" resuelve a la propia raíz de salida: sin partes no hay prefijo.
+    parts = path.relative_to(out_dir).parts
+    if not parts or parts[0] not in GALLERY_PREFIXES:
+        return None
+    return path if path.is_file() and path.suffix.lower() in VIDEO_EXTS else None
+
+
+# --- CATÁLOGO DE IMÁGENES DE ENTRADA -----------------------------------------
+# ComfyUI/input indexado en SQLite (tamaño, mtime y hash de contenido) para la
+# herramienta I2V: listado paginado con búsqueda y miniaturas cacheadas. Las subidas se
+# deduplican por hash y se guardan ya ajustadas a la resolución del perfil (PNG), así
+# ComfyUI no reescala un original de 20 MP en cada job.
+INPUT_CATALOG_DB = RUN_DIR / "input_catalog.sqlite"
+INPUT_THUMB_DIR = GALLERY_THUMB_DIR / "inputs"
+INPUT_IMAGE_EXTS = (".png", ".jpg", ".jpeg", ".webp", ".bmp")
+INPUT_CATALOG_SCAN_S = float(os.environ.get("INPUT_CATALOG_SCAN_S", "30"))
+INPUT_UPLOAD_MAX_MB = float(os.environ.get("INPUT_UPLOAD_MAX_MB", "25"))
+INPUT_THUMB_WIDTH = 160
+
+_input_catalog_lock = threading.Lock()
+_input_catalog_state: dict[str, Any] = {"scanned": 0.0, "pending": set()}
+
+
+def _input_catalog_db() -> sqlite3.Connection:
+    ensure_dir(RUN_DIR)
+    conn = sqlite3.connect(INPUT_CATALOG_DB, timeout=10)
+    conn.row_factory = sqlite3.Row
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS input_images (
+            name TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            mtime REAL NOT NULL,
+            sha1 TEXT NOT NULL,
+            source_sha1 TEXT NOT NULL DEFAULT '',
+            target TEXT NOT NULL DEFAULT '',
+            thumb_key TEXT NOT NULL,
+            thumb INTEGER NOT NULL DEFAULT 0,
+            error TEXT NOT NULL DEFAULT ''
+        )"""
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS input_images_sha1 ON input_images(sha1)")
+    conn.execute("CREATE INDEX IF NOT EXISTS input_images_source ON input_images(source_sha1, target)")
+    return conn
+
+
+def _upsert_input_image(conn: sqlite3.Connection, name: str, source_sha1: str = "", target: str = ""):
+    path = COMFY_DIR / "input" / name
+    st = path.stat()
+    old = conn.execute("SELECT thumb_key FROM input_images WHERE name=?", (name,)).fetchone()
+    if old:
+        (INPUT_THUMB_DIR / f"{old['thumb_key']}.jpg").unlink(missing_ok=True)
+    conn.execute(
+        """INSERT INTO input_images (name, size, mtime, sha1, source_sha1, target, thumb_key, thumb, error)
+           VALUES (?, ?, ?, ?, ?, ?, ?, 0, '')
+           ON CONFLICT(name) DO UPDATE SET
+               size=excluded.size, mtime=excluded.mtime, sha1=excluded.sha1, thumb_key=excluded.thumb_key,
+               thumb=0, error='',
+               source_sha1=CASE WHEN excluded.source_sha1='' THEN input_images.source_sha1 ELSE excluded.source_sha1 END,
+               target=CASE WHEN excluded.target='' THEN input_images.target ELSE excluded.target END""",
+        (
+            name,
+            st.st_size,
+            st.st_mtime,
+            _file_sha1(path),
+            source_sha1,
+            target,
+            hashlib.sha1(f"{name}:{st.st_size}:{st.st_mtime}".encode()).hexdigest()[:20],
+        ),
+    )
+
+
+def _scan_input_images(conn: sqlite3.Connection) -> int:
+    # Solo se hashea lo nuevo o modificado (imágenes copiadas a mano también entran).
+    input_dir = COMFY_DIR / "input"
+    known = {r["name"]: (r["size"], r["mtime"], r["thumb_key"]) for r in conn.execute("SELECT * FROM input_images")}
+    seen = set()
+    indexed = 0
+    for root, dirs, files in os.walk(input_dir):
+        dirs[:] = [d for d in dirs if not d.startswith(".")]
+        for fname in files:
+            if fname.startswith(".") or not fname.lower().endswith(INPUT_IMAGE_EXTS):
+                continue
+            full = Path(root) / fname
+            name = full.relative_to(input_dir).as_posix()
+            seen.add(name)
+            st = full.stat()
+            if known.get(name, ())[:2] == (st.st_size, st.st_mtime):
+                continue
+            _upsert_input_image(conn, name)
+            indexed += 1
+    for name, (_, _, key) in known.items():
+        if name not in seen:
+            (INPUT_THUMB_DIR / f"{key}.jpg").unlink(missing_ok=True)
+            conn.execute("DELETE FROM input_images WHERE name=?", (name,))
+    conn.commit()
+    return indexed
+
+
+def refresh_input_catalog(force: bool = False) -> int:
+    with _input_catalog_lock:
+        if not force and time.time() - _input_catalog_state["scanned"] < INPUT_CATALOG_SCAN_S:
+            return 0
+        with closing(_input_catalog_db()) as conn:
+            indexed = _scan_input_images(conn)
+        _input_catalog_state["scanned"] = time.time()
+    return indexed
+
+
+def _make_input_thumb(name: str, thumb_key: str):
+    ensure_dir(INPUT_THUMB_DIR)
+    dest = INPUT_THUMB_DIR / f"{thumb_key}.jpg"
+    try:
+        err = _run_ffmpeg(
+            ["-i", str(COMFY_DIR / "input" / name), "-frames:v", "1", "-vf", f"scale={INPUT_THUMB_WIDTH}:-2", "-q:v", "4"],
+            dest,
+        )
+        with _input_catalog_lock, closing(_input_catalog_db()) as conn:
+            conn.execute(
+                "UPDATE input_images SET thumb=?, error=? WHERE name=? AND thumb_key=?",
+                (int(dest.is_file()), err[:500], name, thumb_key),
+            )
+            conn.commit()
+    finally:
+        with _input_catalog_lock:
+            _input_catalog_state["pending"].discard(thumb_key)
+
+
+def input_image_page(q: str = "", page: int = 1, per_page: int = 50) -> dict:
+    """Imágenes de ComfyUI/input, más recientes primero, filtradas por nombre."""
+    refresh_input_catalog()
+    page = max(1, page)
+    per_page = max(1, min(500, per_page))
+    pattern = "%" + q.strip().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+    with _input_catalog_lock, closing(_input_catalog_db()) as conn:
+        total = conn.execute(
+            "SELECT COUNT(*) FROM input_images WHERE name LIKE ? ESCAPE '\\'", (pattern,)
+        ).fetchone()[0]
+        rows = [
+            dict(r)
+            for r in conn.execute(
+                "SELECT * FROM input_images WHERE name LIKE ? ESCAPE '\\' ORDER BY mtime DESC, name LIMIT ? OFFSET ?",
+                (pattern, per_page, (page - 1) * per_page),
+            )
+        ]
+        if ffmpeg_available():
+            for r in rows:
+                if r["thumb"] or r["error"] or r["thumb_key"] in _input_catalog_state["pending"]:
+                    continue
+                _input_catalog_state["pending"].add(r["thumb_key"])
+                _GALLERY_POOL.submit(_make_input_thumb, r["name"], r["thumb_key"])
+    return {
+        "ok": True,
+        "q": q,
+        "page": page,
+        "per_page": per_page,
+        "total": total,
+        "pages": max(1, -(-total // per_page)),
+        "images": [r["name"] for r in rows],
+        "items": [
+            {
+                "name": r["name"],
+                "size": r["size"],
+                "mtime": r["mtime"],
+                "target": r["target"],
+                "thumb_url": f"/tools/wan-i2v/input-images/thumbs/{r['thumb_key']}.jpg" if r["thumb"] else None,
+            }
+            for r in rows
+        ],
+    }
+
+
+def _publish_input_image(name: str, new_file: bool):
+    # El render I2V puede ir a cualquier backend del pool: la imagen se sube a los que no
+    # la tienen y se invalida su object_info para que el validador la vea en LoadImage.
+    # Una subida deduplicada solo va a los backends cuyo LoadImage aún no la lista.
+    _share_input_image(COMFY_DIR / "input" / name, name, skip_listed=not new_file)
+    if new_file:
+        comfy_pool_invalidate()
+
+
+def store_input_image(data: bytes, filename: str, width: int = 0, height: int = 0) -> dict:
+    """Guarda una imagen subida en ComfyUI/input; con width/height la ajusta para cubrir esa
+    resolución (sin ampliar ni recortar). Un contenido ya subido devuelve el fichero existente."""
+    ext = Path(filename or "").suffix.lower()
+    if ext not in INPUT_IMAGE_EXTS:
+        return {"ok": False, "message": f"Formato no admitido ({ext or 'sin extensión'}): usa {', '.join(INPUT_IMAGE_EXTS)}."}
+    if len(data) > INPUT_UPLOAD_MAX_MB * 1024 * 1024:
+        return {"ok": False, "message": f"La imagen supera {INPUT_UPLOAD_MAX_MB:g} MB."}
+    refresh_input_catalog()
+    sha1 = hashlib.sha1(data).hexdigest()
+    resize = width > 0 and height > 0 and ffmpeg_available()
+    target = f"{width}x{height}" if resize else ""
+    input_dir = COMFY_DIR / "input"
+    with _input_catalog_lock, closing(_input_catalog_db()) as conn:
+        rows = conn.execute(
+            "SELECT name, target FROM input_images WHERE (source_sha1=? AND target=?) OR sha1=?",
+            (sha1, target, sha1),
+        ).fetchall()
+    for row in rows:
+        # Mismo original ya ajustado a este perfil, o el mismo fichero si no hay que ajustar.
+        if (row["target"] == target or not resize) and (input_dir / row["name"]).is_file():
+            _publish_input_image(row["name"], new_file=False)
+            return {"ok": True, "name": row["name"], "deduplicated": True, "resized": row["target"] or None,
+                    "message": f"La imagen ya estaba en ComfyUI/input: {row['name']}"}
+
+    ensure_dir(input_dir)
+    stem = slugify_text(Path(filename).stem)[:40] or "imagen"
+    if resize:
+        name = f"{stem}_{sha1[:10]}_{target}.png"
+        src = input_dir / f".upload_{sha1[:10]}{ext}"
+        src.write_bytes(data)
+        # Escala para cubrir width x height manteniendo aspecto; nunca amplía.
+        cover = f"gt(a,{width}/{height})"
+        vf = f"scale='if({cover},-2,min(iw,{width}))':'if({cover},min(ih,{height}),-2)'"
+        try:
+            err = _run_ffmpeg(["-i", str(src), "-frames:v", "1", "-vf", vf], input_dir / name)
+        finally:
+            src.unlink(missing_ok=True)
+        if err:
+            return {"ok": False, "message": f"No se pudo procesar la imagen: {err}"}
+    else:
+        name = f"{stem}_{sha1[:10]}{ext}"
+        (input_dir / name).write_bytes(data)
+    with _input_catalog_lock, closing(_input_catalog_db()) as conn:
+        _upsert_input_image(conn, name, source_sha1=sha1, target=target)
+        conn.commit()
+    _publish_input_image(name, new_file=True)
+    return {"ok": True, "name": name, "deduplicated": False, "resized": target or None,
+            "message": f"Imagen guardada en ComfyUI/input: {name}"}
+
+
+# --- VALIDACIÓN DE WORKFLOWS --------------------------------------------------
+# Antes de POST /prompt el grafo se comprueba contra el object_info cacheado: clases de
+# nodo, inputs requeridos, opciones de listas, tipos y rangos numéricos y enlaces
+# [nodo, salida]. Los fallos salen con el mismo cuerpo que un 400 de ComfyUI.
+_COMFY_PRIMITIVES = ("INT", "FLOAT", "STRING", "BOOLEAN")
+# Únicos errores que puede causar un object_info desfasado (modelo, imagen o nodo recién
+# instalado); el resto se rechaza sin volver a pedir /object_info.
+_COMFY_STALE_INFO_ERRORS = ("value_not_in_list", "missing_node_type")
+# Como mucho un refresco de object_info por validación fallida cada tantos segundos.
+COMFY_VALIDATE_REFRESH_S = float(os.environ.get("COMFY_VALIDATE_REFRESH_S", "30"))
+_validate_refresh = {"at": 0.0}
+_validate_refresh_lock = threading.Lock()
+
+
+class ComfyPromptError(urlerror.HTTPError):
+    """Grafo rechazado por la validación local; se maneja igual que un HTTP 400 de ComfyUI."""
+
+    def __init__(self, node_errors: dict):
+        self.body = {
+            "error": {
+                "type": "prompt_outputs_failed_validation",
+                "message": "Prompt outputs failed validation",
+                "details": "",
+                "extra_info": {},
             },
+            "node_errors": node_errors,
+        }
+        data = json.dumps(self.body, ensure_ascii=False).encode("utf-8")
+        super().__init__("local:/prompt", 400, "Prompt outputs failed validation", None, io.BytesIO(data))
+
+
+def _input_error(kind: str, message: str, name: str, value, details: str = "") -> dict:
+    return {
+        "type": kind,
+        "message": message,
+        "details": details or f"{name}: {value!r}",
+        "extra_info": {"input_name": name, "received_value": value},
+    }
+
+
+def _check_link(prompt: dict, obj_info: dict, name: str, expected, value) -> list[dict]:
+    if len(value) != 2 or not isinstance(value[1], int) or isinstance(value[1], bool):
+        return [_input_error("bad_linked_input", "Bad linked input, must be a length-2 list of [node_id, slot_index]", name, value)]
+    source = prompt.get(str(value[0]))
+    if not isinstance(source, dict):
+        return [_input_error("bad_linked_input", "Linked node does not exist", name, value, f"{name}: nodo #{value[0]} no está en el grafo")]
+    source_spec = obj_info.get(source.get("class_type"))
+    if source_spec is None:
+        # La clase desconocida ya se reporta en su propio nodo.
+        return []
+    outputs = source_spec.get("output") or []
+    if not 0 <= value[1] < len(outputs):
+        return [
+            _input_error(
+                "bad_linked_input",
+                "Linked output slot out of range",
+                name,
+                value,
+                f"{name}: {source.get('class_type')} tiene {len(outputs)} salidas, se pidió la {value[1]}",
+            )
+        ]
+    received = outputs[value[1]]
+    if isinstance(expected, str) and isinstance(received, str) and "*" not in (expected, received):
+        if received not in expected.split(",") and expected not in received.split(","):
+            return [
+                _input_error(
+                    "return_type_mismatch",
+                    "Return type mismatch between linked nodes",
+                    name,
+                    value,
+                    f"{name}: se esperaba {expected}, {source.get('class_type')} devuelve {received}",
+                )
+            ]
+    return []
+
+
+def _check_widget(name: str, expected, opts: dict, value) -> tuple[list[dict], list[str]]:
+    """(errores, avisos) de un valor literal frente a su definición de input."""
+    options = expected if isinstance(expected, list) else opts.get("options") if expected == "COMBO" else None
+    if options is not None:
+        if value not in options:
+            preview = ", ".join(map(str, options[:8])) + (" ..." if len(options) > 8 else "")
+            return [_input_error("value_not_in_list", "Value not in list", name, value, f"{name}: '{value}' not in [{preview}]")], []
+        return [], []
+    if expected not in _COMFY_PRIMITIVES:
+        return [], []
+    if expected == "STRING":
+        ok = isinstance(value, str)
+    elif expected == "BOOLEAN":
+        ok = isinstance(value, bool)
+    else:
+        ok = isinstance(value, (int, float)) and not isinstance(value, bool)
+        if ok and expected == "INT" and isinstance(value, float) and not value.is_integer():
+            ok = False
+    if not ok:
+        return [_input_error("invalid_input_type", f"Failed to convert an input value to a {expected} value", name, value)], []
+    if expected not in ("INT", "FLOAT"):
+        return [], []
+    errors = []
+    if opts.get("min") is not None and value < opts["min"]:
+        errors.append(
+            _input_error("value_smaller_than_min", f"Value {value} smaller than min of {opts['min']}", name, value)
+        )
+    if opts.get("max") is not None and value > opts["max"]:
+        errors.append(
+            _input_error("value_bigger_than_max", f"Value {value} bigger than max of {opts['max']}", name, value)
+        )
+    # ComfyUI no rechaza valores fuera de step (el frontend los redondea): solo se avisa.
+    warnings = []
+    step = opts.get("step")
+    if expected == "INT" and isinstance(step, int) and step > 1 and (value - (opts.get("min") or 0)) % step:
+        warnings.append(f"{name}={value} no es múltiplo de step {step}")
+    return errors, warnings
+
+
+def validate_comfy_prompt(prompt: dict, obj_info: dict) -> tuple[dict, list[str]]:
+    """(node_errors con el formato de ComfyUI, avisos) del grafo API frente a object_info."""
+    node_errors = {}
+    warnings = []
+    for node_id, node in prompt.items():
+        class_type = node.get("class_type", "") if isinstance(node, dict) else ""
+        spec = obj_info.get(class_type)
+        errors = []
+        if spec is None:
+            errors.append(
+                {
+                    "type": "missing_node_type",
+                    "message": f"Node '{class_type}' does not exist.",
+                    "details": f"Node ID '#{node_id}'",
+                    "extra_info": {"class_type": class_type},
+                }
+            )
+        else:
+            inputs = node.get("inputs") or {}
+            schema = spec.get("input") or {}
+            for group in ("required", "optional"):
+                for name, cfg in (schema.get(group) or {}).items():
+                    value = inputs.get(name)
+                    if value is None:
+                        if group == "required":
+                            errors.append(_input_error("required_input_missing", "Required input is missing", name, None, name))
+                        continue
+                    if not isinstance(cfg, list) or not cfg:
+                        continue
+                    expected = cfg[0]
+                    opts = cfg[1] if len(cfg) > 1 and isinstance(cfg[1], dict) else {}
+                    if isinstance(value, list):
+                        errors.extend(_check_link(prompt, obj_info, name, expected, value))
+                        continue
+                    errs, warns = _check_widget(name, expected, opts, value)
+                    errors.extend(errs)
+                    warnings.extend(f"#{node_id} {class_type}: {w}" for w in warns)
+        if errors:
+            node_errors[node_id] = {"errors": errors, "dependent_outputs": [], "class_type": class_type}
+    return node_errors, warnings
+
+
+def _stale_info_possible(node_errors: dict) -> bool:
+    return all(e["type"] in _COMFY_STALE_INFO_ERRORS for n in node_errors.values() for e in n["errors"])
+
+
+def _claim_info_refresh() -> bool:
+    with _validate_refresh_lock:
+        now = time.time()
+        if now - _validate_refresh["at"] < COMFY_VALIDATE_REFRESH_S:
+            return False
+        _validate_refresh["at"] = now
+        return True
+
+
+def validate_before_submit(prompt: dict):
+    """Lanza ComfyPromptError si el grafo no pasa la validación local."""
+    obj_info = get_comfy_object_info()
+    if not obj_info:
+        return
+    node_errors, warnings = validate_comfy_prompt(prompt, obj_info)
+    if node_errors and _stale_info_possible(node_errors) and _claim_info_refresh():
+        # object_info cacheado puede ir por detrás (modelo o nodo recién instalado).
+        comfy_pool_invalidate()
+        obj_info = get_comfy_object_info()
+        if obj_info:
+            node_errors, warnings = validate_comfy_prompt(prompt, obj_info)
+    for w in warnings:
+        log.info("Validación de workflow: %s", w)
+    if node_errors:
+        raise ComfyPromptError(node_errors)
+
+
+def comfy_http_error_result(exc: urlerror.HTTPError) -> dict:
+    """Resultado {"ok": False} legible a partir de un 400 de /prompt (remoto o local)."""
+    raw = exc.read().decode("utf-8", errors="ignore")
+    prefix = "Workflow inválido" if isinstance(exc, ComfyPromptError) else f"HTTP {exc.code}"
+    node_errors = {}
+    try:
+        err_body = json.loads(raw)
+        err = err_body.get("error", {})
+        msg = err.get("message", exc.reason)
+        detail = err.get("details", "")
+        node_errors = err_body.get("node_errors", {})
+        missing_nodes = list(
+            dict.fromkeys(
+                v.get("class_type", nid)
+                for nid, v in node_errors.items()
+                if "does not exist" in str(v.get("errors", ""))
+            )
+        )
+        if missing_nodes:
+            msg = (
+                f"Nodos no encontrados: {', '.join(missing_nodes)}. "
+                "Instala el custom node y reinicia ComfyUI."
+            )
+        elif node_errors:
+            node_msgs = []
+            for nid, v in node_errors.items():
+                cls = v.get("class_type", nid)
+                errs = v.get("errors", [])
+                if errs:
+                    first = errs[0]
+                    node_msgs.append(f"{cls}: {first.get('details') or first.get('message')}")
+            if node_msgs:
+                msg = " ; ".join(node_msgs[:3])
+        full = f"{prefix}: {msg}"
+        if detail and detail not in full:
+            full += f" ({detail})"
+    except Exception:
+        full = f"{prefix}: {raw or exc.reason}"
+    result = {"ok": False, "message": full}
+    if node_errors:
+        result["node_errors"] = node_errors
+    return result
+
+
+# --- BORRADOR Y ACABADO -------------------------------------------------------
+# Modo borrador: misma semilla y misma estructura de grafo, pero con resolución, steps y
+# frames reducidos para iterar prompts rápido. Un borrador bueno se promociona después
+# (POST /api/jobs/<id>/promote) al perfil completo o con escalado + interpolación.
+RENDER_DRAFT_SCALE = float(os.environ.get("RENDER_DRAFT_SCALE", "0.5"))
+RENDER_DRAFT_STEPS = float(os.environ.get("RENDER_DRAFT_STEPS", "0.5"))
+RENDER_DRAFT_FRAMES = float(os.environ.get("RENDER_DRAFT_FRAMES", "0.5"))
+RENDER_INTERPOLATION_MODEL = os.environ.get("RENDER_INTERPOLATION_MODEL", "rife47.pth")
+RENDER_UPSCALE_MODEL = os.environ.get("RENDER_UPSCALE_MODEL", "4x-UltraSharp.pth")
+RENDER_LATENT_UPSCALE_DENOISE = float(os.environ.get("RENDER_LATENT_UPSCALE_DENOISE", "0.5"))
+RENDER_UPSCALERS = ("lanczos", "model", "latent")
+_FINISH_STAGE_INPUTS = {"RIFE VFI": "frames", "ImageScaleBy": "image", "ImageUpscaleWithModel": "image"}
+
+
+def draft_render_params(width: int, height: int, frames: int, steps: int, wan: bool = False) -> tuple[int, int, int, int]:
+    # El lado corto no baja de 256 (mínimo de los formularios) y se mantiene el aspecto.
+    scale = min(1.0, max(RENDER_DRAFT_SCALE, 256 / max(1, min(width, height))))
+    d_width = clamp_step(int(width * scale), 256, width, 8)
+    d_height = clamp_step(int(height * scale), 256, height, 8)
+    d_steps = max(10, min(steps, round(steps * RENDER_DRAFT_STEPS)))
+    d_frames = max(8, min(frames, round(frames * RENDER_DRAFT_FRAMES)))
+    if wan:
+        # Wan genera 4k+1 frames.
+        d_frames = max(9, (d_frames - 1) // 4 * 4 + 1)
+    else:
+        d_frames = clamp_step(d_frames, 8, max(8, frames), 4)
+    return d_width, d_height, d_frames, d_steps
+
+
+def finish_stage_options(form_data, profile: dict | None = None) -> tuple[float, int, str]:
+    """(escalado, interpolación, upscaler) del formulario; lo que no venga sale del perfil.
+
+    Un borrador no lleva acabado aunque el formulario traiga valores (siempre los envía):
+    solo la promoción "finish" (finish_draft) añade etapas a los parámetros de borrador.
+    """
+    if _form_flag(form_data, "draft") and not _form_flag(form_data, "finish_draft"):
+        return 1.0, 1, "lanczos"
+    profile = profile or {}
+    try:
+        upscale_by = max(1.0, min(4.0, float(form_data.get("upscale") or profile.get("upscale") or 1.0)))
+    except ValueError:
+        upscale_by = 1.0
+    try:
+        interpolate = int(form_data.get("interpolate") or profile.get("interpolate") or 1)
+    except ValueError:
+        interpolate = 1
+    upscaler = form_data.get("upscaler") or profile.get("upscaler") or "lanczos"
+    return upscale_by, interpolate if interpolate in (2, 4) else 1, upscaler if upscaler in RENDER_UPSCALERS else "lanczos"
+
+
+def _upscale_model_factor(model_name: str) -> int:
+    # 4x-UltraSharp.pth, RealESRGAN_x4plus.pth, 2x_... -> factor nativo del modelo.
+    m = re.search(r"(\d)x|x(\d)", model_name.lower())
+    return int(m.group(1) or m.group(2)) if m else 4
+
+
+def append_finish_stages(prompt: dict, upscale_by: float = 1.0, interpolate: int = 1, upscaler: str = "lanczos") -> dict:
+    """Inserta interpolación (RIFE VFI) y escalado antes de VHS_VideoCombine.
+
+    upscaler=model pasa los frames por RENDER_UPSCALE_MODEL (ESRGAN) y ajusta con lanczos
+    al factor pedido; cualquier otro valor escala con lanczos. El escalado latente lo
+    añade el builder que conoce su sampler (build_video_prompt_evolved).
+    """
+    if upscale_by <= 1.0 and interpolate <= 1:
+        return prompt
+    prompt = json.loads(json.dumps(prompt))
+    next_id = max((int(k) for k in prompt if str(k).isdigit()), default=0) + 1
+    for node in list(prompt.values()):
+        if node.get("class_type") != "VHS_VideoCombine":
+            continue
+        images = node["inputs"].get("images")
+        # Se interpola a baja resolución (más barato) y se escala al final.
+        if interpolate > 1:
+            prompt[str(next_id)] = {
+                "class_type": "RIFE VFI",
+                "inputs": {
+                    "ckpt_name": RENDER_INTERPOLATION_MODEL,
+                    "frames": images,
+                    "clear_cache_after_n_frames": 10,
+                    "multiplier": interpolate,
+                    "fast_mode": True,
+                    "ensemble": True,
+                    "scale_factor": 1.0,
+                },
+            }
+            images = [str(next_id), 0]
+            next_id += 1
+            node["inputs"]["frame_rate"] = node["inputs"].get("frame_rate", 8) * interpolate
+        if upscale_by > 1.0:
+            scale_by = upscale_by
+            if upscaler == "model":
+                prompt[str(next_id)] = {
+                    "class_type": "UpscaleModelLoader",
+                    "inputs": {"model_name": RENDER_UPSCALE_MODEL},
+                }
+                prompt[str(next_id + 1)] = {
+                    "class_type": "ImageUpscaleWithModel",
+                    "inputs": {"upscale_model": [str(next_id), 0], "image": images},
+                }
+                images = [str(next_id + 1), 0]
+                next_id += 2
+                scale_by = upscale_by / _upscale_model_factor(RENDER_UPSCALE_MODEL)
+            if scale_by != 1.0:
+                prompt[str(next_id)] = {
+                    "class_type": "ImageScaleBy",
+                    "inputs": {"image": images, "upscale_method": "lanczos", "scale_by": round(scale_by, 4)},
+                }
+                images = [str(next_id), 0]
+                next_id += 1
+        node["inputs"]["images"] = images
+    return prompt
+
+
+def append_latent_upscale(prompt: dict, sampler_id: str, decode_id: str, upscale_by: float) -> dict:
+    """Escalado latente (hires fix) para grafos con KSampler.
+
+    LatentUpscaleBy tras el sampler y una segunda pasada con RENDER_LATENT_UPSCALE_DENOISE
+    (misma semilla y condicionamiento) antes del VAEDecode.
+    """
+    next_id = max((int(k) for k in prompt if str(k).isdigit()), default=0) + 1
+    up_id, refine_id = str(next_id), str(next_id + 1)
+    prompt[up_id] = {
+        "class_type": "LatentUpscaleBy",
+        "inputs": {"samples": [sampler_id, 0], "upscale_method": "nearest-exact", "scale_by": upscale_by},
+    }
+    prompt[refine_id] = {
+        "class_type": "KSampler",
+        "inputs": {
+            **prompt[sampler_id]["inputs"],
+            "latent_image": [up_id, 0],
+            "denoise": RENDER_LATENT_UPSCALE_DENOISE,
         },
     }
+    prompt[decode_id]["inputs"]["samples"] = [refine_id, 0]
+    return prompt
 
 
-def build_video_prompt_evolved(
-    checkpoint,
-    motion_model,
-    beta_schedule,
+def segment_stage_options(form_data) -> tuple[int, str]:
+    # Campos internos que rellena el job de vídeo largo para cada segmento.
+    try:
+        trim_start = max(0, int(form_data.get("segment_trim") or 0))
+    except ValueError:
+        trim_start = 0
+    return trim_start, (form_data.get("segment_last_frame") or "").strip()
+
+
+def append_segment_stages(prompt: dict, trim_start: int = 0, last_frame_prefix: str = "") -> dict:
+    """Recorta los primeros trim_start frames del vídeo y guarda su último frame como PNG.
+
+    Ambos van por debajo de las etapas de acabado: el último frame sale a la resolución
+    del render (la que necesita el I2V del segmento siguiente) y se recortan frames
+    renderizados, no interpolados.
+    """
+    if trim_start <= 0 and not last_frame_prefix:
+        return prompt
+    prompt = json.loads(json.dumps(prompt))
+    next_id = max((int(k) for k in prompt if str(k).isdigit()), default=0) + 1
+    for node in list(prompt.values()):
+        if node.get("class_type") != "VHS_VideoCombine":
+            continue
+        # Si el grafo ya trae etapas de acabado, se recorta y se guarda por debajo de ellas.
+        holder, key = node["inputs"], "images"
+        while isinstance(holder.get(key), list):
+            upstream = prompt.get(str(holder[key][0])) or {}
+            if upstream.get("class_type") not in _FINISH_STAGE_INPUTS:
+                break
+            holder, key = upstream["inputs"], _FINISH_STAGE_INPUTS[upstream["class_type"]]
+        images = holder.get(key)
+        if last_frame_prefix:
+            # ImageFromBatch limita batch_index al último frame del lote.
+            prompt[str(next_id)] = {
+                "class_type": "ImageFromBatch",
+                "inputs": {"image": images, "batch_index": 4095, "length": 1},
+            }
+            prompt[str(next_id + 1)] = {
+                "class_type": "SaveImage",
+                "inputs": {"images": [str(next_id), 0], "filename_prefix": last_frame_prefix},
+            }
+            next_id += 2
+        if trim_start > 0:
+            prompt[str(next_id)] = {
+                "class_type": "ImageFromBatch",
+                "inputs": {"image": images, "batch_index": trim_start, "length": 4096},
+            }
+            holder[key] = [str(next_id), 0]
+            next_id += 1
+    return prompt
+
+
+def render_variant_prefix(draft: bool, upscale_by: float, interpolate: int) -> str:
+    if upscale_by > 1.0 or interpolate > 1:
+        return "final_"
+    return "draft_" if draft else ""
+
+
+# --- WORKFLOWS ----------------------------------------------------------------
+def patch_api_workflow(
+    workflow,
     positive,
     negative,
+    checkpoint,
     width,
     height,
     frames,
@@ -2390,36 +4024,319 @@ def build_video_prompt_evolved(
     pix_fmt,
     seed,
     output_prefix,
+    wan_model=None,
+    shift=5.0,
+    text_encoder=None,
+    vae=None,
 ):
-    return {
-        "1": {
-            "class_type": "CheckpointLoaderSimple",
-            "inputs": {"ckpt_name": checkpoint},
-        },
-        "2": {
-            "class_type": "CLIPTextEncode",
-            "inputs": {"text": positive, "clip": ["1", 1]},
-        },
-        "3": {
-            "class_type": "CLIPTextEncode",
-            "inputs": {"text": negative, "clip": ["1", 1]},
-        },
-        "4": {
-            "class_type": "EmptyLatentImage",
-            "inputs": {"width": width, "height": height, "batch_size": frames},
-        },
-        "5": {
-            "class_type": "ADE_LoadAnimateDiffModel",
-            "inputs": {"model_name": motion_model, "ad_settings": None},
+    wf = json.loads(json.dumps(workflow))
+    ct_map = {}
+    for nid, node in wf.items():
+        if isinstance(node, dict):
+            ct = node.get("class_type", "")
+            ct_map.setdefault(ct, []).append(nid)
+
+    def patch_node(ct, updates):
+        for nid in ct_map.get(ct, []):
+            wf[nid]["inputs"].update(updates)
+
+    if checkpoint:
+        patch_node("CheckpointLoaderSimple", {"ckpt_name": checkpoint})
+
+    for nid in ct_map.get("KSampler", []) + ct_map.get("KSamplerAdvanced", []):
+        node = wf[nid]
+        p_ref = node["inputs"].get("positive")
+        n_ref = node["inputs"].get("negative")
+        if isinstance(p_ref, list) and len(p_ref) == 2:
+            pos_nid = str(p_ref[0])
+            if pos_nid in wf and wf[pos_nid].get("class_type") == "CLIPTextEncode":
+                wf[pos_nid]["inputs"]["text"] = positive
+        if isinstance(n_ref, list) and len(n_ref) == 2:
+            neg_nid = str(n_ref[0])
+            if neg_nid in wf and wf[neg_nid].get("class_type") == "CLIPTextEncode":
+                wf[neg_nid]["inputs"]["text"] = negative
+        node["inputs"].update(
+            {"steps": steps, "cfg": cfg, "seed": seed, "denoise": denoise}
+        )
+
+    patch_node(
+        "EmptyLatentImage", {"width": width, "height": height, "batch_size": frames}
+    )
+    for ct in ("ADE_AnimateDiffLoaderWithContext", "ADE_AnimateDiffLoaderGen1"):
+        patch_node(ct, {"context_length": frames})
+    patch_node(
+        "VHS_VideoCombine",
+        {
+            "frame_rate": fps,
+            "crf": crf,
+            "pix_fmt": pix_fmt,
+            "filename_prefix": output_prefix,
         },
-        "6": {
-            "class_type": "ADE_ApplyAnimateDiffModelSimple",
-            "inputs": {
-                "motion_model": ["5", 0],
-                "motion_lora": None,
-                "scale_multival": None,
-                "effect_multival": None,
-                "ad_keyframes": None,
+    )
+
+    if wan_model:
+        patch_node("WanVideoModelLoader", {"model": wan_model})
+    patch_node(
+        "WanVideoSampler", {"shift": shift, "steps": steps, "cfg": cfg, "seed": seed}
+    )
+    if text_encoder:
+        patch_node("LoadWanVideoT5TextEncoder", {"model_name": text_encoder})
+    if vae:
+        patch_node("WanVideoVAELoader", {"model_name": vae})
+    patch_node(
+        "WanVideoTextEncode", {"positive_prompt": positive, "negative_prompt": negative}
+    )
+    patch_node(
+        "WanVideoEmptyEmbeds", {"width": width, "height": height, "num_frames": frames}
+    )
+
+    return wf
+
+
+# --- VIDEO SDXL ---------------------------------------------------------------
+def get_video_preset(preset_id):
+    for p in VIDEO_MODEL_PRESETS:
+        if p["id"] == preset_id:
+            return p
+    return VIDEO_MODEL_PRESETS[0]
+
+
+def get_smooth_profile(profile_id):
+    for p in VIDEO_SMOOTH_PROFILES:
+        if p["id"] == profile_id:
+            return p
+    return VIDEO_SMOOTH_PROFILES[0]
+
+
+def find_checkpoint(include_token):
+    ckpt_dir = COMFY_DIR / "models" / "checkpoints"
+    if not ckpt_dir.exists():
+        return None
+    token_lower = include_token.lower()
+    for f in ckpt_dir.iterdir():
+        if token_lower in f.name.lower():
+            return f.name
+    return None
+
+
+def resolve_checkpoint_name(obj_info: dict, preset: dict) -> str:
+    ckpt_options = get_node_input_options(
+        obj_info, "CheckpointLoaderSimple", "ckpt_name"
+    )
+    if not ckpt_options:
+        return preset["checkpoint"]
+
+    wanted = preset.get("checkpoint", "")
+    if wanted in ckpt_options:
+        return wanted
+    wanted_lower = wanted.lower()
+    for ck in ckpt_options:
+        if ck.lower() == wanted_lower:
+            return ck
+
+    include_token = preset.get("include_token", "").lower()
+    if include_token:
+        for ck in ckpt_options:
+            if include_token in ck.lower():
+                return ck
+
+    return ckpt_options[0]
+
+
+def resolve_animatediff_motion(obj_info: dict, checkpoint_name: str = ""):
+    node_name = "ADE_AnimateDiffLoaderWithContext"
+    if node_name not in obj_info:
+        node_name = "ADE_AnimateDiffLoaderGen1"
+    model_options = get_node_input_options(obj_info, node_name, "model_name")
+    beta_options = get_node_input_options(obj_info, node_name, "beta_schedule")
+
+    model_name = ""
+    if model_options:
+        ckpt_lower = checkpoint_name.lower()
+
+        # Si el checkpoint es SDXL, forzamos motion model SDXL.
+        if "sdxl" in ckpt_lower or "xl" in ckpt_lower:
+            for preferred in ("mm_sdxl_v10_beta.ckpt", "mm_sdxl_v10_beta.safetensors"):
+                if preferred in model_options:
+                    model_name = preferred
+                    break
+            if not model_name:
+                for m in model_options:
+                    if "sdxl" in m.lower():
+                        model_name = m
+                        break
+
+        if not model_name:
+            model_name = model_options[0]
+
+    beta_schedule = "autoselect"
+    if beta_options and beta_schedule not in beta_options:
+        beta_schedule = beta_options[0]
+
+    return model_name, beta_schedule
+
+
+def default_video_form():
+    profile = VIDEO_SMOOTH_PROFILES[0]
+    return {
+        "model_preset": VIDEO_MODEL_PRESETS[0]["id"],
+        "smooth_profile": profile["id"],
+        "positive_prompt": "",
+        "negative_prompt": "worst quality, low quality, lowres, blurry, deformed, watermark",
+        "width": profile["width"],
+        "height": profile["height"],
+        "frames": profile["frames"],
+        "fps": profile["fps"],
+        "steps": profile["steps"],
+        "cfg": profile["cfg"],
+        "denoise": profile["denoise"],
+        "crf": profile["crf"],
+        "pix_fmt": profile["pix_fmt"],
+        "interpolate": profile["interpolate"],
+        "upscale": profile["upscale"],
+        "upscaler": profile["upscaler"],
+        "seed": random.randint(0, 2**31),
+    }
+
+
+def build_video_prompt(
+    checkpoint,
+    motion_model,
+    beta_schedule,
+    positive,
+    negative,
+    width,
+    height,
+    frames,
+    fps,
+    steps,
+    cfg,
+    denoise,
+    crf,
+    pix_fmt,
+    seed,
+    output_prefix,
+    interpolate=1,
+    upscale_by=1.0,
+    upscaler="lanczos",
+):
+    prompt = {
+        "1": {
+            "class_type": "CheckpointLoaderSimple",
+            "inputs": {"ckpt_name": checkpoint},
+        },
+        "2": {
+            "class_type": "CLIPTextEncode",
+            "inputs": {"text": positive, "clip": ["1", 1]},
+        },
+        "3": {
+            "class_type": "CLIPTextEncode",
+            "inputs": {"text": negative, "clip": ["1", 1]},
+        },
+        "4": {
+            "class_type": "EmptyLatentImage",
+            "inputs": {"width": width, "height": height, "batch_size": frames},
+        },
+        "5": {
+            "class_type": "ADE_AnimateDiffLoaderWithContext",
+            "inputs": {
+                "model": ["1", 0],
+                "model_name": motion_model,
+                "beta_schedule": beta_schedule,
+            },
+        },
+        "6": {
+            "class_type": "KSampler",
+            "inputs": {
+                "model": ["5", 0],
+                "positive": ["2", 0],
+                "negative": ["3", 0],
+                "latent_image": ["4", 0],
+                "seed": seed,
+                "steps": steps,
+                "cfg": cfg,
+                "sampler_name": "euler",
+                "scheduler": "karras",
+                "denoise": denoise,
+            },
+        },
+        "7": {
+            "class_type": "VAEDecode",
+            "inputs": {"samples": ["6", 0], "vae": ["1", 2]},
+        },
+        "8": {
+            "class_type": "VHS_VideoCombine",
+            "inputs": {
+                "images": ["7", 0],
+                "frame_rate": fps,
+                "loop_count": 0,
+                "filename_prefix": output_prefix,
+                "format": "video/h264-mp4",
+                "pix_fmt": pix_fmt,
+                "crf": crf,
+                "save_metadata": True,
+                "trim_to_audio": False,
+                "pingpong": False,
+                "save_output": True,
+            },
+        },
+    }
+    if upscaler == "latent" and upscale_by > 1.0:
+        prompt = append_latent_upscale(prompt, "6", "7", upscale_by)
+        upscale_by = 1.0
+    return append_finish_stages(prompt, upscale_by, interpolate, upscaler)
+
+
+def build_video_prompt_evolved(
+    checkpoint,
+    motion_model,
+    beta_schedule,
+    positive,
+    negative,
+    width,
+    height,
+    frames,
+    fps,
+    steps,
+    cfg,
+    denoise,
+    crf,
+    pix_fmt,
+    seed,
+    output_prefix,
+    interpolate=1,
+    upscale_by=1.0,
+    upscaler="lanczos",
+):
+    prompt = {
+        "1": {
+            "class_type": "CheckpointLoaderSimple",
+            "inputs": {"ckpt_name": checkpoint},
+        },
+        "2": {
+            "class_type": "CLIPTextEncode",
+            "inputs": {"text": positive, "clip": ["1", 1]},
+        },
+        "3": {
+            "class_type": "CLIPTextEncode",
+            "inputs": {"text": negative, "clip": ["1", 1]},
+        },
+        "4": {
+            "class_type": "EmptyLatentImage",
+            "inputs": {"width": width, "height": height, "batch_size": frames},
+        },
+        "5": {
+            "class_type": "ADE_LoadAnimateDiffModel",
+            "inputs": {"model_name": motion_model, "ad_settings": None},
+        },
+        "6": {
+            "class_type": "ADE_ApplyAnimateDiffModelSimple",
+            "inputs": {
+                "motion_model": ["5", 0],
+                "motion_lora": None,
+                "scale_multival": None,
+                "effect_multival": None,
+                "ad_keyframes": None,
                 "per_block": None,
             },
         },
@@ -2472,6 +4389,10 @@ def build_video_prompt_evolved(
             },
         },
     }
+    if upscaler == "latent" and upscale_by > 1.0:
+        prompt = append_latent_upscale(prompt, "8", "9", upscale_by)
+        upscale_by = 1.0
+    return append_finish_stages(prompt, upscale_by, interpolate, upscaler)
 
 
 def submit_video_scene(form_data):
@@ -2481,13 +4402,7 @@ def submit_video_scene(form_data):
         len((form_data.get("positive_prompt", "") or "").strip()),
         len((form_data.get("negative_prompt", "") or "").strip()),
     )
-    if not port_open(COMFY_PORT):
-        comfy_start()
-        for _ in range(20):
-            if port_open(COMFY_PORT):
-                break
-            time.sleep(0.5)
-    if not port_open(COMFY_PORT):
+    if not ensure_comfy_pool():
         return {"ok": False, "message": "ComfyUI no está disponible."}
 
     preset = get_video_preset(form_data.get("model_preset", "wai_nsfw"))
@@ -2502,8 +4417,12 @@ def submit_video_scene(form_data):
     denoise = max(0.1, min(1.0, float(form_data.get("denoise", profile["denoise"]))))
     crf = clamp_step(int(form_data.get("crf", profile["crf"])), 14, 28, 1)
     pix_fmt = form_data.get("pix_fmt", "yuv420p")
-    seed_raw = int(form_data.get("seed", -1))
+    seed_raw = int(form_data.get("seed") or -1)
     seed = random.randint(0, 2**31) if seed_raw < 0 else seed_raw
+    draft = _form_flag(form_data, "draft")
+    if draft:
+        width, height, frames, steps = draft_render_params(width, height, frames, steps)
+    upscale_by, interpolate, upscaler = finish_stage_options(form_data, None if draft else profile)
     character_preset_id = form_data.get("character_preset", "").strip()
     positive = form_data.get("positive_prompt", "").strip()
     negative = form_data.get("negative_prompt", "").strip()
@@ -2544,7 +4463,8 @@ def submit_video_scene(form_data):
             ),
         }
     timestamp = time.strftime("%Y%m%d_%H%M%S")
-    output_prefix = f"video_output/{timestamp}_{slugify_text(positive)[:48]}"
+    take = render_variant_prefix(draft, upscale_by, interpolate)
+    output_prefix = f"video_output/{take}{timestamp}_{slugify_text(positive)[:48]}"
 
     workflow_file = None
     prompt = None
@@ -2605,6 +4525,9 @@ def submit_video_scene(form_data):
                 pix_fmt=pix_fmt,
                 seed=seed,
                 output_prefix=output_prefix,
+                interpolate=interpolate,
+                upscale_by=upscale_by,
+                upscaler=upscaler,
             )
             workflow_variant = "evolved"
         else:
@@ -2625,43 +4548,28 @@ def submit_video_scene(form_data):
                 pix_fmt=pix_fmt,
                 seed=seed,
                 output_prefix=output_prefix,
+                interpolate=interpolate,
+                upscale_by=upscale_by,
+                upscaler=upscaler,
             )
 
+    if workflow_file:
+        # Los builders ya incluyen el acabado; los workflows exportados lo reciben aquí.
+        prompt = append_finish_stages(prompt, upscale_by, interpolate, upscaler)
+
     try:
-        response = comfy_api_post("/prompt", {"prompt": prompt})
+        response = comfy_submit_prompt(
+            prompt, "animatediff_sdxl", label=output_prefix, force=_form_flag(form_data, "force")
+        )
     except urlerror.HTTPError as exc:
-        raw = exc.read().decode("utf-8", errors="ignore")
-        try:
-            err_body = json.loads(raw)
-            err = err_body.get("error", {})
-            msg = err.get("message", exc.reason)
-            detail = err.get("details", "")
-            node_errors = err_body.get("node_errors", {})
-            if node_errors:
-                node_msgs = []
-                for nid, v in node_errors.items():
-                    cls = v.get("class_type", nid)
-                    errs = v.get("errors", [])
-                    if errs:
-                        first = errs[0]
-                        node_msgs.append(
-                            f"{cls}: {first.get('details') or first.get('message')}"
-                        )
-                if node_msgs:
-                    msg = " ; ".join(node_msgs[:3])
-            full = f"HTTP {exc.code}: {msg}"
-            if detail and detail not in full:
-                full += f" ({detail})"
-        except Exception:
-            full = f"HTTP {exc.code}: {raw or exc.reason}"
-        return {"ok": False, "message": full}
+        return comfy_http_error_result(exc)
     except Exception as exc:
         return {"ok": False, "message": f"Error enviando a ComfyUI: {exc}"}
 
     prompt_id = response.get("prompt_id")
     if not prompt_id:
         return {"ok": False, "message": f"ComfyUI no aceptó el prompt: {response}"}
-    return {
+    return render_cache_result({
         "ok": True,
         "message": "Vídeo encolado en ComfyUI.",
         "prompt_id": prompt_id,
@@ -2672,7 +4580,11 @@ def submit_video_scene(form_data):
         "used_motion_model": motion_model,
         "used_denoise": denoise,
         "used_positive_prompt": positive,
-    }
+        "seed": seed,
+        "draft": take == "draft_",
+        "render_params": {"width": width, "height": height, "frames": frames, "steps": steps},
+        "finish": {"upscale": upscale_by, "interpolate": interpolate, "upscaler": upscaler},
+    }, response)
 
 
 # --- WAN2.1 -------------------------------------------------------------------
@@ -2780,36 +4692,21 @@ def default_wan_form():
         "shift": profile["shift"],
         "crf": profile["crf"],
         "pix_fmt": profile["pix_fmt"],
+        "interpolate": profile["interpolate"],
+        "upscale": profile["upscale"],
+        "upscaler": profile["upscaler"],
         "seed": random.randint(0, 2**31),
+        "long_duration": 0,
     }
 
 
 def default_wan_i2v_form():
     f = default_wan_form()
-    imgs = list_comfy_input_images()
+    imgs = input_image_page(per_page=1)["images"]
     f["image_name"] = imgs[0] if imgs else ""
     return f
 
 
-def list_comfy_input_images():
-    input_dir = COMFY_DIR / "input"
-    if not input_dir.exists() or not input_dir.is_dir():
-        return []
-
-    exts = {".png", ".jpg", ".jpeg", ".webp", ".bmp"}
-    files = []
-    for p in sorted(input_dir.rglob("*")):
-        if not p.is_file():
-            continue
-        if p.suffix.lower() not in exts:
-            continue
-        rel = p.relative_to(input_dir).as_posix()
-        if rel.startswith("."):
-            continue
-        files.append(rel)
-    return files
-
-
 def _patch_workflow_image_input(prompt: dict, image_name: str) -> bool:
     patched = False
     for node in prompt.values():
@@ -2830,13 +4727,7 @@ def _patch_workflow_image_input(prompt: dict, image_name: str) -> bool:
 
 
 def submit_wan_i2v_scene(form_data):
-    if not port_open(COMFY_PORT):
-        comfy_start()
-        for _ in range(20):
-            if port_open(COMFY_PORT):
-                break
-            time.sleep(0.5)
-    if not port_open(COMFY_PORT):
+    if not ensure_comfy_pool():
         return {"ok": False, "message": "ComfyUI no está disponible."}
 
     image_name = (form_data.get("image_name", "") or "").strip()
@@ -2857,8 +4748,13 @@ def submit_wan_i2v_scene(form_data):
     shift = max(1.0, min(20.0, float(form_data.get("shift", profile["shift"]))))
     crf = clamp_step(int(form_data.get("crf", profile["crf"])), 14, 28, 1)
     pix_fmt = form_data.get("pix_fmt", "yuv420p")
-    seed_raw = int(form_data.get("seed", -1))
+    seed_raw = int(form_data.get("seed") or -1)
     seed = random.randint(0, 2**31) if seed_raw < 0 else seed_raw
+    draft = _form_flag(form_data, "draft")
+    if draft:
+        width, height, frames, steps = draft_render_params(width, height, frames, steps, wan=True)
+    upscale_by, interpolate, upscaler = finish_stage_options(form_data, None if draft else profile)
+    trim_start, last_frame_prefix = segment_stage_options(form_data)
     positive = (form_data.get("positive_prompt", "") or "").strip()
     negative = (form_data.get("negative_prompt", "") or "").strip()
 
@@ -2912,7 +4808,8 @@ def submit_wan_i2v_scene(form_data):
     except Exception as exc:
         return {"ok": False, "message": f"Error leyendo {workflow_file.name}: {exc}"}
 
-    output_prefix = f"wan_i2v/{time.strftime('%Y%m%d_%H%M%S')}_{slugify_text(positive)[:42]}"
+    take = render_variant_prefix(draft, upscale_by, interpolate)
+    output_prefix = f"wan_i2v/{take}{time.strftime('%Y%m%d_%H%M%S')}_{slugify_text(positive)[:42]}"
 
     prompt = patch_api_workflow(
         api_wf,
@@ -2945,8 +4842,15 @@ def submit_wan_i2v_scene(form_data):
             ),
         }
 
+    prompt = append_segment_stages(prompt, trim_start, last_frame_prefix)
+    prompt = append_finish_stages(prompt, upscale_by, interpolate, upscaler)
+
     try:
-        response = comfy_api_post("/prompt", {"prompt": prompt})
+        response = comfy_submit_prompt(
+            prompt, wan_workload_for(wan_model), label=output_prefix, force=_form_flag(form_data, "force")
+        )
+    except urlerror.HTTPError as exc:
+        return comfy_http_error_result(exc)
     except Exception as exc:
         return {"ok": False, "message": f"Error enviando a ComfyUI: {exc}"}
 
@@ -2954,7 +4858,7 @@ def submit_wan_i2v_scene(form_data):
     if not prompt_id:
         return {"ok": False, "message": f"ComfyUI no aceptó el prompt: {response}"}
 
-    return {
+    return render_cache_result({
         "ok": True,
         "message": "Escena Wan I2V encolada en ComfyUI.",
         "prompt_id": prompt_id,
@@ -2963,7 +4867,11 @@ def submit_wan_i2v_scene(form_data):
         "used_image": image_name,
         "used_model": wan_model,
         "used_positive_prompt": positive,
-    }
+        "seed": seed,
+        "draft": take == "draft_",
+        "render_params": {"width": width, "height": height, "frames": frames, "steps": steps},
+        "finish": {"upscale": upscale_by, "interpolate": interpolate, "upscaler": upscaler},
+    }, response)
 
 
 def build_wan_prompt(
@@ -2983,12 +4891,15 @@ def build_wan_prompt(
     seed,
     shift,
     output_prefix,
+    interpolate=1,
+    upscale_by=1.0,
+    upscaler="lanczos",
 ):
     """Workflow built-in para Wan2.1 T2V usando ComfyUI-WanVideoWrapper (kijai).
     Nodos verificados contra nodes_model_loading.py + nodes.py + nodes_sampler.py.
     Paths: diffusion_models/ | text_encoders/ | vae/
     """
-    return {
+    prompt = {
         "1": {
             "class_type": "WanVideoModelLoader",
             "inputs": {
@@ -3075,6 +4986,7 @@ def build_wan_prompt(
             },
         },
     }
+    return append_finish_stages(prompt, upscale_by, interpolate, upscaler)
 
 
 def submit_wan_scene(form_data):
@@ -3084,13 +4996,7 @@ def submit_wan_scene(form_data):
         len((form_data.get("positive_prompt", "") or "").strip()),
         len((form_data.get("negative_prompt", "") or "").strip()),
     )
-    if not port_open(COMFY_PORT):
-        comfy_start()
-        for _ in range(20):
-            if port_open(COMFY_PORT):
-                break
-            time.sleep(0.5)
-    if not port_open(COMFY_PORT):
+    if not ensure_comfy_pool():
         return {"ok": False, "message": "ComfyUI no está disponible."}
 
     preset = get_wan_preset(form_data.get("model_preset", "wan_1b"))
@@ -3107,7 +5013,14 @@ def submit_wan_scene(form_data):
         if form_data["pix_fmt"] in ("yuv420p", "yuv420p10le")
         else "yuv420p"
     )
-    seed = max(0, int(form_data["seed"]))
+    seed_raw = int(form_data.get("seed") or -1)
+    seed = random.randint(0, 2**31) if seed_raw < 0 else seed_raw
+    draft = _form_flag(form_data, "draft")
+    if draft:
+        width, height, frames, steps = draft_render_params(width, height, frames, steps, wan=True)
+    profile = get_wan_profile(form_data.get("video_profile", "portrait_fast"))
+    upscale_by, interpolate, upscaler = finish_stage_options(form_data, None if draft else profile)
+    trim_start, last_frame_prefix = segment_stage_options(form_data)
     character_preset_id = form_data.get("character_preset", "").strip()
     positive = form_data["positive_prompt"].strip()
     negative = form_data["negative_prompt"].strip()
@@ -3167,7 +5080,8 @@ def submit_wan_scene(form_data):
     )
 
     timestamp = time.strftime("%Y%m%d_%H%M%S")
-    output_prefix = f"wan_output/{timestamp}_{slugify_text(positive)[:48]}"
+    take = render_variant_prefix(draft, upscale_by, interpolate)
+    output_prefix = f"wan_output/{take}{timestamp}_{slugify_text(positive)[:48]}"
 
     workflow_file = None
     prompt = None
@@ -3203,199 +5117,1261 @@ def submit_wan_scene(form_data):
                 except Exception:
                     continue
 
-    if prompt is None:
-        prompt = build_wan_prompt(
-            wan_model=wan_model,
-            text_encoder=text_encoder,
-            vae=vae,
-            positive=positive,
-            negative=negative,
-            width=width,
-            height=height,
-            frames=frames,
-            fps=fps,
-            steps=steps,
-            cfg=cfg,
-            crf=crf,
-            pix_fmt=pix_fmt,
-            seed=seed,
-            shift=shift,
-            output_prefix=output_prefix,
-        )
+    if prompt is None:
+        prompt = build_wan_prompt(
+            wan_model=wan_model,
+            text_encoder=text_encoder,
+            vae=vae,
+            positive=positive,
+            negative=negative,
+            width=width,
+            height=height,
+            frames=frames,
+            fps=fps,
+            steps=steps,
+            cfg=cfg,
+            crf=crf,
+            pix_fmt=pix_fmt,
+            seed=seed,
+            shift=shift,
+            output_prefix=output_prefix,
+            interpolate=interpolate,
+            upscale_by=upscale_by,
+            upscaler=upscaler,
+        )
+
+    prompt = append_segment_stages(prompt, trim_start, last_frame_prefix)
+    if workflow_file:
+        prompt = append_finish_stages(prompt, upscale_by, interpolate, upscaler)
+
+    try:
+        response = comfy_submit_prompt(
+            prompt, wan_workload_for(wan_model), label=output_prefix, force=_form_flag(form_data, "force")
+        )
+    except urlerror.HTTPError as exc:
+        return comfy_http_error_result(exc)
+    except Exception as exc:
+        return {"ok": False, "message": f"Error enviando a ComfyUI: {exc}"}
+
+    prompt_id = response.get("prompt_id")
+    if not prompt_id:
+        return {"ok": False, "message": f"ComfyUI no aceptó el prompt: {response}"}
+
+    return render_cache_result({
+        "ok": True,
+        "message": "Escena Wan2.1 encolada en ComfyUI.",
+        "prompt_id": prompt_id,
+        "output_prefix": output_prefix,
+        "workflow_mode": "external" if workflow_file else "built-in",
+        "workflow_file": workflow_file,
+        "used_model": wan_model,
+        "used_text_encoder": text_encoder,
+        "used_vae": vae,
+        "used_positive_prompt": positive,
+        "seed": seed,
+        "draft": take == "draft_",
+        "render_params": {"width": width, "height": height, "frames": frames, "steps": steps},
+        "finish": {"upscale": upscale_by, "interpolate": interpolate, "upscaler": upscaler},
+    }, response)
+
+
+def export_wan_workflow(form_data):
+    preset = get_wan_preset(form_data.get("model_preset", "wan_1b"))
+    profile = get_wan_profile(form_data.get("video_profile", "portrait_fast"))
+    output_path = WORKFLOWS_DIR / "wan_txt2vid_api.json"
+    try:
+        ensure_dir(WORKFLOWS_DIR)
+        workflow = build_wan_prompt(
+            wan_model=preset["model"],
+            text_encoder=preset["text_encoder"],
+            vae=preset["vae"],
+            positive="YOUR POSITIVE PROMPT HERE",
+            negative="worst quality, low quality, lowres, blurry, deformed, watermark",
+            width=profile["width"],
+            height=profile["height"],
+            frames=profile["frames"],
+            fps=profile["fps"],
+            steps=profile["steps"],
+            cfg=profile["cfg"],
+            crf=profile["crf"],
+            pix_fmt=profile["pix_fmt"],
+            seed=42,
+            shift=profile["shift"],
+            output_prefix="wan_output/exported",
+        )
+        output_path.write_text(
+            json.dumps(workflow, indent=2, ensure_ascii=False), encoding="utf-8"
+        )
+        return {"ok": True, "path": str(output_path), "message": "Workflow exportado."}
+    except Exception as exc:
+        return {"ok": False, "message": str(exc)}
+
+
+def default_game_tts_form():
+    preset = GAME_TTS_PERSONALITY_PRESETS[0]
+    chars = load_game_tts_character_presets()
+    piper_models = list_piper_models()
+    default_piper = Path(PIPER_MODEL_PATH).name
+    if piper_models and not any(m.get("id") == default_piper for m in piper_models):
+        default_piper = piper_models[0]["id"]
+    return {
+        "engine": "piper",
+        "piper_model": default_piper,
+        "character_id": chars[0]["id"] if chars else "hero",
+        "language": "es",
+        "personality_id": preset["id"],
+        "voice_id": preset["voice_id"],
+        "speed": preset["speed"],
+        "pitch": preset["pitch"],
+        "energy": preset["energy"],
+        "emotion_tags": preset["emotion_tags"],
+        "pauses": preset["pauses"],
+        "text": "",
+    }
+
+
+def submit_game_tts(form_data):
+    text = (form_data.get("text", "") or "").strip()
+    if not text:
+        return {"ok": False, "message": "Escribe un texto para generar audio."}
+
+    engine = (form_data.get("engine", "piper") or "piper").strip().lower()
+    language = (form_data.get("language", "es") or "es").strip().lower()
+    character_id = (form_data.get("character_id", "") or "").strip()
+    personality_id = (form_data.get("personality_id", "") or "").strip()
+    piper_model_id = (form_data.get("piper_model", "") or "").strip()
+
+    characters = load_game_tts_character_presets()
+    character = next((c for c in characters if c.get("id") == character_id), None)
+    if character is None:
+        character = characters[0] if characters else {"id": "hero", "name": "Hero", "speaker_wav": ""}
+
+    personality = dict(get_game_tts_personality(personality_id))
+    for key in ("voice_id", "emotion_tags", "pauses"):
+        if form_data.get(key) is not None:
+            personality[key] = str(form_data.get(key, "")).strip()
+    for key in ("speed", "pitch", "energy"):
+        if form_data.get(key) is not None:
+            try:
+                personality[key] = float(form_data.get(key))
+            except Exception:
+                pass
+
+    piper_model_path = ""
+    if engine == "piper":
+        selected_model = get_piper_model_by_id(piper_model_id)
+        if selected_model is None:
+            piper_models = list_piper_models()
+            if not piper_models:
+                return {"ok": False, "message": "No hay modelos Piper disponibles en ~/ai/piper."}
+            selected_model = piper_models[0]
+        piper_model_path = selected_model.get("path", "")
+
+    result: dict[str, Any] = generate_game_tts(
+        engine=engine,
+        character=character,
+        personality=personality,
+        text=text,
+        language=language,
+        piper_model_path=piper_model_path,
+    )
+    if not result.get("ok"):
+        return result
+
+    result["message"] = (
+        f"Audio generado con {engine.upper()} para {character.get('name', character.get('id', 'character'))}.\n"
+        f"Preset: {personality.get('id', 'custom')} | voice_id: {personality.get('voice_id', '')}\n"
+        f"speed={personality.get('speed', 1.0)} pitch={personality.get('pitch', 1.0)} energy={personality.get('energy', 1.0)}\n"
+        f"emotion_tags={personality.get('emotion_tags', '')} pauses={personality.get('pauses', 'medium')}"
+    )
+    result["personality"] = personality
+    result["character"] = character
+    if engine == "piper":
+        result["piper_model"] = Path(piper_model_path).name if piper_model_path else ""
+    return result
+
+
+# --- VÍDEO LARGO --------------------------------------------------------------
+# Una duración que no cabe en un lote latente se genera por segmentos encadenados: el
+# primero con Wan T2V y cada siguiente con el workflow I2V, condicionado por el último
+# frame del anterior; sus primeros RENDER_LONG_OVERLAP frames repiten ese frame y se
+# recortan en el grafo. Cada segmento es un render más de la cola y al final ffmpeg los
+# concatena sin recodificar. El pico de VRAM es el de un segmento.
+LONG_VIDEO_DIR = COMFY_DIR / "output" / "wan_long"
+RENDER_LONG_OVERLAP = max(1, int(os.environ.get("RENDER_LONG_OVERLAP", "1")))
+RENDER_LONG_MAX_SEGMENTS = int(os.environ.get("RENDER_LONG_MAX_SEGMENTS", "24"))
+
+
+def long_video_duration(form_data) -> float:
+    try:
+        return max(0.0, float(form_data.get("long_duration") or 0))
+    except ValueError:
+        return 0.0
+
+
+def plan_long_video(total_frames: int, segment_frames: int, overlap: int) -> list[int]:
+    """Frames de cada segmento para cubrir total_frames; los de continuación son 4k+1 (Wan)."""
+    plan = [segment_frames]
+    produced = segment_frames
+    while produced < total_frames:
+        need = total_frames - produced + overlap
+        frames = max(9, min(segment_frames, (need + 2) // 4 * 4 + 1))
+        plan.append(frames)
+        produced += frames - overlap
+    return plan
+
+
+def _render_result_outputs(result: dict, timeout: float | None = None) -> tuple[dict | None, list[dict]]:
+    """(backend, salidas) de un submit terminado bien, esperando a que ComfyUI acabe el render."""
+    backend_id = result.get("backend")
+    if result.get("cached"):
+        files = [
+            {"subfolder": o.rpartition("/")[0], "filename": o.rpartition("/")[2], "type": "output"}
+            for o in result.get("outputs") or []
+        ]
+    else:
+        done = wait_comfy_prompt(result["prompt_id"], timeout=timeout)
+        if not done or not done["ok"]:
+            return None, []
+        backend_id = done["backend"]
+        files = _history_output_files(done["history"])
+    return next((b for b in comfy_backends() if b["id"] == backend_id), None), files
+
+
+def _input_image_listed(backend: dict, name: str) -> bool:
+    """Si el LoadImage del object_info cacheado del backend ya ofrece name."""
+    spec = ((comfy_backend_info(backend).get("LoadImage") or {}).get("input") or {}).get("required", {}).get("image")
+    if not isinstance(spec, list) or not spec:
+        return False
+    if isinstance(spec[0], list):
+        options = spec[0]
+    else:
+        # Formato COMBO: ["COMBO", {"options": [...]}]
+        opts = spec[1] if len(spec) > 1 and isinstance(spec[1], dict) else {}
+        options = opts.get("options") or []
+    return name in options
+
+
+def _share_input_image(path: Path, name: str, skip_listed: bool = False) -> str:
+    # No se sabe qué backend renderizará el segmento siguiente: se sube a todos los vivos.
+    data = path.read_bytes()
+    shared = ""
+    for backend in comfy_backends():
+        if not comfy_backend_up(backend):
+            continue
+        if (backend["local"] and path == COMFY_DIR / "input" / name) or (
+            skip_listed and _input_image_listed(backend, name)
+        ):
+            shared = name
+            continue
+        try:
+            shared = comfy_upload_image(backend, name, data)
+        except Exception as exc:
+            log.warning("No se pudo subir %s a %s: %s", name, backend["id"], exc)
+            continue
+        comfy_pool_invalidate(backend)
+    return shared
+
+
+def concat_videos(parts: list[Path], dest: Path) -> tuple[bool, str]:
+    """Concatena con el demuxer concat de ffmpeg (-c copy): los segmentos comparten códec y parámetros."""
+    ensure_dir(dest.parent)
+    list_file = dest.with_suffix(".txt")
+    list_file.write_text(
+        "".join("file '{}'\n".format(p.resolve().as_posix().replace("'", "'\\''")) for p in parts),
+        encoding="utf-8",
+    )
+    tmp_path = dest.with_name(f".{dest.name}")
+    cmd = [FFMPEG_BIN, "-y", "-loglevel", "error", "-f", "concat", "-safe", "0", "-i", str(list_file), "-c", "copy"]
+    if dest.suffix in (".mp4", ".mov"):
+        cmd += ["-movflags", "+faststart"]
+    proc = subprocess.run(cmd + [str(tmp_path)], text=True, capture_output=True)
+    list_file.unlink(missing_ok=True)
+    if proc.returncode != 0:
+        tmp_path.unlink(missing_ok=True)
+        return False, proc.stderr.strip()
+    os.replace(tmp_path, dest)
+    return True, ""
+
+
+def _job_wan_long(args: dict) -> dict:
+    job_id = args.pop("_job_id", "")
+    if not ffmpeg_available():
+        return {"ok": False, "message": f"El vídeo largo necesita ffmpeg para unir segmentos ({FFMPEG_BIN})."}
+    try:
+        fps = clamp_step(int(args.get("fps") or 16), 4, 30, 1)
+        segment_frames = clamp_step(int(args.get("frames") or 33), 9, 121, 1)
+    except ValueError:
+        return {"ok": False, "message": "FPS o frames no válidos."}
+    overlap = min(RENDER_LONG_OVERLAP, segment_frames - 2)
+    plan = plan_long_video(round(long_video_duration(args) * fps), segment_frames, overlap)
+    if len(plan) > RENDER_LONG_MAX_SEGMENTS:
+        return {
+            "ok": False,
+            "message": (
+                f"Serían {len(plan)} segmentos (máximo {RENDER_LONG_MAX_SEGMENTS}): "
+                "reduce la duración o sube los frames por segmento."
+            ),
+        }
+    if len(plan) > 1 and not any((WORKFLOWS_DIR / f).exists() for f in ("wan_i2v_api.json", "wan_i2v.json")):
+        return {
+            "ok": False,
+            "message": "Los segmentos se encadenan con el workflow I2V: exporta wan_i2v_api.json en ComfyUI/workflows/.",
+        }
+
+    # El I2V no resuelve perfiles de personaje: el prompt se fija aquí para todos los segmentos.
+    character = get_character_video_prompt_preset((args.get("character_preset") or "").strip()) or {}
+    positive = (args.get("positive_prompt") or "").strip() or (character.get("positive_prompt") or "").strip()
+    negative = (args.get("negative_prompt") or "").strip() or (character.get("negative_prompt") or "").strip()
+    seed_raw = int(args.get("seed") or -1)
+    seed = random.randint(0, 2**31) if seed_raw < 0 else seed_raw
+    base = f"{time.strftime('%Y%m%d_%H%M%S')}_{slugify_text(positive)[:40]}"
+    work_dir = LONG_VIDEO_DIR / f".{base}"
+    parts, segment_jobs, image_name = [], [], ""
+
+    def _fail(message: str) -> dict:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        return {"ok": False, "message": message, "segment_jobs": segment_jobs, "seed": seed}
+
+    for i, frames in enumerate(plan):
+        tag = f"{i + 1}/{len(plan)}"
+        seg_args = {k: v for k, v in args.items() if k not in ("long_duration", "draft", *POSTPROC_FIELDS)}
+        seg_args.update(positive_prompt=positive, negative_prompt=negative, frames=str(frames), seed=str(seed))
+        if i:
+            seg_args.update(image_name=image_name, segment_trim=str(overlap))
+        if i < len(plan) - 1:
+            seg_args["segment_last_frame"] = f"wan_long/{base}/seg{i:02d}_last"
+        seg_job = enqueue_job("wan_i2v_scene" if i else "wan_scene", seg_args, label=f"vídeo largo {tag}")
+        segment_jobs.append(seg_job["id"])
+        set_job_progress(job_id, f"Segmento {tag} ({frames} frames) en cola o renderizando...")
+        result = wait_job_response(seg_job["id"])
+        if not result.get("ok"):
+            return _fail(f"Segmento {tag}: {result.get('message', 'falló')}")
+        backend, files = _render_result_outputs(result, timeout=COMFY_RESUBMIT_MAX_S)
+        video = next((f for f in files if f["filename"].lower().endswith(VIDEO_EXTS)), None)
+        if backend is None or video is None:
+            return _fail(f"Segmento {tag}: ComfyUI no produjo vídeo.")
+        parts.append(comfy_fetch_output(backend, video, work_dir / f"seg{i:02d}{Path(video['filename']).suffix}"))
+        if "segment_last_frame" not in seg_args:
+            break
+        frame_prefix = Path(seg_args["segment_last_frame"]).name
+        frame = next((f for f in files if f["filename"].startswith(frame_prefix)), None)
+        if frame is None:
+            return _fail(f"Segmento {tag}: falta su último frame para encadenar el siguiente.")
+        frame_path = comfy_fetch_output(backend, frame, work_dir / f"seg{i:02d}_last.png")
+        image_name = _share_input_image(frame_path, f"wan_long_{base}_seg{i + 1:02d}.png")
+        if not image_name:
+            return _fail(f"Segmento {tag}: no se pudo subir el último frame a ComfyUI.")
+
+    set_job_progress(job_id, f"Uniendo {len(parts)} segmentos con ffmpeg...")
+    dest = LONG_VIDEO_DIR / f"{base}{parts[0].suffix}"
+    ok, err = concat_videos(parts, dest)
+    if not ok:
+        return _fail(f"ffmpeg no pudo unir los segmentos: {err}")
+    shutil.rmtree(work_dir, ignore_errors=True)
+    total = sum(plan) - overlap * (len(plan) - 1)
+    return {
+        "ok": True,
+        "message": f"Vídeo largo listo: {len(plan)} segmentos, {total} frames (~{total / fps:.1f}s).",
+        "output": str(dest),
+        "output_prefix": f"wan_long/{dest.name}",
+        "segment_frames": plan,
+        "segment_jobs": segment_jobs,
+        "overlap": overlap,
+        "seed": seed,
+    }
+
+
+# --- POSTPROCESO DE VÍDEO -----------------------------------------------------
+# Trabajos ffmpeg sobre los renders: unir clips (concat sin recodificar si comparten
+# códec), mezclar una locución WAV de voice_out y transcodificar a MP4 web (H.264 + AAC,
+# faststart). Corren en la cola con la clase "media" (LANDING_JOB_LIMITS, 2 por defecto):
+# cada hilo solo espera a su proceso ffmpeg. Un render pedido con post_audio/post_web
+# encola el suyo en cuanto ComfyUI lo termina.
+POSTPROC_DIR = COMFY_DIR / "output" / "postproc"
+POSTPROC_WEB_CRF = int(os.environ.get("POSTPROC_WEB_CRF", "23"))
+POSTPROC_WEB_PRESET = os.environ.get("POSTPROC_WEB_PRESET", "veryfast")
+POSTPROC_AUDIO_BITRATE = os.environ.get("POSTPROC_AUDIO_BITRATE", "192k")
+POSTPROC_FIELDS = ("post_audio", "post_web")
+
+# prompt_id -> args de los postprocesos pedidos, hasta que el render termina (bajo
+# _comfy_done_cv). Es una lista: renders deduplicados comparten prompt_id.
+_render_postproc: dict[str, list[dict]] = {}
+# render job -> postproceso encolado antes de que el worker guarde su result (bajo _jobs_cv).
+_render_postproc_jobs: dict[str, str] = {}
+
+
+def postproc_options(form_data) -> dict:
+    audio = Path((form_data.get("post_audio") or "").strip()).name
+    web = _form_flag(form_data, "post_web")
+    return {"audio": audio, "web": web} if audio or web else {}
+
+
+def _postproc_audio_path(name: str) -> Path | None:
+    path = VOICE_OUT_DIR / Path(name).name
+    return path if path.suffix.lower() == ".wav" and path.is_file() else None
+
+
+def _concat_reencode(parts: list[Path], dest: Path) -> str:
+    # Códecs o parámetros distintos: el filtro concat recodifica (misma resolución).
+    inputs = [a for p in parts for a in ("-i", str(p))]
+    graph = "".join(f"[{i}:v:0]" for i in range(len(parts))) + f"concat=n={len(parts)}:v=1:a=0[v]"
+    return _run_ffmpeg(
+        [*inputs, "-filter_complex", graph, "-map", "[v]", "-c:v", "libx264", "-preset", POSTPROC_WEB_PRESET,
+         "-crf", str(POSTPROC_WEB_CRF), "-pix_fmt", "yuv420p"],
+        dest,
+    )
+
+
+def _finish_args(src: Path, audio: Path | None, web: bool) -> list[str]:
+    args = ["-i", str(src)]
+    if audio is not None:
+        # Sin -shortest: la locución entera aunque el clip sea más corto.
+        args += ["-i", str(audio), "-map", "0:v:0", "-map", "1:a:0"]
+    if web:
+        args += ["-vf", "scale=trunc(iw/2)*2:trunc(ih/2)*2", "-c:v", "libx264", "-preset", POSTPROC_WEB_PRESET,
+                 "-crf", str(POSTPROC_WEB_CRF), "-pix_fmt", "yuv420p"]
+    else:
+        args += ["-c:v", "copy"]
+    return args + ["-c:a", "aac", "-b:a", POSTPROC_AUDIO_BITRATE, "-movflags", "+faststart"]
+
+
+def _job_postproc(args: dict) -> dict:
+    job_id = args.pop("_job_id", "")
+    if not ffmpeg_available():
+        return {"ok": False, "message": f"El postproceso necesita ffmpeg ({FFMPEG_BIN})."}
+    audio_name = args.get("audio") or ""
+    audio = _postproc_audio_path(audio_name) if audio_name else None
+    if audio_name and audio is None:
+        return {"ok": False, "message": f"No existe el WAV {audio_name} en voice_out."}
+    web = bool(args.get("web"))
+    work_dir = POSTPROC_DIR / f".work_{os.urandom(4).hex()}"
+    try:
+        parts = []
+        for rel in args.get("videos") or []:
+            path = gallery_video_path(rel)
+            if path is None:
+                return {"ok": False, "message": f"Vídeo no encontrado en ComfyUI/output: {rel}"}
+            parts.append(path)
+        # Salidas de un render: en backends remotos se descargan primero.
+        backend = next((b for b in comfy_backends() if b["id"] == args.get("backend")), None)
+        for i, item in enumerate(args.get("files") or []):
+            if backend is None:
+                return {"ok": False, "message": f"Backend ComfyUI desconocido: {args.get('backend')}"}
+            parts.append(comfy_fetch_output(backend, item, work_dir / f"in{i:02d}{Path(item['filename']).suffix}"))
+        if not parts:
+            return {"ok": False, "message": "No hay vídeos que postprocesar."}
+        if len(parts) == 1 and audio is None and not web:
+            return {"ok": False, "message": "Nada que hacer: un solo vídeo sin audio ni transcodificación web."}
+
+        ensure_dir(work_dir)
+        base = args.get("name") or parts[0].stem
+        # Sufijo del trabajo: otro postproceso del mismo vídeo no pisa este.
+        tag = job_id.rpartition("-")[2] or os.urandom(3).hex()
+        src = parts[0]
+        if len(parts) > 1:
+            set_job_progress(job_id, f"Uniendo {len(parts)} clips...")
+            src = work_dir / f"joined{parts[0].suffix}"
+            ok, err = concat_videos(parts, src)
+            if not ok:
+                src = work_dir / "joined.mp4"
+                err = _concat_reencode(parts, src)
+                if err:
+                    return {"ok": False, "message": f"ffmpeg no pudo unir los clips: {err}"}
+            base += f"_x{len(parts)}"
+        ensure_dir(POSTPROC_DIR)
+        if audio is None and not web:
+            dest = POSTPROC_DIR / f"{base}_{tag}{src.suffix}"
+            os.replace(src, dest)
+        else:
+            set_job_progress(job_id, "Mezclando audio y transcodificando..." if web else "Mezclando audio...")
+            dest = POSTPROC_DIR / f"{base}{'_voz' if audio else ''}{'_web' if web else ''}_{tag}.mp4"
+            err = _run_ffmpeg(_finish_args(src, audio, web), dest)
+            if err and not web:
+                # El códec del render no cabe en MP4 con -c copy: se recodifica.
+                err = _run_ffmpeg(_finish_args(src, audio, True), dest)
+            if err:
+                return {"ok": False, "message": f"ffmpeg falló: {err}"}
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    invalidate_output_catalog()
+    return {
+        "ok": True,
+        "message": f"Postproceso listo: {dest.name}",
+        "output": str(dest),
+        "output_prefix": f"postproc/{dest.name}",
+        "render_job": args.get("render_job"),
+    }
+
+
+def _enqueue_render_postproc(post: dict, done: dict) -> str:
+    files = [f for f in _history_output_files(done["history"] or {}) if f["filename"].lower().endswith(VIDEO_EXTS)]
+    if not done["ok"] or not files:
+        log.warning("Render %s sin vídeo: no se postprocesa.", post.get("render_job"))
+        return ""
+    post = dict(post, backend=done["backend"], files=files)
+    return enqueue_job("postproc", post, label=f"postproceso {post.get('render_job', '')}")["id"]
+
+
+def _set_render_postproc_job(result: dict, post_job: str):
+    # post_job vacío: el render no dejó vídeo y no hay postproceso.
+    result.pop("postproc", None)
+    if post_job:
+        result["postproc_job"] = post_job
+
+
+def attach_render_postproc(job_id: str, args: dict, result: dict):
+    """Programa el postproceso pedido en args para cuando el render de result tenga salidas."""
+    opts = postproc_options(args)
+    if not opts or not result.get("ok"):
+        return
+    post = dict(opts, render_job=job_id)
+    if result.get("output"):
+        # Vídeo largo: ya está unido en ComfyUI/output.
+        post["videos"] = [result["output_prefix"]]
+        result["postproc_job"] = enqueue_job("postproc", post, label=f"postproceso {job_id}")["id"]
+        return
+    if result.get("cached"):
+        _, files = _render_result_outputs(result)
+        files = [f for f in files if f["filename"].lower().endswith(VIDEO_EXTS)]
+        if files:
+            post.update(backend=result.get("backend"), files=files)
+            result["postproc_job"] = enqueue_job("postproc", post, label=f"postproceso {job_id}")["id"]
+        return
+    with _comfy_done_cv:
+        done = _comfy_done.get(result.get("prompt_id"))
+        if done is None:
+            # Aún renderizando: lo encola _finish_comfy_prompt.
+            _render_postproc.setdefault(result.get("prompt_id"), []).append(post)
+            result["postproc"] = "pending"
+            result["message"] = f"{result.get('message', '')} El postproceso arrancará al terminar el render.".strip()
+            return
+    result["postproc_job"] = _enqueue_render_postproc(post, done)
+
+
+# --- COLA DE TRABAJOS ---------------------------------------------------------
+# Scheduler en proceso: cada trabajo pertenece a una clase de recurso con su límite de
+# concurrencia y se ordena por prioridad (menor = antes). El estado se guarda en RUN_DIR
+# para que lo encolado sobreviva a un reinicio de la landing.
+JOB_PRIORITY_INTERACTIVE = 0
+JOB_PRIORITY_NORMAL = 5
+JOB_PRIORITY_BATCH = 10
+
+JOB_STATE_FILE = RUN_DIR / "jobs.json"
+JOB_HISTORY_LIMIT = 200
+JOB_HTTP_WAIT_S = float(os.environ.get("LANDING_JOB_HTTP_WAIT_S", "2.0"))
+
+
+def _parse_job_limits(raw: str) -> dict[str, int]:
+    limits = {"gpu": 1, "cpu-tts": 2, "network-download": 1, "ollama": 1, "disk": 1, "chain": 1, "media": 2}
+    for part in raw.split(","):
+        if "=" not in part:
+            continue
+        key, val = part.split("=", 1)
+        try:
+            limits[key.strip()] = max(1, int(val))
+        except ValueError:
+            continue
+    return limits
+
+
+JOB_LIMITS = _parse_job_limits(os.environ.get("LANDING_JOB_LIMITS", ""))
+
+# Afinidad de modelos: los renders esperan en la landing mientras el pool ComfyUI está
+# ocupado y se despachan agrupados por (checkpoint, motion model, text encoder, VAE)
+# para no descargar/recargar checkpoints de varios GB entre prompts.
+RENDER_INFLIGHT_PER_BACKEND = max(1, int(os.environ.get("RENDER_INFLIGHT_PER_BACKEND", "1")))
+RENDER_AFFINITY_HOLD_S = float(os.environ.get("RENDER_AFFINITY_HOLD_S", "2"))
+RENDER_AFFINITY_MAX_SKIPS = int(os.environ.get("RENDER_AFFINITY_MAX_SKIPS", "3"))
+RENDER_AFFINITY_MAX_WAIT_S = float(os.environ.get("RENDER_AFFINITY_MAX_WAIT_S", "900"))
+
+_jobs: dict[str, dict] = {}
+_job_queues: dict[str, list] = {}
+_jobs_cv = threading.Condition()
+_job_workers: list[threading.Thread] = []
+_job_seq = [0]
+_job_state = {"draining": False}
+_render_sched = {
+    "current": None,
+    "last_enqueued": None,
+    "dispatched": 0,
+    "swaps": 0,
+    "fifo_swaps": 0,
+    "saved_s": 0.0,
+    "forced": 0,
+}
+
+
+def _job_ollama_pull(args: dict) -> dict:
+    return ollama_pull_model(str(args.get("model", "")).strip())
+
+
+def _job_ollama_create(args: dict) -> dict:
+    return ollama_create_custom_model(
+        str(args.get("model_name", "")).strip(),
+        str(args.get("base_model", "")).strip(),
+        str(args.get("system_prompt", "")),
+    )
+
+
+def _job_voice_retention(args: dict) -> dict:
+    return compact_voice_out()
+
+
+def _game_tts_resource(args: dict) -> str:
+    # XTTS usa GPU si la hay; Piper es CPU pura.
+    return "gpu" if (args.get("engine") or "").strip().lower() == "xtts" else "cpu-tts"
+
+
+def _video_affinity(args: dict) -> tuple[list, str]:
+    # El motion model se resuelve a partir del checkpoint: basta con este.
+    preset = get_video_preset(args.get("model_preset", "wai_nsfw"))
+    return ["animatediff", preset["checkpoint"]], "animatediff_sdxl"
+
+
+def _wan_affinity(args: dict) -> tuple[list, str]:
+    preset = get_wan_preset(args.get("model_preset", "wan_1b"))
+    return ["wan", preset["model"], preset["text_encoder"], preset["vae"]], wan_workload_for(preset["model"])
+
+
+def _wan_i2v_affinity(args: dict) -> tuple[list, str]:
+    preset = get_wan_preset(args.get("model_preset", "wan_1b"))
+    return ["wan_i2v", preset["id"], preset["text_encoder"], preset["vae"]], wan_workload_for(preset["model"])
+
+
+JOB_KINDS = {
+    "video_scene": {
+        "fn": submit_video_scene, "resource": "gpu", "priority": JOB_PRIORITY_BATCH, "affinity": _video_affinity,
+    },
+    "wan_scene": {
+        "fn": submit_wan_scene, "resource": "gpu", "priority": JOB_PRIORITY_BATCH, "affinity": _wan_affinity,
+    },
+    "wan_i2v_scene": {
+        "fn": submit_wan_i2v_scene, "resource": "gpu", "priority": JOB_PRIORITY_BATCH, "affinity": _wan_i2v_affinity,
+    },
+    "game_tts": {"fn": submit_game_tts, "resource": _game_tts_resource, "priority": JOB_PRIORITY_INTERACTIVE},
+    "ollama_pull": {"fn": _job_ollama_pull, "resource": "network-download", "priority": JOB_PRIORITY_NORMAL},
+    "ollama_create": {"fn": _job_ollama_create, "resource": "ollama", "priority": JOB_PRIORITY_NORMAL},
+    "voice_retention": {"fn": _job_voice_retention, "resource": "disk", "priority": JOB_PRIORITY_BATCH},
+    "wan_long": {"fn": _job_wan_long, "resource": "chain", "priority": JOB_PRIORITY_BATCH},
+    "postproc": {"fn": _job_postproc, "resource": "media", "priority": JOB_PRIORITY_NORMAL},
+}
+
+
+def _save_jobs_locked():
+    finished = [j for j in _jobs.values() if j["status"] not in ("queued", "running")]
+    finished.sort(key=lambda j: j.get("finished") or 0)
+    for old in finished[:-JOB_HISTORY_LIMIT]:
+        _jobs.pop(old["id"], None)
+    tmp = JOB_STATE_FILE.with_suffix(".tmp")
+    try:
+        tmp.write_text(json.dumps(list(_jobs.values()), ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, JOB_STATE_FILE)
+    except Exception as exc:
+        log.warning("No se pudo guardar la cola de trabajos: %s", exc)
+
+
+def _push_job_locked(job: dict):
+    _job_seq[0] += 1
+    heap = _job_queues.setdefault(job["resource"], [])
+    heapq.heappush(heap, (job["priority"], _job_seq[0], job["id"]))
+    _jobs_cv.notify_all()
+
+
+def _render_capacity_free() -> bool:
+    inflight, live = comfy_pool_load()
+    return inflight < RENDER_INFLIGHT_PER_BACKEND * max(1, live)
+
+
+def _select_job_locked(resource: str) -> str | None:
+    """Siguiente job de resource; None si no hay ninguno elegible todavía.
+
+    Los jobs sin afinidad salen por prioridad y orden de llegada. Los renders esperan a
+    que el pool ComfyUI tenga hueco y, dentro de la mejor prioridad, pasa primero el que
+    usa los modelos ya cargados; uno con otros modelos espera RENDER_AFFINITY_HOLD_S por
+    si llegan más del grupo actual. Un render adelantado RENDER_AFFINITY_MAX_SKIPS veces
+    o que lleva RENDER_AFFINITY_MAX_WAIT_S en cola sale el siguiente.
+    """
+    heap = _job_queues.setdefault(resource, [])
+    live = [e for e in heap if _jobs.get(e[2], {}).get("status") == "queued"]
+    if len(live) != len(heap):
+        heap[:] = live
+        heapq.heapify(heap)
+    if not heap:
+        return None
+    ordered = sorted(heap)
+    best_prio = ordered[0][0]
+    candidates = [_jobs[e[2]] for e in ordered if e[0] == best_prio]
+    chosen = None
+    if not candidates[0].get("affinity"):
+        chosen = candidates[0]
+    elif _render_capacity_free():
+        now = time.time()
+        current = _render_sched["current"]
+        renders = [j for j in candidates if j.get("affinity")]
+        chosen = next(
+            (
+                j
+                for j in renders
+                if j.get("skips", 0) >= RENDER_AFFINITY_MAX_SKIPS or now - j["created"] >= RENDER_AFFINITY_MAX_WAIT_S
+            ),
+            None,
+        )
+        if chosen is not None and chosen["affinity"] != current:
+            _render_sched["forced"] += 1
+        if chosen is None:
+            chosen = next((j for j in renders if j["affinity"] == current), None)
+        if chosen is None:
+            head = renders[0]
+            if current is None or now - head["created"] >= RENDER_AFFINITY_HOLD_S:
+                chosen = head
+        if chosen is not None:
+            for j in renders:
+                if j is chosen:
+                    break
+                j["skips"] = j.get("skips", 0) + 1
+            _note_render_dispatch_locked(chosen)
+    if chosen is None:
+        # Los jobs sin afinidad detrás de renders retenidos no se quedan bloqueados.
+        chosen = next((_jobs[e[2]] for e in ordered if not _jobs[e[2]].get("affinity")), None)
+    if chosen is None:
+        return None
+    heap[:] = [e for e in heap if e[2] != chosen["id"]]
+    heapq.heapify(heap)
+    return chosen["id"]
+
+
+def _note_render_dispatch_locked(job: dict):
+    sched = _render_sched
+    swapped = sched["current"] is not None and job["affinity"] != sched["current"]
+    fifo_swap = bool(job.get("fifo_swap"))
+    sched["dispatched"] += 1
+    sched["swaps"] += int(swapped)
+    sched["fifo_swaps"] += int(fifo_swap)
+    sched["saved_s"] += (int(fifo_swap) - int(swapped)) * job.get("swap_s", 0.0)
+    sched["current"] = job["affinity"]
+
+
+def render_affinity_stats() -> dict:
+    with _jobs_cv:
+        sched = dict(_render_sched)
+        held = sum(
+            1 for j in _jobs.values() if j["status"] == "queued" and j.get("affinity")
+        )
+    return {
+        "current": sched["current"],
+        "held": held,
+        "dispatched": sched["dispatched"],
+        "swaps": sched["swaps"],
+        "fifo_swaps": sched["fifo_swaps"],
+        "swaps_avoided": sched["fifo_swaps"] - sched["swaps"],
+        "time_saved_s": round(sched["saved_s"], 1),
+        "forced_by_fairness": sched["forced"],
+        "inflight_per_backend": RENDER_INFLIGHT_PER_BACKEND,
+    }
+
+
+def load_job_state():
+    if not JOB_STATE_FILE.exists():
+        return
+    try:
+        saved = json.loads(JOB_STATE_FILE.read_text(encoding="utf-8"))
+    except Exception as exc:
+        log.warning("Cola de trabajos ilegible (%s); se ignora.", exc)
+        return
+    requeued = 0
+    with _jobs_cv:
+        for job in sorted(saved, key=lambda j: j.get("created", 0)):
+            if job.get("kind") not in JOB_KINDS or job.get("id") in _jobs:
+                continue
+            if job.get("status") == "running":
+                # No sabemos hasta dónde llegó: no se reintenta para evitar duplicados.
+                job["status"] = "interrupted"
+                job["finished"] = time.time()
+                job["result"] = {"ok": False, "message": "Interrumpido por reinicio de la landing."}
+            _jobs[job["id"]] = job
+            if job["status"] == "queued":
+                _push_job_locked(job)
+                requeued += 1
+        _save_jobs_locked()
+    if requeued:
+        log.info("Cola de trabajos restaurada: %s pendientes", requeued)
+
+
+RENDER_JOB_KINDS = ("video_scene", "wan_scene", "wan_i2v_scene")
+
+
+def enqueue_job(
+    kind: str, args: dict, priority: int | None = None, label: str = "", parent: str = ""
+) -> dict:
+    spec = JOB_KINDS[kind]
+    resource = spec["resource"](args) if callable(spec["resource"]) else spec["resource"]
+    job = {
+        "id": f"{kind}-{time.strftime('%Y%m%d%H%M%S')}-{os.urandom(3).hex()}",
+        "kind": kind,
+        "resource": resource,
+        "priority": spec["priority"] if priority is None else int(priority),
+        "label": label,
+        "args": args,
+        "status": "queued",
+        "result": None,
+        "created": time.time(),
+        "started": None,
+        "finished": None,
+        "parent": parent or None,
+        "promoted_to": [],
+    }
+    if spec.get("affinity"):
+        job["affinity"], workload = spec["affinity"](args)
+        job["swap_s"] = WORKLOAD_PROFILES.get(workload, {}).get("swap_s", 0.0)
+    start_job_workers()
+    with _jobs_cv:
+        if job.get("affinity"):
+            # Contrafactual FIFO: ¿habría cambiado de modelos respecto al anterior encolado?
+            last = _render_sched["last_enqueued"]
+            job["fifo_swap"] = last is not None and last != job["affinity"]
+            _render_sched["last_enqueued"] = job["affinity"]
+        _jobs[job["id"]] = job
+        if parent and parent in _jobs:
+            _jobs[parent].setdefault("promoted_to", []).append(job["id"])
+        _push_job_locked(job)
+        _save_jobs_locked()
+    log.info("Job encolado: %s (%s, prio=%s)", job["id"], resource, job["priority"])
+    return dict(job)
+
+
+def _job_worker(resource: str):
+    while True:
+        with _jobs_cv:
+            heap = _job_queues.setdefault(resource, [])
+            # Durante el apagado no se arrancan trabajos nuevos: quedan en cola para el reinicio.
+            while True:
+                job_id = None if _job_state["draining"] else _select_job_locked(resource)
+                if job_id is not None:
+                    break
+                # Con renders retenidos se reevalúa periódicamente (hold, hueco en el pool).
+                _jobs_cv.wait(timeout=1.0 if heap else None)
+            job = _jobs[job_id]
+            job["status"] = "running"
+            job["started"] = time.time()
+            _save_jobs_locked()
+
+        try:
+            result = JOB_KINDS[job["kind"]]["fn"](dict(job["args"], _job_id=job_id))
+        except Exception as exc:
+            log.exception("Job %s falló", job_id)
+            result = {"ok": False, "message": f"Error interno: {exc}"}
+        if not isinstance(result, dict):
+            result = {"ok": bool(result)}
+        if job["kind"] in RENDER_JOB_KINDS or job["kind"] == "wan_long":
+            try:
+                attach_render_postproc(job_id, job["args"], result)
+            except Exception as exc:
+                log.warning("No se pudo programar el postproceso de %s: %s", job_id, exc)
+
+        with _jobs_cv:
+            if job_id in _render_postproc_jobs:
+                _set_render_postproc_job(result, _render_postproc_jobs.pop(job_id))
+            job["result"] = result
+            job["status"] = "done" if result.get("ok") else "failed"
+            job["finished"] = time.time()
+            _save_jobs_locked()
+            _jobs_cv.notify_all()
+
+
+def start_job_workers():
+    with _jobs_cv:
+        if _job_workers:
+            return
+        for resource, limit in JOB_LIMITS.items():
+            for i in range(limit):
+                t = threading.Thread(
+                    target=_job_worker, args=(resource,), name=f"job-{resource}-{i}", daemon=True
+                )
+                _job_workers.append(t)
+                t.start()
+
+
+def _queue_position_locked(job: dict) -> int:
+    heap = _job_queues.get(job["resource"], [])
+    ahead = [e for e in heap if e[2] != job["id"] and _jobs.get(e[2], {}).get("status") == "queued"]
+    mine = next((e for e in heap if e[2] == job["id"]), None)
+    if mine is None:
+        return 0
+    return 1 + sum(1 for e in ahead if e < mine)
+
+
+def _render_job_state(result: dict) -> str:
+    if result.get("cached") or not result.get("prompt_id"):
+        return "done"
+    return comfy_prompt_state(result["prompt_id"])
+
+
+def job_response(job_id: str) -> dict:
+    with _jobs_cv:
+        job = _jobs.get(job_id)
+        if job is None:
+            return {"ok": False, "message": "Job no encontrado.", "job_id": job_id, "status": "unknown"}
+        status = job["status"]
+        if status in ("queued", "running"):
+            pos = _queue_position_locked(job) if status == "queued" else 0
+            return {
+                "ok": True,
+                "job_id": job_id,
+                "status": status,
+                "position": pos,
+                "message": (
+                    f"En cola ({job['resource']}, posición {pos})..." if pos else job.get("progress") or "En ejecución..."
+                ),
+            }
+        response = {
+            **(job.get("result") or {}),
+            "job_id": job_id,
+            "status": status,
+            "parent": job.get("parent"),
+            "promoted_to": list(job.get("promoted_to") or []),
+        }
+        is_render = job["kind"] in RENDER_JOB_KINDS and status == "done"
+    if is_render:
+        response["render_state"] = _render_job_state(response)
+    return response
+
+
+def wait_job_response(job_id: str, timeout: float | None = None) -> dict:
+    deadline = None if timeout is None else time.time() + timeout
+    with _jobs_cv:
+        while True:
+            job = _jobs.get(job_id)
+            if job is None or job["status"] not in ("queued", "running"):
+                break
+            remaining = None if deadline is None else deadline - time.time()
+            if remaining is not None and remaining <= 0:
+                break
+            _jobs_cv.wait(timeout=remaining)
+    return job_response(job_id)
+
+
+def stop_starting_jobs():
+    """Los workers dejan de arrancar trabajos; lo encolado queda para el reinicio."""
+    with _jobs_cv:
+        _job_state["draining"] = True
+        _jobs_cv.notify_all()
+
+
+def drain_jobs(timeout: float) -> bool:
+    """Deja de arrancar trabajos y espera a los que están en ejecución."""
+    stop_starting_jobs()
+    deadline = time.time() + timeout
+    with _jobs_cv:
+        while True:
+            running = [j["id"] for j in _jobs.values() if j["status"] == "running"]
+            remaining = deadline - time.time()
+            if not running or remaining <= 0:
+                break
+            log.info("Esperando %s trabajos en curso: %s", len(running), ", ".join(running))
+            _jobs_cv.wait(timeout=min(5.0, remaining))
+        _save_jobs_locked()
+    if running:
+        log.warning("Apagado con trabajos aún en curso: %s", ", ".join(running))
+    return not running
+
+
+def set_job_progress(job_id: str, message: str):
+    with _jobs_cv:
+        job = _jobs.get(job_id)
+        if job is not None:
+            job["progress"] = message
+            _jobs_cv.notify_all()
+
+
+def cancel_job(job_id: str) -> dict:
+    with _jobs_cv:
+        job = _jobs.get(job_id)
+        if job is None:
+            return {"ok": False, "message": "Job no encontrado."}
+        if job["status"] != "queued":
+            return {"ok": False, "message": f"Solo se cancelan trabajos en cola (estado: {job['status']})."}
+        job["status"] = "cancelled"
+        job["finished"] = time.time()
+        job["result"] = {"ok": False, "message": "Cancelado."}
+        _save_jobs_locked()
+        _jobs_cv.notify_all()
+    return {"ok": True, "message": f"Job cancelado: {job_id}"}
+
+
+def promote_render_job(job_id: str, mode: str = "full", upscale: float = 2.0, interpolate: int = 2) -> dict:
+    """Reencola un borrador terminado como final, con la misma semilla y los mismos prompts.
+
+    mode=full repite el render con el perfil completo; mode=finish repite el borrador
+    (idéntico) y le añade interpolación y escalado.
+    """
+    with _jobs_cv:
+        job = _jobs.get(job_id)
+        if job is None:
+            return {"ok": False, "message": "Job no encontrado."}
+        result = job.get("result") or {}
+        if job["kind"] not in RENDER_JOB_KINDS or job["status"] != "done" or not result.get("draft"):
+            return {"ok": False, "message": "Solo se promocionan borradores de render terminados."}
+        args = dict(job["args"])
+        label = job.get("label") or job["kind"]
+    # El job queda "done" en cuanto ComfyUI acepta el prompt: hay que esperar al render.
+    state = _render_job_state(result)
+    if state == "rendering":
+        return {"ok": False, "message": "El borrador aún se está renderizando en ComfyUI; promociónalo cuando termine."}
+    if state == "failed":
+        return {"ok": False, "message": "El borrador falló en ComfyUI: no hay nada que promocionar."}
+    args["seed"] = str(result.get("seed", args.get("seed", "")))
+    args["force"] = ""
+    if mode == "finish":
+        args["draft"] = "1"
+        args["finish_draft"] = "1"
+        args["upscale"] = str(upscale)
+        args["interpolate"] = str(interpolate)
+    elif mode == "full":
+        args["draft"] = ""
+        args["finish_draft"] = ""
+        args.pop("upscale", None)
+        args.pop("interpolate", None)
+    else:
+        return {"ok": False, "message": f"Modo de promoción desconocido: {mode}"}
+    new_job = enqueue_job(job["kind"], args, label=f"{label} (final)", parent=job_id)
+    return {"ok": True, "job_id": new_job["id"], "parent": job_id, "mode": mode}
+
+
+def list_jobs(limit: int = 50) -> list[dict]:
+    with _jobs_cv:
+        jobs = sorted(_jobs.values(), key=lambda j: j["created"], reverse=True)[:limit]
+        return [
+            {
+                k: j.get(k)
+                for k in (
+                    "id", "kind", "resource", "priority", "label", "status", "created", "started", "finished",
+                    "parent", "promoted_to",
+                )
+            }
+            for j in jobs
+        ]
+
+
+# --- FLASK APP ----------------------------------------------------------------
+app = Flask(__name__)
+
+STATIC_DIR = REPO_DIR / "static"
+STATIC_MAX_AGE_S = 365 * 24 * 3600
 
-    try:
-        response = comfy_api_post("/prompt", {"prompt": prompt})
-    except urlerror.HTTPError as exc:
-        raw = exc.read().decode("utf-8", errors="ignore")
-        try:
-            err_body = json.loads(raw)
-            err = err_body.get("error", {})
-            node_errors = err_body.get("node_errors", {})
-            msg = err.get("message", exc.reason)
-            detail = err.get("details", "")
-            if node_errors:
-                missing_nodes = [
-                    v.get("class_type", nid)
-                    for nid, v in node_errors.items()
-                    if "does not exist" in str(v.get("errors", ""))
-                ]
-                if missing_nodes:
-                    msg = (
-                        f"Nodos no encontrados: {', '.join(missing_nodes)}. "
-                        "Instala el custom node y reinicia ComfyUI."
-                    )
-            full = f"HTTP {exc.code}: {msg}"
-            if detail and detail not in msg:
-                full += f" ({detail})"
-        except Exception:
-            full = f"HTTP {exc.code}: {raw or exc.reason}"
-        return {"ok": False, "message": full}
-    except Exception as exc:
-        return {"ok": False, "message": f"Error enviando a ComfyUI: {exc}"}
+PAGE_TEMPLATES = {
+    "index": HTML,
+    "video_tool": VIDEO_TOOL_HTML,
+    "wan_tool": WAN_TOOL_HTML,
+    "wan_i2v_tool": WAN_I2V_TOOL_HTML,
+    "game_tts": GAME_TTS_HTML,
+    "ollama_models": OLLAMA_MODELS_HTML,
+}
+_compiled_templates = {}
 
-    prompt_id = response.get("prompt_id")
-    if not prompt_id:
-        return {"ok": False, "message": f"ComfyUI no aceptó el prompt: {response}"}
 
-    return {
-        "ok": True,
-        "message": "Escena Wan2.1 encolada en ComfyUI.",
-        "prompt_id": prompt_id,
-        "output_prefix": output_prefix,
-        "workflow_mode": "external" if workflow_file else "built-in",
-        "workflow_file": workflow_file,
-        "used_model": wan_model,
-        "used_text_encoder": text_encoder,
-        "used_vae": vae,
-        "used_positive_prompt": positive,
-    }
+def _asset_version() -> str:
+    # Cambia cuando cambia cualquier CSS/JS: las URLs ?v= se pueden cachear sin caducidad.
+    h = hashlib.sha1()
+    for p in sorted(STATIC_DIR.rglob("*")):
+        if p.is_file() and p.suffix in (".css", ".js"):
+            h.update(p.relative_to(STATIC_DIR).as_posix().encode())
+            h.update(p.read_bytes())
+    return h.hexdigest()[:12]
 
 
-def export_wan_workflow(form_data):
-    preset = get_wan_preset(form_data.get("model_preset", "wan_1b"))
-    profile = get_wan_profile(form_data.get("video_profile", "portrait_fast"))
-    output_path = WORKFLOWS_DIR / "wan_txt2vid_api.json"
-    try:
-        ensure_dir(WORKFLOWS_DIR)
-        workflow = build_wan_prompt(
-            wan_model=preset["model"],
-            text_encoder=preset["text_encoder"],
-            vae=preset["vae"],
-            positive="YOUR POSITIVE PROMPT HERE",
-            negative="worst quality, low quality, lowres, blurry, deformed, watermark",
-            width=profile["width"],
-            height=profile["height"],
-            frames=profile["frames"],
-            fps=profile["fps"],
-            steps=profile["steps"],
-            cfg=profile["cfg"],
-            crf=profile["crf"],
-            pix_fmt=profile["pix_fmt"],
-            seed=42,
-            shift=profile["shift"],
-            output_prefix="wan_output/exported",
-        )
-        output_path.write_text(
-            json.dumps(workflow, indent=2, ensure_ascii=False), encoding="utf-8"
-        )
-        return {"ok": True, "path": str(output_path), "message": "Workflow exportado."}
-    except Exception as exc:
-        return {"ok": False, "message": str(exc)}
+ASSET_VERSION = _asset_version()
 
 
-def default_game_tts_form():
-    preset = GAME_TTS_PERSONALITY_PRESETS[0]
-    chars = load_game_tts_character_presets()
-    piper_models = list_piper_models()
-    default_piper = Path(PIPER_MODEL_PATH).name
-    if piper_models and not any(m.get("id") == default_piper for m in piper_models):
-        default_piper = piper_models[0]["id"]
-    return {
-        "engine": "piper",
-        "piper_model": default_piper,
-        "character_id": chars[0]["id"] if chars else "hero",
-        "language": "es",
-        "personality_id": preset["id"],
-        "voice_id": preset["voice_id"],
-        "speed": preset["speed"],
-        "pitch": preset["pitch"],
-        "energy": preset["energy"],
-        "emotion_tags": preset["emotion_tags"],
-        "pauses": preset["pauses"],
-        "text": "",
-    }
+def compile_templates():
+    for name, source in PAGE_TEMPLATES.items():
+        _compiled_templates[name] = app.jinja_env.from_string(source)
 
 
-def submit_game_tts(form_data):
-    text = (form_data.get("text", "") or "").strip()
-    if not text:
-        return {"ok": False, "message": "Escribe un texto para generar audio."}
+def render_page(name: str, **context):
+    html = _compiled_templates[name].render(asset_version=ASSET_VERSION, **context)
+    resp = app.response_class(html, mimetype="text/html")
+    resp.add_etag()
+    resp.headers["Cache-Control"] = "no-cache"
+    return resp.make_conditional(request)
 
-    engine = (form_data.get("engine", "piper") or "piper").strip().lower()
-    language = (form_data.get("language", "es") or "es").strip().lower()
-    character_id = (form_data.get("character_id", "") or "").strip()
-    personality_id = (form_data.get("personality_id", "") or "").strip()
-    piper_model_id = (form_data.get("piper_model", "") or "").strip()
 
-    characters = load_game_tts_character_presets()
-    character = next((c for c in characters if c.get("id") == character_id), None)
-    if character is None:
-        character = characters[0] if characters else {"id": "hero", "name": "Hero", "speaker_wav": ""}
+compile_templates()
 
-    personality = dict(get_game_tts_personality(personality_id))
-    for key in ("voice_id", "emotion_tags", "pauses"):
-        if form_data.get(key) is not None:
-            personality[key] = str(form_data.get(key, "")).strip()
-    for key in ("speed", "pitch", "energy"):
-        if form_data.get(key) is not None:
-            try:
-                personality[key] = float(form_data.get(key))
-            except Exception:
-                pass
 
-    piper_model_path = ""
-    if engine == "piper":
-        selected_model = get_piper_model_by_id(piper_model_id)
-        if selected_model is None:
-            piper_models = list_piper_models()
-            if not piper_models:
-                return {"ok": False, "message": "No hay modelos Piper disponibles en ~/ai/piper."}
-            selected_model = piper_models[0]
-        piper_model_path = selected_model.get("path", "")
+@app.after_request
+def static_cache_headers(resp):
+    if request.path.startswith("/static/") and resp.status_code in (200, 304):
+        resp.headers["Cache-Control"] = f"public, max-age={STATIC_MAX_AGE_S}, immutable"
+    return resp
 
-    result: dict[str, Any] = generate_game_tts(
-        engine=engine,
-        character=character,
-        personality=personality,
-        text=text,
-        language=language,
-        piper_model_path=piper_model_path,
-    )
-    if not result.get("ok"):
-        return result
 
-    result["message"] = (
-        f"Audio generado con {engine.upper()} para {character.get('name', character.get('id', 'character'))}.\n"
-        f"Preset: {personality.get('id', 'custom')} | voice_id: {personality.get('voice_id', '')}\n"
-        f"speed={personality.get('speed', 1.0)} pitch={personality.get('pitch', 1.0)} energy={personality.get('energy', 1.0)}\n"
-        f"emotion_tags={personality.get('emotion_tags', '')} pauses={personality.get('pauses', 'medium')}"
-    )
-    result["personality"] = personality
-    result["character"] = character
-    if engine == "piper":
-        result["piper_model"] = Path(piper_model_path).name if piper_model_path else ""
-    return result
+# --- PERFILADO ----------------------------------------------------------------
+# Dos herramientas, solo con LANDING_PROFILING=1:
+#  - por petición: ?_profile=1 (cProfile → .prof + resumen .txt) o ?_profile=pyinstrument
+#    (HTML, si está instalado); también vale la cabecera X-Profile.
+#  - muestreo: un hilo que recoge las pilas de otros hilos (autostart, workers de la cola)
+#    cada N ms y al parar escribe un .collapsed (formato de flamegraph.pl / speedscope).
+PROFILE_DIR = RUN_DIR / "profiles"
 
+# "samples" lo escribe solo el hilo de muestreo: sampler_status lo lee sin recorrer counts,
+# que ese hilo va ampliando.
+_sampler_state = {
+    "thread": None, "stop": None, "counts": {}, "samples": 0, "started": 0.0, "threads": "", "interval_ms": 0.0,
+}
+_sampler_lock = threading.Lock()
 
-# --- FLASK APP ----------------------------------------------------------------
-app = Flask(__name__)
+
+def _profile_name(kind: str, label: str) -> str:
+    slug = re.sub(r"[^A-Za-z0-9_.-]+", "_", label).strip("_")[:60] or "root"
+    return f"{time.strftime('%Y%m%d_%H%M%S')}_{kind}_{slug}_{os.urandom(2).hex()}"
+
+
+def _prune_profiles():
+    files = sorted(PROFILE_DIR.glob("*"), key=lambda p: p.stat().st_mtime)
+    for p in files[:-LANDING_PROFILE_KEEP]:
+        p.unlink(missing_ok=True)
+
+
+def list_profiles() -> list[dict]:
+    if not PROFILE_DIR.exists():
+        return []
+    rows = []
+    for p in sorted(PROFILE_DIR.glob("*"), key=lambda p: p.stat().st_mtime, reverse=True):
+        st = p.stat()
+        rows.append({"name": p.name, "kind": p.suffix.lstrip("."), "size": st.st_size, "mtime": st.st_mtime})
+    return rows
+
+
+@app.before_request
+def start_request_profile():
+    if not LANDING_PROFILING or request.path.startswith(("/static/", "/admin/profiles")):
+        return
+    mode = (request.args.get("_profile") or request.headers.get("X-Profile") or "").strip().lower()
+    if not mode or mode == "0":
+        return
+    g.profile_name = _profile_name("req", f"{request.method}_{request.path}")
+    if mode == "pyinstrument":
+        try:
+            profiler = importlib.import_module("pyinstrument").Profiler()
+            profiler.start()
+            g.profiler = ("pyinstrument", profiler)
+            return
+        except Exception as exc:
+            log.warning("pyinstrument no disponible (%s); se usa cProfile.", exc)
+    profiler = cProfile.Profile()
+    profiler.enable()
+    g.profiler = ("cprofile", profiler)
+
+
+@app.after_request
+def tag_request_profile(resp):
+    if "profiler" in g:
+        resp.headers["X-Profile-Id"] = g.profile_name
+    return resp
+
+
+@app.teardown_request
+def finish_request_profile(exc):
+    # En teardown y no en after_request: una vista que lanza se salta after_request y
+    # el perfilador quedaría activo en el hilo.
+    entry = g.pop("profiler", None)
+    if entry is None:
+        return
+    kind, profiler = entry
+    name = g.profile_name
+    if kind == "pyinstrument":
+        profiler.stop()
+    else:
+        profiler.disable()
+    try:
+        ensure_dir(PROFILE_DIR)
+        if kind == "pyinstrument":
+            (PROFILE_DIR / f"{name}.html").write_text(profiler.output_html(), encoding="utf-8")
+        else:
+            profiler.dump_stats(PROFILE_DIR / f"{name}.prof")
+            buf = io.StringIO()
+            pstats.Stats(profiler, stream=buf).sort_stats("cumulative").print_stats(40)
+            (PROFILE_DIR / f"{name}.txt").write_text(buf.getvalue(), encoding="utf-8")
+        _prune_profiles()
+    except Exception as err:
+        log.warning("No se pudo guardar el perfil %s: %s", name, err)
+
+
+def _sampler_loop(stop: threading.Event, interval_s: float, prefixes: tuple, counts: dict):
+    me = threading.get_ident()
+    while not stop.wait(interval_s):
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            name = names.get(ident, "?")
+            if ident == me or (prefixes and not name.startswith(prefixes)):
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})")
+                frame = frame.f_back
+            key = ";".join([name] + stack[::-1])
+            counts[key] = counts.get(key, 0) + 1
+            _sampler_state["samples"] += 1
+
+
+def sampler_status() -> dict:
+    running = _sampler_state["thread"] is not None
+    return {
+        "running": running,
+        "threads": _sampler_state["threads"],
+        "interval_ms": _sampler_state["interval_ms"],
+        "elapsed_s": round(time.time() - _sampler_state["started"], 1) if running else 0.0,
+        "samples": _sampler_state["samples"] if running else 0,
+    }
+
+
+def start_sampler(interval_ms: float = 10.0, threads: str = "") -> dict:
+    # threads: prefijos de nombre separados por comas ("autostart,job-gpu"); vacío = todos.
+    with _sampler_lock:
+        if _sampler_state["thread"] is not None:
+            return {"ok": False, "message": "El muestreo ya está en marcha.", "sampler": sampler_status()}
+        prefixes = tuple(p.strip() for p in threads.split(",") if p.strip())
+        interval_s = max(0.001, interval_ms / 1000.0)
+        stop = threading.Event()
+        counts: dict[str, int] = {}
+        t = threading.Thread(
+            target=_sampler_loop, args=(stop, interval_s, prefixes, counts), name="profile-sampler", daemon=True
+        )
+        _sampler_state.update(
+            thread=t, stop=stop, counts=counts, samples=0, started=time.time(), threads=threads, interval_ms=interval_ms
+        )
+        t.start()
+    log.info("Muestreo de perfiles iniciado (hilos=%s, %.1f ms)", threads or "todos", interval_ms)
+    return {"ok": True, "message": "Muestreo iniciado.", "sampler": sampler_status()}
+
+
+def stop_sampler() -> dict:
+    with _sampler_lock:
+        t = _sampler_state["thread"]
+        if t is None:
+            return {"ok": False, "message": "El muestreo no está en marcha."}
+        _sampler_state["stop"].set()
+        t.join(timeout=5)
+        counts = _sampler_state["counts"]
+        label = _sampler_state["threads"] or "all"
+        _sampler_state.update(thread=None, stop=None, counts={})
+    name = _profile_name("sample", label) + ".collapsed"
+    ensure_dir(PROFILE_DIR)
+    lines = [f"{stack} {n}" for stack, n in sorted(counts.items(), key=lambda kv: -kv[1])]
+    (PROFILE_DIR / name).write_text("\n".join(lines) + "\n", encoding="utf-8")
+    _prune_profiles()
+    total = sum(counts.values())
+    log.info("Muestreo de perfiles guardado: %s (%d muestras)", name, total)
+    return {"ok": True, "message": f"{total} muestras guardadas.", "profile": name, "samples": total}
 
 
 @app.route("/")
 def index():
     status = check_all_status()
-    return render_template_string(
-        HTML,
+    return render_page(
+        "index",
         comfy_port=COMFY_PORT,
         ow_port=OW_PORT,
         ollama_port=OLLAMA_PORT,
@@ -3417,37 +6393,146 @@ def api_status():
     return jsonify(check_all_status())
 
 
+@app.route("/api/resources")
+def api_resources():
+    return jsonify(arbiter_status())
+
+
+@app.route("/api/render-cache", methods=["GET"])
+def api_render_cache():
+    return jsonify(render_cache_stats())
+
+
+@app.route("/api/gallery", methods=["GET"])
+def api_gallery():
+    return jsonify(
+        gallery_page(
+            page=request.args.get("page", 1, type=int),
+            per_page=request.args.get("per_page", 24, type=int),
+            prefix=request.args.get("prefix", ""),
+        )
+    )
+
+
+@app.route("/api/gallery/thumbs/<name>", methods=["GET"])
+def api_gallery_thumb(name):
+    # La clave cambia con el vídeo: la miniatura es inmutable y se cachea como los estáticos.
+    path = GALLERY_THUMB_DIR / name
+    if not re.fullmatch(r"[0-9a-f]{20}\.(jpg|webp)", name) or not path.is_file():
+        abort(404)
+    return send_file(path, conditional=True, etag=True, max_age=STATIC_MAX_AGE_S)
+
+
+@app.route("/api/gallery/video/<path:rel>", methods=["GET"])
+def api_gallery_video(rel):
+    path = gallery_video_path(rel)
+    if path is None:
+        abort(404)
+    resp = send_file(path, conditional=True, etag=True, max_age=0)
+    resp.headers["Accept-Ranges"] = "bytes"
+    return resp
+
+
+@app.route("/api/media/postprocess", methods=["POST"])
+def api_media_postprocess():
+    data = request.get_json(silent=True) or request.form.to_dict()
+    videos = data.get("videos") or []
+    if isinstance(videos, str):
+        videos = [v.strip() for v in videos.split(",") if v.strip()]
+    args = {"videos": videos, **postproc_options({"post_audio": data.get("audio"), "post_web": data.get("web")})}
+    if data.get("name"):
+        args["name"] = slugify_text(str(data["name"]))
+    if not videos:
+        return jsonify({"ok": False, "message": "Indica los vídeos (rutas de la galería)."}), 400
+    job = enqueue_job("postproc", args, label="postproceso")
+    return jsonify(wait_job_response(job["id"], timeout=JOB_HTTP_WAIT_S))
+
+
+@app.route("/api/comfy/backends", methods=["GET"])
+def api_comfy_backends():
+    return jsonify(comfy_pool_status(refresh=request.args.get("refresh") == "1"))
+
+
+@app.route("/admin/profiles", methods=["GET"])
+def admin_profiles():
+    if not LANDING_PROFILING:
+        abort(404)
+    return jsonify({"ok": True, "profiles": list_profiles(), "sampler": sampler_status()})
+
+
+@app.route("/admin/profiles/sampler", methods=["POST"])
+def admin_profiles_sampler():
+    if not LANDING_PROFILING:
+        abort(404)
+    data = request.get_json(silent=True) or request.form.to_dict()
+    action = str(data.get("action", "")).strip().lower()
+    if action == "start":
+        try:
+            interval_ms = float(data.get("interval_ms") or 10)
+        except (TypeError, ValueError):
+            return jsonify({"ok": False, "message": "interval_ms no válido."}), 400
+        return jsonify(start_sampler(interval_ms, str(data.get("threads") or "")))
+    if action == "stop":
+        return jsonify(stop_sampler())
+    return jsonify({"ok": False, "message": "action debe ser start o stop."}), 400
+
+
+@app.route("/admin/profiles/<path:name>", methods=["GET"])
+def admin_profile_file(name):
+    if not LANDING_PROFILING:
+        abort(404)
+    path = PROFILE_DIR / Path(name).name
+    if not path.is_file():
+        abort(404)
+    if path.suffix == ".prof":
+        return send_file(path, mimetype="application/octet-stream", as_attachment=True)
+    mimetype = "text/html" if path.suffix == ".html" else "text/plain"
+    return send_file(path, mimetype=mimetype)
+
+
+@app.route("/api/voice-out", methods=["GET"])
+def api_voice_out():
+    return jsonify({"ok": True, "usage": voice_out_usage()})
+
+
+@app.route("/api/voice-out/compact", methods=["POST"])
+def api_voice_out_compact():
+    job = enqueue_job("voice_retention", {}, label="voice_out")
+    return jsonify(wait_job_response(job["id"], timeout=JOB_HTTP_WAIT_S))
+
+
 @app.route("/tools/video-scene", methods=["GET", "POST"])
 def video_scene():
     character_presets = load_character_video_prompt_presets()
     if request.method == "POST":
-        result = submit_video_scene(request.form.to_dict())
+        job = enqueue_job("video_scene", request.form.to_dict())
         if request.headers.get("X-Requested-With") == "XMLHttpRequest":
-            return jsonify(result)
+            return jsonify(wait_job_response(job["id"], timeout=JOB_HTTP_WAIT_S))
+        # Sin XHR también se espera solo JOB_HTTP_WAIT_S: la página sale con el job en cola
+        # y jobs.js lo sigue, sin retener un hilo HTTP durante todo el render.
+        result = wait_job_response(job["id"], timeout=JOB_HTTP_WAIT_S)
         form = default_video_form()
         form.update(request.form.to_dict())
-        return render_template_string(
-            VIDEO_TOOL_HTML,
+        return render_page(
+            "video_tool",
             form=form,
             model_presets=VIDEO_MODEL_PRESETS,
             smooth_profiles=VIDEO_SMOOTH_PROFILES,
-            smooth_profiles_json=json.dumps(VIDEO_SMOOTH_PROFILES),
+            smooth_profiles_json=VIDEO_SMOOTH_PROFILES_JSON,
             character_prompt_presets=character_presets,
-            character_prompt_presets_json=json.dumps(
-                character_presets, ensure_ascii=False
-            ),
             server_result=json.dumps(result, ensure_ascii=False, indent=2),
             server_result_ok=bool(result.get("ok")),
+            server_job_id=result.get("job_id") if result.get("status") in ("queued", "running") else "",
         )
     form = default_video_form()
-    return render_template_string(
-        VIDEO_TOOL_HTML,
+    form["seed"] = ""
+    return render_page(
+        "video_tool",
         form=form,
         model_presets=VIDEO_MODEL_PRESETS,
         smooth_profiles=VIDEO_SMOOTH_PROFILES,
-        smooth_profiles_json=json.dumps(VIDEO_SMOOTH_PROFILES),
+        smooth_profiles_json=VIDEO_SMOOTH_PROFILES_JSON,
         character_prompt_presets=character_presets,
-        character_prompt_presets_json=json.dumps(character_presets, ensure_ascii=False),
         server_result=None,
         server_result_ok=False,
     )
@@ -3457,33 +6542,35 @@ def video_scene():
 def wan_video():
     character_presets = load_character_video_prompt_presets()
     if request.method == "POST":
-        result = submit_wan_scene(request.form.to_dict())
+        form_data = request.form.to_dict()
+        job = enqueue_job("wan_long" if long_video_duration(form_data) > 0 else "wan_scene", form_data)
         if request.headers.get("X-Requested-With") == "XMLHttpRequest":
-            return jsonify(result)
+            return jsonify(wait_job_response(job["id"], timeout=JOB_HTTP_WAIT_S))
+        # Sin XHR también se espera solo JOB_HTTP_WAIT_S: la página sale con el job en cola
+        # y jobs.js lo sigue, sin retener un hilo HTTP durante todo el render.
+        result = wait_job_response(job["id"], timeout=JOB_HTTP_WAIT_S)
         form = default_wan_form()
         form.update(request.form.to_dict())
-        return render_template_string(
-            WAN_TOOL_HTML,
+        return render_page(
+            "wan_tool",
             form=form,
             model_presets=WAN_MODEL_PRESETS,
             video_profiles=WAN_VIDEO_PROFILES,
-            video_profiles_json=json.dumps(WAN_VIDEO_PROFILES),
+            video_profiles_json=WAN_VIDEO_PROFILES_JSON,
             character_prompt_presets=character_presets,
-            character_prompt_presets_json=json.dumps(
-                character_presets, ensure_ascii=False
-            ),
             server_result=json.dumps(result, ensure_ascii=False, indent=2),
             server_result_ok=bool(result.get("ok")),
+            server_job_id=result.get("job_id") if result.get("status") in ("queued", "running") else "",
         )
     form = default_wan_form()
-    return render_template_string(
-        WAN_TOOL_HTML,
+    form["seed"] = ""
+    return render_page(
+        "wan_tool",
         form=form,
         model_presets=WAN_MODEL_PRESETS,
         video_profiles=WAN_VIDEO_PROFILES,
-        video_profiles_json=json.dumps(WAN_VIDEO_PROFILES),
+        video_profiles_json=WAN_VIDEO_PROFILES_JSON,
         character_prompt_presets=character_presets,
-        character_prompt_presets_json=json.dumps(character_presets, ensure_ascii=False),
         server_result=None,
         server_result_ok=False,
     )
@@ -3497,24 +6584,54 @@ def wan_video_export():
 @app.route("/tools/wan-i2v", methods=["GET", "POST"])
 def wan_i2v_tool():
     if request.method == "POST":
-        return jsonify(submit_wan_i2v_scene(request.form.to_dict()))
+        job = enqueue_job("wan_i2v_scene", request.form.to_dict())
+        return jsonify(wait_job_response(job["id"], timeout=JOB_HTTP_WAIT_S))
 
     form = default_wan_i2v_form()
-    input_images = list_comfy_input_images()
-    return render_template_string(
-        WAN_I2V_TOOL_HTML,
+    form["seed"] = ""
+    input_images = input_image_page(per_page=100)["images"]
+    if form["image_name"] not in input_images:
+        form["image_name"] = input_images[0] if input_images else ""
+    return render_page(
+        "wan_i2v_tool",
         form=form,
         input_images=input_images,
         model_presets=WAN_MODEL_PRESETS,
         video_profiles=WAN_VIDEO_PROFILES,
-        video_profiles_json=json.dumps(WAN_VIDEO_PROFILES),
+        video_profiles_json=WAN_VIDEO_PROFILES_JSON,
     )
 
 
 @app.route("/tools/wan-i2v/input-images", methods=["GET"])
 def wan_i2v_input_images():
-    images = list_comfy_input_images()
-    return jsonify({"ok": True, "images": images})
+    return jsonify(
+        input_image_page(
+            q=request.args.get("q", ""),
+            page=request.args.get("page", 1, type=int),
+            per_page=request.args.get("per_page", 100, type=int),
+        )
+    )
+
+
+@app.route("/tools/wan-i2v/input-images", methods=["POST"])
+def wan_i2v_upload_image():
+    upload = request.files.get("image")
+    if upload is None:
+        return jsonify({"ok": False, "message": "Falta el fichero (campo image)."}), 400
+    # Se ajusta a la resolución del perfil I2V elegido (o a width/height explícitos).
+    profile = get_wan_profile(request.form.get("video_profile", "portrait_fast"))
+    width = request.form.get("width", profile["width"], type=int)
+    height = request.form.get("height", profile["height"], type=int)
+    result = store_input_image(upload.read(), upload.filename or "", width, height)
+    return jsonify(result), 200 if result["ok"] else 400
+
+
+@app.route("/tools/wan-i2v/input-images/thumbs/<name>", methods=["GET"])
+def wan_i2v_input_thumb(name):
+    path = INPUT_THUMB_DIR / name
+    if not re.fullmatch(r"[0-9a-f]{20}\.jpg", name) or not path.is_file():
+        abort(404)
+    return send_file(path, conditional=True, etag=True, max_age=STATIC_MAX_AGE_S)
 
 
 @app.route("/tools/character-video-prompt/<preset_id>", methods=["GET"])
@@ -3546,36 +6663,41 @@ def game_tts_tool():
     characters = load_game_tts_character_presets()
     piper_models = list_piper_models()
     piper_recommendations = get_game_tts_piper_recommendations()
-    return render_template_string(
-        GAME_TTS_HTML,
+    return render_page(
+        "game_tts",
         form=form,
         characters=characters,
         piper_models=piper_models,
         piper_recommendations_json=json.dumps(piper_recommendations, ensure_ascii=False),
         personalities=GAME_TTS_PERSONALITY_PRESETS,
-        personalities_json=json.dumps(GAME_TTS_PERSONALITY_PRESETS, ensure_ascii=False),
+        personalities_json=GAME_TTS_PERSONALITY_PRESETS_JSON,
     )
 
 
 @app.route("/tools/game-tts/generate", methods=["POST"])
 def game_tts_generate():
-    result = submit_game_tts(request.form.to_dict())
-    return jsonify(result)
+    job = enqueue_job("game_tts", request.form.to_dict())
+    return jsonify(wait_job_response(job["id"], timeout=JOB_HTTP_WAIT_S))
 
 
 @app.route("/tools/game-tts/audio/<path:filename>", methods=["GET"])
 def game_tts_audio(filename):
-    safe_name = Path(filename).name
-    return send_from_directory(VOICE_OUT_DIR, safe_name, as_attachment=False)
+    wav_path = VOICE_OUT_DIR / Path(filename).name
+    if not wav_path.is_file():
+        abort(404)
+    if request.args.get("format", "").lower() == "opus":
+        opus_path = transcode_to_opus(wav_path)
+        if opus_path is not None:
+            return send_audio(opus_path, "audio/ogg")
+    return send_audio(wav_path, "audio/wav")
 
 
 @app.route("/tools/ollama-models", methods=["GET"])
 def ollama_models_tool():
     presets = load_ollama_prompt_presets()
-    return render_template_string(
-        OLLAMA_MODELS_HTML,
+    return render_page(
+        "ollama_models",
         prompt_presets=presets,
-        prompt_presets_json=json.dumps(presets, ensure_ascii=False),
     )
 
 
@@ -3584,11 +6706,33 @@ def ollama_models_list():
     return jsonify(ollama_list_models())
 
 
+@app.route("/tools/ollama-models/loaded", methods=["GET"])
+def ollama_models_loaded():
+    return jsonify(ollama_loaded_models())
+
+
+@app.route("/tools/ollama-models/warm", methods=["POST"])
+def ollama_models_warm():
+    body = request.get_json(silent=True) or {}
+    model_name = str(body.get("model", "")).strip()
+    return jsonify(ollama_warm_model(model_name))
+
+
+@app.route("/tools/ollama-models/evict", methods=["POST"])
+def ollama_models_evict():
+    body = request.get_json(silent=True) or {}
+    model_name = str(body.get("model", "")).strip()
+    return jsonify(ollama_evict_model(model_name))
+
+
 @app.route("/tools/ollama-models/pull", methods=["POST"])
 def ollama_models_pull():
     body = request.get_json(silent=True) or {}
     model_name = str(body.get("model", "")).strip()
-    return jsonify(ollama_pull_model(model_name))
+    if not model_name:
+        return jsonify({"ok": False, "message": "Falta el nombre del modelo."})
+    job = enqueue_job("ollama_pull", {"model": model_name}, label=model_name)
+    return jsonify(wait_job_response(job["id"], timeout=JOB_HTTP_WAIT_S))
 
 
 @app.route("/tools/ollama-models/create", methods=["POST"])
@@ -3597,7 +6741,45 @@ def ollama_models_create():
     model_name = str(body.get("model_name", "")).strip()
     base_model = str(body.get("base_model", "")).strip()
     system_prompt = str(body.get("system_prompt", ""))
-    return jsonify(ollama_create_custom_model(model_name, base_model, system_prompt))
+    if not model_name or not base_model:
+        return jsonify({"ok": False, "message": "model_name y base_model son obligatorios."})
+    job = enqueue_job(
+        "ollama_create",
+        {"model_name": model_name, "base_model": base_model, "system_prompt": system_prompt},
+        label=model_name,
+    )
+    return jsonify(wait_job_response(job["id"], timeout=JOB_HTTP_WAIT_S))
+
+
+@app.route("/api/jobs", methods=["GET"])
+def api_jobs():
+    return jsonify(
+        {"ok": True, "jobs": list_jobs(), "limits": JOB_LIMITS, "render_affinity": render_affinity_stats()}
+    )
+
+
+@app.route("/api/jobs/<job_id>", methods=["GET"])
+def api_job(job_id):
+    return jsonify(job_response(job_id))
+
+
+@app.route("/api/jobs/<job_id>/promote", methods=["POST"])
+def api_job_promote(job_id):
+    data = request.get_json(silent=True) or request.form
+    try:
+        upscale = float(data.get("upscale") or 2.0)
+        interpolate = int(data.get("interpolate") or 2)
+    except ValueError:
+        return jsonify({"ok": False, "message": "upscale/interpolate no válidos."}), 400
+    res = promote_render_job(job_id, str(data.get("mode") or "full"), upscale, interpolate)
+    if not res.get("ok"):
+        return jsonify(res), 400
+    return jsonify(wait_job_response(res["job_id"], timeout=JOB_HTTP_WAIT_S))
+
+
+@app.route("/api/jobs/<job_id>/cancel", methods=["POST"])
+def api_job_cancel(job_id):
+    return jsonify(cancel_job(job_id))
 
 
 @app.post("/svc/comfy/<action>")
@@ -3655,10 +6837,133 @@ def svc_mangachatbot(action):
     return ("", 204)
 
 
+# --- SERVIDOR -----------------------------------------------------------------
+class _TimeoutRequestHandler(WSGIRequestHandler):
+    timeout = LANDING_REQUEST_TIMEOUT_S
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    """Servidor werkzeug con un pool de hilos acotado en vez de un hilo por petición.
+
+    La cola del executor no tiene límite: un semáforo cuenta las peticiones en curso más
+    las pendientes y, lleno, la conexión se contesta con 503 sin llegar al pool.
+    """
+
+    BUSY_BODY = json.dumps({"ok": False, "message": "Servidor ocupado: reintenta en unos segundos."}).encode()
+
+    def __init__(self, host, port, wsgi_app, threads, max_pending=LANDING_MAX_PENDING):
+        super().__init__(host, port, wsgi_app, handler=_TimeoutRequestHandler)
+        self.pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="http")
+        self.capacity = threads + max(0, max_pending)
+        self.slots = threading.BoundedSemaphore(self.capacity)
+
+    def process_request(self, request, client_address):
+        if not self.slots.acquire(blocking=False):
+            log.warning("Servidor saturado: 503 a %s", client_address[0] if client_address else "?")
+            self._reject_busy(request)
+            return
+        try:
+            self.pool.submit(self._process_request_pooled, request, client_address)
+        except RuntimeError:
+            # Executor ya cerrado (apagado en curso).
+            self.slots.release()
+            self.shutdown_request(request)
+
+    def _reject_busy(self, request):
+        head = (
+            "HTTP/1.1 503 Service Unavailable\r\nContent-Type: application/json\r\n"
+            f"Content-Length: {len(self.BUSY_BODY)}\r\nRetry-After: 1\r\nConnection: close\r\n\r\n"
+        )
+        try:
+            request.sendall(head.encode() + self.BUSY_BODY)
+        except OSError:
+            pass
+        finally:
+            self.shutdown_request(request)
+
+    def drain(self, timeout: float) -> bool:
+        """Espera hasta timeout a las peticiones aceptadas y cierra el pool.
+
+        Con todos los huecos del semáforo tomados no queda ninguna en curso ni en cola;
+        las que sigan en cola al vencer el plazo se descartan.
+        """
+        deadline = time.time() + timeout
+        taken = 0
+        while taken < self.capacity and self.slots.acquire(timeout=max(0.0, deadline - time.time())):
+            taken += 1
+        self.pool.shutdown(wait=False, cancel_futures=True)
+        return taken == self.capacity
+
+    def _process_request_pooled(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self.slots.release()
+
+
+def _raise_interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+
+def serve_landing():
+    mode = "dev" if LANDING_DEBUG else LANDING_SERVER
+    if mode == "dev":
+        app.run(host=LANDING_HOST, port=LANDING_PORT, debug=LANDING_DEBUG, use_reloader=False)
+        return
+
+    signal.signal(signal.SIGTERM, _raise_interrupt)
+    server = None
+    waitress_server = None
+    if mode == "waitress":
+        try:
+            waitress = importlib.import_module("waitress")
+            waitress_server = waitress.create_server(
+                app,
+                host=LANDING_HOST,
+                port=LANDING_PORT,
+                threads=LANDING_THREADS,
+                channel_timeout=int(LANDING_REQUEST_TIMEOUT_S),
+            )
+        except ImportError:
+            log.warning("waitress no instalado (pip install waitress); usando servidor threaded")
+    if waitress_server is None:
+        server = PooledWSGIServer(LANDING_HOST, LANDING_PORT, app, LANDING_THREADS)
+        mode = "threaded"
+
+    log.info("Servidor %s en %s:%s (%s hilos)", mode, LANDING_HOST, LANDING_PORT, LANDING_THREADS)
+    try:
+        if waitress_server is not None:
+            waitress_server.run()
+        else:
+            server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        log.info("Cerrando landing: esperando peticiones y trabajos en curso...")
+        # Primero se deja de arrancar trabajos: mientras se vacía el pool HTTP ningún
+        # render encolado debe empezar. Peticiones y trabajos comparten el mismo plazo.
+        stop_starting_jobs()
+        deadline = time.time() + LANDING_SHUTDOWN_TIMEOUT_S
+        if waitress_server is not None:
+            waitress_server.close()
+        if server is not None:
+            server.server_close()
+            if not server.drain(LANDING_SHUTDOWN_TIMEOUT_S):
+                log.warning("Apagado con peticiones HTTP aún en curso.")
+        drain_jobs(max(0.0, deadline - time.time()))
+        log.info("Landing detenida.")
+
+
 if __name__ == "__main__":
     log.info("Landing host=%s debug=%s", LANDING_HOST, LANDING_DEBUG)
     log.info("Python runtime para servicios: %s", VENV_PYTHON)
     log.info("Voice script seleccionado: %s", VOICE_SCRIPT)
-    t = threading.Thread(target=autostart, daemon=True)
+    load_job_state()
+    start_job_workers()
+    start_voice_retention()
+    t = threading.Thread(target=autostart, name="autostart", daemon=True)
     t.start()
-    app.run(host=LANDING_HOST, port=5000, debug=LANDING_DEBUG, use_reloader=False)
+    serve_landing()
@@ -0,0 +1,79 @@
+function applyEngineMode(){
+    const engine=document.getElementById('engine').value;
+    const pRow=document.getElementById('piper-model-row');
+    const eHint=document.getElementById('engine-hint');
+    const speakerHint=document.getElementById('speaker-hint');
+    if(engine==='piper'){
+        if(pRow) pRow.style.display='flex';
+        if(eHint) eHint.textContent='Piper usa el modelo seleccionado arriba.';
+    }else{
+        if(pRow) pRow.style.display='none';
+        if(eHint) eHint.textContent='XTTS ignora el modelo Piper y usa speaker WAV del personaje.';
+    }
+    if(speakerHint) speakerHint.style.display=(engine==='xtts')?'block':'none';
+}
+function applyPreset(){
+    const id=document.getElementById('personality_id').value;
+    const p=personalities.find(x=>x.id===id);if(!p)return;
+    document.getElementById('voice_id').value=p.voice_id||'';
+    document.getElementById('speed').value=p.speed||1.0;
+    document.getElementById('pitch').value=p.pitch||1.0;
+    document.getElementById('energy').value=p.energy||1.0;
+    document.getElementById('emotion_tags').value=p.emotion_tags||'';
+    document.getElementById('pauses').value=p.pauses||'medium';
+}
+function applyCharacterMeta(){
+    const sel=document.getElementById('character_id');
+    const opt=sel.options[sel.selectedIndex];
+    const characterId=(opt&&opt.value)||'';
+    const speaker=(opt&&opt.dataset&&opt.dataset.speaker)||'';
+    const piperSel=document.getElementById('piper_model');
+    const hint=document.getElementById('speaker-hint');
+    const eHint=document.getElementById('engine-hint');
+
+    if(piperSel && characterId && piperRecommendations[characterId]){
+        const target=piperRecommendations[characterId];
+        const hasOption=[...piperSel.options].some(o=>o.value===target);
+        if(hasOption){
+            piperSel.value=target;
+            if(eHint && document.getElementById('engine').value==='piper'){
+                eHint.textContent='Modelo recomendado para '+characterId+': '+target;
+            }
+        }
+    }
+
+    hint.textContent=speaker?('speaker WAV: '+speaker):'speaker WAV: no detectado (necesario para XTTS)';
+}
+// Opus/OGG pesa mucho menos que el WAV; si el navegador no lo reproduce, se usa el WAV.
+const OPUS_OK=!!document.createElement('audio').canPlayType('audio/ogg; codecs=opus');
+async function generateGameTTS(e){
+    e.preventDefault();
+    const res=document.getElementById('result');
+    const audio=document.getElementById('audio');
+    const saved=document.getElementById('saved');
+    res.style.display='block';res.className='result';res.textContent='Generando audio...';
+    audio.style.display='none';saved.style.display='none';
+    const fd=new FormData(document.getElementById('tts-form'));
+    try{
+        const resp=await fetch('/tools/game-tts/generate',{
+            method:'POST',
+            headers:{'X-Requested-With':'XMLHttpRequest'},
+            body:new URLSearchParams(fd)
+        });
+        const data=await waitJob(await resp.json(),d=>{res.textContent=d.message||'En cola...';});
+        res.className='result '+(data.ok?'ok':'err');
+        res.textContent=data.message||'';
+        if(data.ok&&data.audio_url){
+            audio.src=(OPUS_OK&&data.opus_url)?data.opus_url:data.audio_url;
+            audio.style.display='block';
+            saved.style.display='block';
+            saved.textContent='Guardado en: '+(data.path||'');
+        }
+    }catch(err){
+        res.className='result err';res.textContent='Error: '+err;
+    }
+    return false;
+}
+applyPreset();
+applyCharacterMeta();
+applyEngineMode();
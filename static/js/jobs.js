@@ -0,0 +1,59 @@
+// Utilidades comunes de la cola de trabajos (/api/jobs) para las páginas de herramientas.
+async function waitJob(data, onProgress){
+    while(data && data.job_id && (data.status==='queued' || data.status==='running')){
+        if(onProgress) onProgress(data);
+        await new Promise(res=>setTimeout(res,1500));
+        const resp=await fetch('/api/jobs/'+encodeURIComponent(data.job_id));
+        data=await resp.json();
+    }
+    return data;
+}
+let draftJobId='';
+let draftWatch=0;
+async function showPromote(data){
+    const p=document.getElementById('promote');if(!p)return;
+    const watch=++draftWatch;
+    draftJobId='';
+    p.style.display='none';
+    if(!(data && data.ok && data.draft && data.status==='done'))return;
+    // El job termina cuando ComfyUI acepta el prompt: los botones esperan a que acabe el render.
+    while(data.render_state==='rendering'){
+        await new Promise(res=>setTimeout(res,3000));
+        if(watch!==draftWatch)return;
+        const resp=await fetch('/api/jobs/'+encodeURIComponent(data.job_id));
+        data=await resp.json();
+    }
+    if(watch!==draftWatch || data.render_state==='failed')return;
+    draftJobId=data.job_id;
+    p.style.display='flex';
+}
+async function promoteDraft(mode){
+    if(!draftJobId)return;
+    const r=document.getElementById('result');
+    r.style.display='block';r.className='result';r.textContent='Promocionando borrador...';
+    try{
+        const resp=await fetch('/api/jobs/'+encodeURIComponent(draftJobId)+'/promote',{
+            method:'POST',
+            headers:{'Content-Type':'application/json'},
+            body:JSON.stringify({mode:mode})
+        });
+        const data=await waitJob(await resp.json(),d=>{r.textContent=d.message||'En cola...';});
+        r.className='result '+(data.ok?'ok':'err');
+        let msg=data.message||'';
+        if(data.prompt_id)msg+='\nPrompt ID: '+data.prompt_id;
+        if(data.output_prefix)msg+='\nOutput: '+data.output_prefix;
+        if(data.parent)msg+='\nBorrador: '+data.parent;
+        r.textContent=msg;
+        showPromote(data);
+    }catch(err){r.className='result err';r.textContent='Error: '+err;}
+}
+// Formulario enviado sin XHR: la página llega con el job aún en cola y se sigue desde aquí.
+(function(){
+    const r=document.getElementById('result');
+    if(!r || !r.dataset.jobId)return;
+    waitJob({job_id:r.dataset.jobId,status:'queued'},d=>{r.textContent=d.message||'En cola...';}).then(data=>{
+        r.className='result '+(data.ok?'ok':'err');
+        r.textContent=JSON.stringify(data,null,2);
+        showPromote(data);
+    }).catch(err=>{r.className='result err';r.textContent='Error: '+err;});
+})();
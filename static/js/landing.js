@@ -0,0 +1,15 @@
+async function doAction(svc,action){
+  try{await fetch(`/svc/${svc}/${action}`,{method:"POST"})}catch(e){alert("Error: "+e)}
+}
+async function pollStatus(){
+  try{
+    const r=await fetch("/api/status");if(!r.ok)return;
+    const data=await r.json();
+    for(const[key,up]of Object.entries(data)){
+      document.querySelectorAll(`[data-svc="${key}"]`).forEach(el=>{
+        el.textContent=up?"UP":"DOWN";el.className="status "+(up?"up":"down");
+      });
+    }
+  }catch(e){}
+}
+setInterval(pollStatus,5000);
@@ -0,0 +1,97 @@
+function show(msg, ok=true){
+    const r=document.getElementById('result');
+    r.style.display='block';
+    r.className='result '+(ok?'ok':'err');
+    r.textContent=msg;
+}
+
+function applyPromptPreset(){
+    const id=document.getElementById('prompt_preset').value;
+    if(!id)return;
+    const preset=PROMPT_PRESETS.find(p=>p.id===id);
+    if(!preset)return;
+    if(preset.base_model) document.getElementById('base_model').value=preset.base_model;
+    if(preset.system_prompt) document.getElementById('system_prompt').value=preset.system_prompt;
+}
+
+async function refreshModels(){
+    const out=document.getElementById('models');
+    out.textContent='Cargando modelos...';
+    try{
+        const resp=await fetch('/tools/ollama-models/list');
+        const data=await resp.json();
+        if(!data.ok){out.textContent='Error: '+(data.message||'');return;}
+        if(!data.models || !data.models.length){out.textContent='No hay modelos locales todavía.';return;}
+        out.innerHTML='<ul>'+data.models.map(m=>`<li>${m}</li>`).join('')+'</ul>';
+    }catch(err){out.textContent='Error: '+err;}
+}
+
+function fmtGB(bytes){return (Number(bytes||0)/1073741824).toFixed(1)+' GB';}
+
+async function refreshLoaded(){
+    const out=document.getElementById('loaded');
+    try{
+        const resp=await fetch('/tools/ollama-models/loaded');
+        const data=await resp.json();
+        if(!data.ok){out.textContent='Error: '+(data.message||'');return;}
+        const pinned=data.pinned||[];
+        let html='<div>Fijados: '+(pinned.length?pinned.join(', '):'(ninguno)')+'</div>';
+        if(!data.models || !data.models.length){
+            html+='<div>No hay modelos cargados.</div>';
+        }else{
+            html+='<ul>'+data.models.map(m=>`<li>${m.name} — VRAM ${fmtGB(m.size_vram)} / ${fmtGB(m.size)} — expira: ${m.expires_at||'?'} <a href="#" onclick="evictModel('${m.name}');return false;">[liberar]</a></li>`).join('')+'</ul>';
+        }
+        out.innerHTML=html;
+    }catch(err){out.textContent='Error: '+err;}
+}
+
+async function warmModel(){
+    const model=document.getElementById('warm_model').value.trim();
+    if(!model){show('Indica un modelo para precargar.', false);return;}
+    show('Precargando '+model+'...');
+    try{
+        const resp=await fetch('/tools/ollama-models/warm',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({model})});
+        const data=await resp.json();
+        show(data.message||'OK', !!data.ok);
+        refreshLoaded();
+    }catch(err){show('Error: '+err, false);}
+}
+
+async function evictModel(model){
+    show(model?('Liberando '+model+'...'):'Liberando todos los modelos...');
+    try{
+        const resp=await fetch('/tools/ollama-models/evict',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({model})});
+        const data=await resp.json();
+        show(data.message||'OK', !!data.ok);
+        refreshLoaded();
+    }catch(err){show('Error: '+err, false);}
+}
+
+async function pullModel(){
+    const model=document.getElementById('pull_model').value.trim();
+    if(!model){show('Indica un modelo para descargar.', false);return;}
+    show('Descargando modelo en Ollama... puede tardar.');
+    try{
+        const resp=await fetch('/tools/ollama-models/pull',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({model})});
+        const data=await waitJob(await resp.json(),d=>show(d.message||'En cola...'));
+        show(data.message||'OK', !!data.ok);
+        if(data.ok) refreshModels();
+    }catch(err){show('Error: '+err, false);}
+}
+
+async function createCustom(){
+    const model=document.getElementById('new_model').value.trim();
+    const base=document.getElementById('base_model').value.trim();
+    const system=document.getElementById('system_prompt').value.trim();
+    if(!model || !base){show('Completa nombre y modelo base.', false);return;}
+    show('Creando modelo custom en Ollama...');
+    try{
+        const resp=await fetch('/tools/ollama-models/create',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({model_name:model,base_model:base,system_prompt:system})});
+        const data=await waitJob(await resp.json(),d=>show(d.message||'En cola...'));
+        show(data.message||'OK', !!data.ok);
+        if(data.ok) refreshModels();
+    }catch(err){show('Error: '+err, false);}
+}
+
+refreshModels();
+refreshLoaded();
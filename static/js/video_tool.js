@@ -0,0 +1,72 @@
+function applyProfile(sel){
+  const p=profiles.find(x=>x.id===sel.value);if(!p)return;
+  const f=document.getElementById('vf');
+  ['width','height','frames','fps','steps','cfg','denoise','crf','interpolate','upscale','upscaler'].forEach(k=>{if(f[k]&&p[k]!==undefined)f[k].value=p[k];});
+}
+async function applyCharacterPrompt(sel, formId){
+    const id=sel.value;
+    const f=document.getElementById(formId);if(!f)return;
+    const pos=f.querySelector('[name="positive_prompt"]');
+    const neg=f.querySelector('[name="negative_prompt"]');
+        const r=document.getElementById('result');
+    if(!id){
+        if(pos) pos.value='';
+        if(neg) neg.value='';
+                if(r){
+                    r.style.display='block';
+                    r.className='result ok';
+                    r.textContent='Perfil manual: prompts limpiados.';
+                }
+        return;
+    }
+    try{
+        const resp=await fetch('/tools/character-video-prompt/'+encodeURIComponent(id));
+        const data=await resp.json();
+        if(!data.ok)return;
+        if(pos && data.positive_prompt) pos.value=data.positive_prompt;
+        if(neg && data.negative_prompt) neg.value=data.negative_prompt;
+                if(r){
+                    r.style.display='block';
+                    r.className='result ok';
+                    r.textContent='Perfil cargado: '+(data.name||id)+'\nPrompt+ y Prompt- actualizados.';
+                }
+    }catch(_err){
+                if(r){
+                    r.style.display='block';
+                    r.className='result err';
+                    r.textContent='Error cargando perfil '+id+'. Revisa /tmp/landing-trace.log';
+                }
+        // El fallback de backend al enviar mantiene funcionalidad incluso si falla la UI.
+    }
+}
+async function handleVideoSubmit(e){
+  e.preventDefault();const r=document.getElementById('result');
+  r.style.display='block';r.className='result';r.textContent='Enviando a ComfyUI...';
+  const fd=new FormData(e.target);
+  try{
+        const resp=await fetch('/tools/video-scene',{
+            method:'POST',
+            headers:{'X-Requested-With':'XMLHttpRequest'},
+            body:new URLSearchParams(fd)
+        });
+    const data=await waitJob(await resp.json(),d=>{r.textContent=d.message||'En cola...';});r.className='result '+(data.ok?'ok':'err');
+        let msg=data.message||'';
+    if(data.prompt_id)msg+='\nPrompt ID: '+data.prompt_id;
+    if(data.output_prefix)msg+='\nOutput: '+data.output_prefix;
+        if(data.workflow_mode)msg+='\nWorkflow mode: '+data.workflow_mode;
+        if(data.workflow_file)msg+='\nWorkflow file: '+data.workflow_file;
+        if(data.cached&&data.outputs)msg+='\nCaché: '+data.outputs.join(', ');
+        if(data.used_checkpoint)msg+='\nCheckpoint: '+data.used_checkpoint;
+        if(data.used_motion_model)msg+='\nMotion model: '+data.used_motion_model;
+        if(data.used_positive_prompt)msg+='\nPrompt+: '+data.used_positive_prompt;
+        if(data.ok && data.prompt_id)msg+='\nComfyUI: http://localhost:8188 (abre Queue en la barra lateral)';
+    r.textContent=msg;
+    showPromote(data);
+    }catch(err){r.className='result err';r.textContent='Error: '+err;}
+    return false;
+}
+(function(){
+    // La semilla aleatoria se genera aquí para que la página sea cacheable (ETag).
+    const f=document.getElementById('vf');
+    if(f && f.seed && f.seed.value==='') f.seed.value=Math.floor(Math.random()*2147483648);
+})();
@@ -0,0 +1,126 @@
+let inputThumbs={};
+let inputSearchTimer=null;
+function syncImageName(){
+    const sel=document.getElementById('image_name_select');
+    const f=document.getElementById('i2vf');
+    if(!sel||!f||!f.image_name)return;
+    if(sel.value)f.image_name.value=sel.value;
+    const prev=document.getElementById('image_preview');
+    if(prev){
+        const url=inputThumbs[sel.value];
+        prev.style.display=url?'block':'none';
+        if(url)prev.src=url;
+    }
+}
+function searchInputImages(){
+    clearTimeout(inputSearchTimer);
+    inputSearchTimer=setTimeout(refreshInputImages,300);
+}
+async function refreshInputImages(selectName){
+    const r=document.getElementById('result');
+    const sel=document.getElementById('image_name_select');
+    if(!sel)return;
+
+    const previous=selectName||sel.value;
+    const search=document.getElementById('image_search');
+    const q=search?search.value.trim():'';
+    if(r){
+        r.style.display='block';
+        r.className='result';
+        r.textContent='Refrescando imágenes de ComfyUI/input...';
+    }
+    try{
+        const resp=await fetch('/tools/wan-i2v/input-images?q='+encodeURIComponent(q));
+        const data=await resp.json();
+        sel.innerHTML='';
+        const images=Array.isArray(data.images)?data.images:[];
+        inputThumbs={};
+        for(const it of (data.items||[])){if(it.thumb_url)inputThumbs[it.name]=it.thumb_url;}
+        if(images.length===0){
+            const opt=document.createElement('option');
+            opt.value='';
+            opt.textContent='(sin imágenes detectadas)';
+            sel.appendChild(opt);
+        }else{
+            for(const img of images){
+                const opt=document.createElement('option');
+                opt.value=img;
+                opt.textContent=img;
+                sel.appendChild(opt);
+            }
+            const exists=images.includes(previous);
+            sel.value=exists?previous:images[0];
+        }
+        syncImageName();
+        if(r){
+            r.className='result ok';
+            const total=data.total!==undefined?data.total:images.length;
+            r.textContent='Lista actualizada ('+images.length+' de '+total+' imágenes).';
+        }
+    }catch(err){
+        if(r){
+            r.className='result err';
+            r.textContent='Error refrescando lista: '+err;
+        }
+    }
+}
+async function uploadInputImage(){
+    const r=document.getElementById('result');
+    const input=document.getElementById('image_upload');
+    const f=document.getElementById('i2vf');
+    if(!input||!input.files||!input.files.length)return;
+    const fd=new FormData();
+    fd.append('image',input.files[0]);
+    if(f&&f.video_profile)fd.append('video_profile',f.video_profile.value);
+    r.style.display='block';
+    r.className='result';
+    r.textContent='Subiendo imagen...';
+    try{
+        const resp=await fetch('/tools/wan-i2v/input-images',{method:'POST',body:fd});
+        const data=await resp.json();
+        if(!data.ok){
+            r.className='result err';
+            r.textContent=data.message||'Error subiendo la imagen.';
+            return;
+        }
+        input.value='';
+        const search=document.getElementById('image_search');
+        if(search)search.value='';
+        await refreshInputImages(data.name);
+        r.className='result ok';
+        r.textContent=data.message+(data.resized?' ('+data.resized+')':'');
+    }catch(err){
+        r.className='result err';
+        r.textContent='Error subiendo la imagen: '+err;
+    }
+}
+function applyProfile(sel){
+    const p=profiles.find(x=>x.id===sel.value);if(!p)return;
+    const f=document.getElementById('i2vf');
+    ['frames','fps','steps','cfg','shift','crf'].forEach(k=>{if(f[k]&&p[k]!==undefined)f[k].value=p[k];});
+}
+async function handleI2VSubmit(e){
+    e.preventDefault();const r=document.getElementById('result');
+    r.style.display='block';r.className='result';r.textContent='Enviando I2V a ComfyUI...';
+    const fd=new FormData(e.target);
+    try{
+        const resp=await fetch('/tools/wan-i2v',{method:'POST',headers:{'X-Requested-With':'XMLHttpRequest'},body:new URLSearchParams(fd)});
+        const data=await waitJob(await resp.json(),d=>{r.textContent=d.message||'En cola...';});r.className='result '+(data.ok?'ok':'err');
+        let msg=data.message||'';
+        if(data.prompt_id)msg+='\nPrompt ID: '+data.prompt_id;
+        if(data.output_prefix)msg+='\nOutput: '+data.output_prefix;
+        if(data.cached&&data.outputs)msg+='\nCaché: '+data.outputs.join(', ');
+        if(data.workflow_file)msg+='\nWorkflow file: '+data.workflow_file;
+        if(data.used_image)msg+='\nImage: '+data.used_image;
+        if(data.ok)msg+='\n→ ComfyUI: http://localhost:8188 (Queue en barra lateral)';
+        r.textContent=msg;
+        showPromote(data);
+    }catch(err){r.className='result err';r.textContent='Error: '+err;}
+    return false;
+}
+syncImageName();
+(function(){
+    // La semilla aleatoria se genera aquí para que la página sea cacheable (ETag).
+    const f=document.getElementById('i2vf');
+    if(f && f.seed && f.seed.value==='') f.seed.value=Math.floor(Math.random()*2147483648);
+})();
@@ -3,6 +3,8 @@ from faster_whisper import WhisperModel
 from deep_translator import GoogleTranslator
 import os
 
+from voice_common import preprocess_audio
+
 # ===== CONFIGURACIÓN DEL MODELO =====
 MODEL_SIZE = "medium"
 DEVICE = "cuda"  # cambia a "cpu" si no tienes GPU
@@ -14,7 +16,7 @@ def transcribe_audio(audio_path, traducir_es, traducir_en):
         return "⚠️ No se ha subido ningún archivo."
 
     # --- Transcripción ---
-    segments, info = model.transcribe(audio_path)
+    segments, info = model.transcribe(preprocess_audio(audio_path))
     full_text = " ".join([seg.text for seg in segments])
 
     # --- Guardado automático ---
@@ -3,9 +3,13 @@
 # Máxima compatibilidad con distintas versiones de Gradio.
 
 import os
+import json
+import hashlib
+import threading
 import inspect
-import subprocess
 import datetime as dt
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
 from typing import List, Dict, Tuple, Optional
 
@@ -13,6 +17,11 @@ import gradio as gr
 import requests
 from faster_whisper import WhisperModel
 
+from voice_common import (
+    OLLAMA_KEEP_ALIVE, TurnTrace, latency_table_md, ollama_stats, preprocess_audio, save_wav, trace_span,
+    tts_piper_pcm,
+)
+
 # ---------- Config ----------
 OUT_DIR = Path.home() / "ai" / "voice_out"
 OUT_DIR.mkdir(parents=True, exist_ok=True)
@@ -20,12 +29,23 @@ OUT_DIR.mkdir(parents=True, exist_ok=True)
 PIPER_BIN = "piper"
 PIPER_MODEL = str(Path.home() / "ai" / "piper" / "es_ES-mls_9972-low.onnx")
 PIPER_CONFIG = PIPER_MODEL + ".json"
+# Valor inicial de "Guardar respuesta": "0" = la voz solo vive en memoria (no se escribe en voice_out)
+KEEP_REPLY_WAVS = os.environ.get("VOICE_KEEP_REPLIES", "1") != "0"
 
 DEFAULT_ASR_MODEL = "medium"   # tiny/base/small/medium/large-v3
 DEFAULT_ASR_DEVICE = "cpu"     # usa "cpu" (seguro). Cambia a "cuda" si tienes cuDNN listo
 DEFAULT_LLM_MODEL = "llama3.1"
 OLLAMA_URL = os.environ.get("OLLAMA_BASE_URL", "http://127.0.0.1:11434")
 
+SYSTEM_PROMPT = (
+    "Eres un asistente útil que responde de forma breve y clara. "
+    "Responde en el idioma del usuario."
+)
+CHAT_TOKEN_BUDGET = int(os.environ.get("CHAT_TOKEN_BUDGET", "2048"))  # tokens aprox. de historial
+CHAT_FOLD_BLOCK = 8  # mensajes que se resumen de golpe (prefijo estable entre turnos)
+CHAT_SUMMARY_CACHE = int(os.environ.get("CHAT_SUMMARY_CACHE", "64"))  # resúmenes guardados (LRU)
+
+
 # ---------- Whisper cache ----------
 _WHISPER = {"name": None, "device": None, "model": None}
 def get_whisper(model_name: str, device: str) -> WhisperModel:
@@ -51,6 +71,7 @@ def ollama_generate(prompt: str,
         "model": model,
         "prompt": prompt,
         "stream": False,
+        "keep_alive": OLLAMA_KEEP_ALIVE,
         "options": {"temperature": temperature, "top_p": top_p},
     }
     if system:
@@ -62,6 +83,28 @@ def ollama_generate(prompt: str,
     except Exception as e:
         return f"[Ollama error] {e}"
 
+def ollama_chat(messages: List[Dict[str, str]],
+                model: str = DEFAULT_LLM_MODEL,
+                temperature: float = 0.7,
+                top_p: float = 0.9,
+                stats: Optional[Dict[str, float]] = None) -> str:
+    url = f"{OLLAMA_URL}/api/chat"
+    payload = {
+        "model": model,
+        "messages": messages,
+        "stream": False,
+        "keep_alive": OLLAMA_KEEP_ALIVE,
+        "options": {"temperature": temperature, "top_p": top_p},
+    }
+    try:
+        r = requests.post(url, json=payload, timeout=600)
+        r.raise_for_status()
+        data = r.json()
+        ollama_stats(data, stats)
+        return (data.get("message") or {}).get("content", "").strip()
+    except Exception as e:
+        return f"[Ollama error] {e}"
+
 def translate_to_english_with_llm(text: str) -> str:
     if not text:
         return ""
@@ -72,101 +115,198 @@ def translate_to_english_with_llm(text: str) -> str:
     )
     return ollama_generate(prompt)
 
+def fill_translation_panel(transcript: str, current: str, enabled: bool) -> str:
+    # Se ejecuta después de entregar la respuesta: la traducción nunca bloquea el turno.
+    if current or not enabled or not transcript:
+        return current or ""
+    return translate_to_english_with_llm(transcript)
+
 def transcribe_whisper(audio_path: str,
                        model_name: str = DEFAULT_ASR_MODEL,
                        device: str = DEFAULT_ASR_DEVICE,
                        language: Optional[str] = None,
-                       task: str = "transcribe") -> Tuple[str, str]:
+                       task: str = "transcribe",
+                       trace: Optional[TurnTrace] = None) -> Tuple[str, str]:
     model = get_whisper(model_name, device)
-    segments, info = model.transcribe(
-        audio_path,
-        task=task,                  # "transcribe" o "translate"
-        language=language or None,  # None = auto
-        vad_filter=True,
-        vad_parameters=dict(min_silence_duration_ms=500),
-    )
-    text = "".join(s.text for s in segments).strip()
+    with trace_span(trace, "decode"):
+        audio = preprocess_audio(audio_path)
+    with trace_span(trace, "asr") as rec:
+        segments, info = model.transcribe(
+            audio,
+            task=task,                  # "transcribe" o "translate"
+            language=language or None,  # None = auto
+            vad_filter=True,
+            vad_parameters=dict(min_silence_duration_ms=500),
+        )
+        text = "".join(s.text for s in segments).strip()  # los segmentos se decodifican al recorrerlos
+        rec["audio_s"] = round(info.duration, 2)
     if task == "translate":
         return text, text
-    translated = translate_to_english_with_llm(text) if text else ""
-    return text, translated
+    # La traducción por LLM es opcional y se rellena aparte (ver fill_translation_panel).
+    return text, ""
 
-def chat_with_llm(user_text: str) -> str:
-    if not user_text:
-        return ""
+# ---------- Conversación ----------
+# Los resúmenes se calculan en segundo plano para que el turno solo espere a /api/chat.
+# LRU acotado: cada sesión deja un resumen por bloque plegado y la UI vive días.
+_SUMMARIES: "OrderedDict[str, Future]" = OrderedDict()
+_SUMMARIES_LOCK = threading.Lock()
+_SUMMARY_POOL = ThreadPoolExecutor(max_workers=1)
+
+def _estimate_tokens(text: str) -> int:
+    return len(text) // 4 + 1
+
+def _history_key(messages: List[Dict[str, str]]) -> str:
+    raw = json.dumps(messages, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+def _clean_history(history: Optional[List[Dict[str, str]]]) -> List[Dict[str, str]]:
+    msgs = []
+    for m in history or []:
+        role = m.get("role") if isinstance(m, dict) else None
+        content = m.get("content") if isinstance(m, dict) else None
+        if role in ("user", "assistant") and isinstance(content, str) and content:
+            msgs.append({"role": role, "content": content})
+    return msgs
+
+def summarize_turns(previous_summary: str, messages: List[Dict[str, str]]) -> str:
+    lines = [f"{'Usuario' if m['role'] == 'user' else 'Asistente'}: {m['content']}" for m in messages]
     prompt = (
-        "Eres un asistente útil que responde de forma breve y clara. "
-        "Responde en el idioma del usuario:\n\n"
-        f"Usuario: {user_text}\nAsistente:"
+        "Resume la conversación en pocas frases, conservando nombres, datos y "
+        "peticiones pendientes. Solo devuelve el resumen.\n\n"
     )
-    return ollama_generate(prompt)
+    if previous_summary:
+        prompt += f"Resumen previo:\n{previous_summary}\n\n"
+    prompt += "Nuevos turnos:\n" + "\n".join(lines)
+    summary = ollama_generate(prompt)
+    return "" if summary.startswith("[Ollama error]") else summary
 
-def tts_piper(text: str,
-              out_wav: Path,
-              model_path: str = PIPER_MODEL,
-              config_path: str = PIPER_CONFIG,
-              length_scale: float = 1.0) -> Path:
-    out_wav.parent.mkdir(parents=True, exist_ok=True)
-    cmd = [
-        PIPER_BIN,
-        "--model", model_path,
-        "--config", config_path,
-        "--length_scale", str(length_scale),
-        "--output_file", str(out_wav),
-    ]
-    try:
-        subprocess.run(
-            cmd,
-            input=text.encode("utf-8"),
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            check=True,
-        )
-    except subprocess.CalledProcessError as e:
-        raise RuntimeError(f"Piper TTS error:\n{e.stderr.decode(errors='ignore')}") from e
-    return out_wav
+def _cached_summary(key: str) -> Optional[Future]:
+    with _SUMMARIES_LOCK:
+        fut = _SUMMARIES.get(key)
+        if fut is not None:
+            _SUMMARIES.move_to_end(key)
+        return fut
+
+def _finished_summary(key: str, fut: Future) -> Optional[str]:
+    """Resultado de un resumen terminado (None si sigue en curso). Uno vacío o fallido se
+    saca de la caché: un fallo pasajero de Ollama no deja el bloque sin resumen."""
+    if not fut.done():
+        return None
+    summary = "" if fut.exception() else fut.result()
+    if not summary:
+        with _SUMMARIES_LOCK:
+            if _SUMMARIES.get(key) is fut:
+                del _SUMMARIES[key]
+    return summary
+
+def _summary_for(messages: List[Dict[str, str]], folded: int) -> str:
+    """Devuelve el resumen de messages[:folded] si ya está listo; si no, lo encola."""
+    previous = ""
+    if folded > CHAT_FOLD_BLOCK:
+        prev_key = _history_key(messages[:folded - CHAT_FOLD_BLOCK])
+        prev_fut = _cached_summary(prev_key)
+        if prev_fut is not None:
+            previous = _finished_summary(prev_key, prev_fut) or ""
+
+    key = _history_key(messages[:folded])
+    with _SUMMARIES_LOCK:
+        fut = _SUMMARIES.get(key)
+        if fut is None:
+            chunk = messages[folded - CHAT_FOLD_BLOCK:folded] if previous else messages[:folded]
+            fut = _SUMMARIES[key] = _SUMMARY_POOL.submit(summarize_turns, previous, chunk)
+            while len(_SUMMARIES) > CHAT_SUMMARY_CACHE:
+                _SUMMARIES.popitem(last=False)
+        _SUMMARIES.move_to_end(key)
+    # Mientras el nuevo resumen no esté listo (o si falló) se usa el del bloque anterior.
+    return _finished_summary(key, fut) or previous
+
+def build_chat_messages(user_text: str,
+                        history: Optional[List[Dict[str, str]]] = None,
+                        budget: int = CHAT_TOKEN_BUDGET) -> List[Dict[str, str]]:
+    msgs = _clean_history(history)
+    # Se pliegan bloques completos del principio: el prefijo (system + resumen + turnos)
+    # se mantiene idéntico durante varios turnos y Ollama reutiliza su KV cache.
+    folded = 0
+    while (folded + CHAT_FOLD_BLOCK <= len(msgs)
+           and sum(_estimate_tokens(m["content"]) for m in msgs[folded:]) > budget * 3 // 4):
+        folded += CHAT_FOLD_BLOCK
+
+    system = SYSTEM_PROMPT
+    if folded:
+        summary = _summary_for(msgs, folded)
+        if summary:
+            system += f"\n\nResumen de la conversación anterior:\n{summary}"
+
+    recent = msgs[folded:]
+    # Red de seguridad si algún mensaje suelto es enorme: recorta por el principio.
+    while recent and sum(_estimate_tokens(m["content"]) for m in recent) > budget:
+        recent = recent[1:]
+    return [{"role": "system", "content": system}] + recent + [{"role": "user", "content": user_text}]
+
+def chat_with_llm(user_text: str,
+                  history: Optional[List[Dict[str, str]]] = None,
+                  stats: Optional[Dict[str, float]] = None) -> str:
+    if not user_text:
+        return ""
+    return ollama_chat(build_chat_messages(user_text, history), stats=stats)
 
 def pipeline_core(audio_file: Optional[str],
-                  sample_rate: int,
                   task: str,
                   language: Optional[str],
                   asr_model: str,
                   tts_speed: float,
-                  chat_history: Optional[List[Dict[str, str]]] = None):
+                  chat_history: Optional[List[Dict[str, str]]] = None,
+                  keep_reply: Optional[bool] = None):
+    # El historial (chat_state) solo guarda intercambios completos: los avisos y errores se
+    # muestran en el chat pero no vuelven a /api/chat ni entran en los resúmenes.
     messages = chat_history[:] if chat_history else []
     if not audio_file or not Path(audio_file).exists():
-        messages.append({"role": "assistant", "content": "No recibí audio. ¿Puedes grabar de nuevo?"})
-        return messages, "", "", "No hay audio.", None
+        shown = messages + [{"role": "assistant", "content": "No recibí audio. ¿Puedes grabar de nuevo?"}]
+        return shown, "", "", "No hay audio.", None, latency_table_md(), messages
 
+    trace = TurnTrace("voice_assistant_live3")
     trans, trans_en = transcribe_whisper(
         audio_file,
         model_name=asr_model or DEFAULT_ASR_MODEL,
         device=DEFAULT_ASR_DEVICE,
         language=language or None,
         task=task,
+        trace=trace,
     )
-    reply = chat_with_llm(trans or trans_en)
-    out_wav = OUT_DIR / f"reply_{_ts()}.wav"
-    wav_path = None
-    if reply:
+    user_text = trans or trans_en
+    llm_stats: Dict[str, float] = {}
+    with trace.span("llm"):
+        reply = chat_with_llm(user_text, history=chat_history, stats=llm_stats)
+    trace.add_llm(llm_stats)
+    replied = bool(reply) and not reply.startswith("[Ollama error]")
+    shown = reply if user_text else "No se detectó voz en el audio."
+    reply_audio = None
+    if replied:
         try:
-            tts_piper(reply, out_wav, length_scale=tts_speed or 1.0)
-            wav_path = str(out_wav)
+            tts_stats: Dict[str, float] = {}
+            reply_audio = tts_piper_pcm(reply, PIPER_MODEL, PIPER_CONFIG, length_scale=tts_speed or 1.0, stats=tts_stats,
+                                        piper_bin=PIPER_BIN, error_label="Piper TTS error")
+            trace.add("tts_spawn", tts_stats["spawn_ms"])
+            trace.add("tts_synth", tts_stats["synth_ms"])
+            if KEEP_REPLY_WAVS if keep_reply is None else keep_reply:
+                save_wav(OUT_DIR / f"reply_{_ts()}.wav", *reply_audio)
         except Exception as e:
-            reply += f"\n\n[Nota TTS] {e}"
+            shown = f"{reply}\n\n[Nota TTS] {e}"
+    trace.finish()
 
-    if trans:
-        messages.append({"role": "user", "content": trans})
-    elif trans_en:
-        messages.append({"role": "user", "content": trans_en})
-    messages.append({"role": "assistant", "content": reply or "(sin respuesta)"})
-    return messages, trans, trans_en, reply, wav_path
+    turn = [{"role": "user", "content": user_text}] if user_text else []
+    shown_chat = messages + turn + [{"role": "assistant", "content": shown or "(sin respuesta)"}]
+    if replied:
+        messages += turn + [{"role": "assistant", "content": reply}]
+    return shown_chat, trans, trans_en, shown, reply_audio, latency_table_md(), messages
 
-def pipeline_from_mic(audio_file, sample_rate, task, language, asr_model, tts_speed, chat_state):
-    return pipeline_core(audio_file, sample_rate, task, language, asr_model, tts_speed, chat_history=chat_state)
+def pipeline_from_mic(audio_file, task, language, asr_model, tts_speed, chat_state, keep_reply):
+    return pipeline_core(audio_file, task, language, asr_model, tts_speed,
+                         chat_history=chat_state, keep_reply=keep_reply)
 
-def pipeline_from_upload(audio_file, sample_rate, task, language, asr_model, tts_speed, chat_state):
-    return pipeline_core(audio_file, sample_rate, task, language, asr_model, tts_speed, chat_history=chat_state)
+def pipeline_from_upload(audio_file, task, language, asr_model, tts_speed, chat_state, keep_reply):
+    return pipeline_core(audio_file, task, language, asr_model, tts_speed,
+                         chat_history=chat_state, keep_reply=keep_reply)
 
 # ---------- UI builders con detección de firma ----------
 def create_audio_mic():
@@ -181,6 +321,11 @@ def create_audio_mic():
     # No pasar show_recording_waveform ni show_controls: rompen en versiones antiguas
     return gr.Audio(**kwargs)
 
+def chain_event(event, **kwargs):
+    # .then() no existe en Gradio muy antiguo; en ese caso el paso encadenado se omite.
+    if event is not None and hasattr(event, "then"):
+        event.then(**kwargs)
+
 def create_chatbot():
     sig = inspect.signature(gr.Chatbot.__init__)
     kwargs = {"label": "Historial", "height": 420}
@@ -215,32 +360,38 @@ def build_ui():
                     choices=["transcribe", "translate"],
                     value="transcribe",
                 )
-                sample_rate_dd = gr.Slider(
-                    label="Sample Rate (informativo)",
-                    minimum=16000, maximum=48000, step=1000, value=16000
-                )
                 tts_speed_sl = gr.Slider(
                     label="Velocidad voz (Piper length_scale)",
                     minimum=0.6, maximum=1.6, step=0.05, value=1.0
                 )
+                translate_cb = gr.Checkbox(
+                    label="Traducción EN con LLM (tras la respuesta)",
+                    value=False,
+                )
+                keep_cb = gr.Checkbox(
+                    label="Guardar respuesta (WAV en voice_out)",
+                    value=KEEP_REPLY_WAVS,
+                )
 
             with gr.Column(scale=6):
                 chatbox = create_chatbot()
                 transcribed_txt = gr.Textbox(label="Transcripción (ASR)")
                 translated_txt = gr.Textbox(label="Traducción (EN)")
                 reply_txt = gr.Textbox(label="Respuesta del asistente")
-                reply_wav = gr.Audio(label="Respuesta en voz (Piper)", type="filepath")
+                reply_wav = gr.Audio(label="Respuesta en voz (Piper)", type="numpy")
+                gr.Markdown("**Latencias por etapa (p50/p95)**")
+                latency_md = gr.Markdown(latency_table_md())
 
         chat_state = gr.State(value=[])
 
         inputs_common = [
             mic,               # ruta del audio (filepath)
-            sample_rate_dd,
             task_dd,
             lang_dd,
             asr_model_dd,
             tts_speed_sl,
             chat_state,
+            keep_cb,
         ]
         outputs_common = [
             chatbox,
@@ -248,30 +399,42 @@ def build_ui():
             translated_txt,
             reply_txt,
             reply_wav,
+            latency_md,
+            chat_state,        # historial para el siguiente turno (contexto, recorte y resumen)
         ]
 
+        translation_step = dict(
+            fn=fill_translation_panel,
+            inputs=[transcribed_txt, translated_txt, translate_cb],
+            outputs=[translated_txt],
+            queue=True,
+        )
+
         # En versiones nuevas existe stop_recording; si no, usamos change
         if hasattr(mic, "stop_recording"):
-            mic.stop_recording(
+            mic_event = mic.stop_recording(
                 fn=pipeline_from_mic,
                 inputs=inputs_common,
                 outputs=outputs_common,
                 queue=True,
             )
         else:
-            mic.change(
+            mic_event = mic.change(
                 fn=pipeline_from_mic,
                 inputs=inputs_common,
                 outputs=outputs_common,
                 queue=True,
             )
+        chain_event(mic_event, **translation_step)
 
-        process_btn.click(
+        upload_event = process_btn.click(
             fn=pipeline_from_upload,
             inputs=inputs_common,
             outputs=outputs_common,
             queue=True,
         )
+        chain_event(upload_event, **translation_step)
+        translate_cb.change(**translation_step)
 
         ui.queue().launch(server_name="0.0.0.0", server_port=7862)
 
@@ -1,17 +1,21 @@
 import os
 import time
-import json
-import subprocess
 import tempfile
 import requests
 import gradio as gr
 from faster_whisper import WhisperModel
 
+from voice_common import (
+    OLLAMA_KEEP_ALIVE, TurnTrace, latency_table_md, ollama_stats, preprocess_audio, save_wav, tts_piper_pcm,
+)
+
 # --- Ajustes por defecto (puedes cambiarlos en la UI) ---
 OLLAMA_URL = os.environ.get("OLLAMA_URL", "http://127.0.0.1:11434")
 DEFAULT_MODEL = os.environ.get("OLLAMA_MODEL", "llama3.1")  # cambia si prefieres mistral / qwen2.5:7b
 PIPER_MODEL = os.environ.get("PIPER_MODEL", "/home/jonathan/ai/piper/es_ES-mls_9972-low.onnx")
 PIPER_CONFIG = os.environ.get("PIPER_CONFIG", "/home/jonathan/ai/piper/es_ES-mls_9972-low.onnx.json")
+# Valor inicial de "Guardar respuesta": "0" = la voz solo vive en memoria (no se escribe en voice_out)
+KEEP_REPLY_WAVS = os.environ.get("VOICE_KEEP_REPLIES", "1") != "0"
 
 # Cargamos Whisper una vez (CPU por defecto para máxima compatibilidad)
 WHISPER_DEVICE_DEFAULT = "cpu"  # puedes poner "cuda" si ya tienes cuDNN OK
@@ -77,63 +81,47 @@ def get_whisper_model(size:str, device:str):
         _whisper_cache[key] = WhisperModel(size, device=device)
     return _whisper_cache[key]
 
-def transcribe(audio_path:str, size:str="medium", device:str=WHISPER_DEVICE_DEFAULT, task:str="transcribe", lang:str="auto"):
+def transcribe(audio_path:str, size:str="medium", device:str=WHISPER_DEVICE_DEFAULT, task:str="transcribe", lang:str="auto", trace=None):
     model = get_whisper_model(size, device)
     opts = {}
     if task in ("transcribe", "translate"):
         opts["task"] = task
     if lang and lang != "auto":
         opts["language"] = lang
-    segments, info = model.transcribe(audio_path, **opts)
+    t = time.perf_counter()
+    audio = preprocess_audio(audio_path)
+    t_decoded = time.perf_counter()
+    segments, info = model.transcribe(audio, **opts)
+    segments = list(segments)  # el generador solo se puede recorrer una vez (y ahí se decodifica)
+    if trace is not None:
+        trace.add("decode", (t_decoded - t) * 1000)
+        trace.add("asr", (time.perf_counter() - t_decoded) * 1000, audio_s=round(info.duration, 2))
     text = "".join(seg.text for seg in segments).strip()
     # también devolvemos timestamps por si quieres mostrarlos luego
     times = [(seg.start, seg.end, seg.text) for seg in segments]
     return text, times
 
-def ollama_generate(prompt:str, model:str=DEFAULT_MODEL, temperature:float=0.7, system:str="Eres un asistente útil y conciso. Responde en español."):
+def ollama_generate(prompt:str, model:str=DEFAULT_MODEL, temperature:float=0.7, system:str="Eres un asistente útil y conciso. Responde en español.", stats=None):
     url = f"{OLLAMA_URL}/api/generate"
     payload = {
         "model": model,
         "prompt": prompt,
         "options": {"temperature": temperature},
         "system": system,
-        "stream": False
+        "stream": False,
+        "keep_alive": OLLAMA_KEEP_ALIVE,
     }
     r = requests.post(url, json=payload, timeout=600)
     r.raise_for_status()
     data = r.json()
+    ollama_stats(data, stats)
     return data.get("response", "").strip()
 
-def tts_piper(text:str, out_wav:str, model_path:str=PIPER_MODEL, config_path:str=PIPER_CONFIG, length_scale:float=1.0):
-    os.makedirs(os.path.dirname(out_wav), exist_ok=True)
-    cmd = [
-        "piper",
-        "--model", model_path,
-        "--config", config_path,
-        "--length_scale", str(length_scale),
-        "--output_file", out_wav
-    ]
-    # Piper recibe el texto por stdin
-    proc = subprocess.run(
-        cmd,
-        input=text.encode("utf-8"),
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        check=False
-    )
-    if proc.returncode != 0:
-        err = proc.stderr.decode(errors="ignore")
-        raise RuntimeError(f"Error en Piper:\n{err}")
-    return out_wav
-
-def pipeline(mic_file, whisper_size, whisper_device, whisper_task, whisper_lang, model_name, temperature, tts_speed):
-    if not mic_file:
-        return gr.update(value=None), "", "No se recibió audio del micrófono."
-
+def run_turn(trace, mic_file, whisper_size, whisper_device, whisper_task, whisper_lang, model_name, temperature, tts_speed, keep_reply):
     # 1) STT
     try:
         user_text, _timestamps = transcribe(
-            mic_file, size=whisper_size, device=whisper_device, task=whisper_task, lang=whisper_lang
+            mic_file, size=whisper_size, device=whisper_device, task=whisper_task, lang=whisper_lang, trace=trace
         )
     except Exception as e:
         return gr.update(value=None), "", f"Fallo en transcripción: {e}"
@@ -144,19 +132,34 @@ def pipeline(mic_file, whisper_size, whisper_device, whisper_task, whisper_lang,
     # 2) LLM
     try:
         system_msg = "Eres un asistente útil y conciso. Responde en español, en 2-3 frases como máximo."
-        assistant = ollama_generate(user_text, model=model_name, temperature=temperature, system=system_msg)
+        llm_stats = {}
+        with trace.span("llm"):
+            assistant = ollama_generate(user_text, model=model_name, temperature=temperature, system=system_msg, stats=llm_stats)
+        trace.add_llm(llm_stats)
     except Exception as e:
         return gr.update(value=None), user_text, f"Fallo en Ollama: {e}"
 
     # 3) TTS
     try:
-        out_name = f"reply_{int(time.time())}.wav"
-        out_path = os.path.join("/home/jonathan/ai/voice_out", out_name)
-        wav_path = tts_piper(assistant, out_path, length_scale=tts_speed)
+        tts_stats = {}
+        reply_audio = tts_piper_pcm(assistant, PIPER_MODEL, PIPER_CONFIG, length_scale=tts_speed, stats=tts_stats)
+        trace.add("tts_spawn", tts_stats["spawn_ms"])
+        trace.add("tts_synth", tts_stats["synth_ms"])
+        if keep_reply:
+            out_name = f"reply_{int(time.time())}.wav"
+            save_wav(os.path.join("/home/jonathan/ai/voice_out", out_name), *reply_audio)
     except Exception as e:
         return gr.update(value=None), user_text, f"Fallo en Piper: {e}"
 
-    return wav_path, user_text, assistant
+    return reply_audio, user_text, assistant
+
+def pipeline(mic_file, whisper_size, whisper_device, whisper_task, whisper_lang, model_name, temperature, tts_speed, keep_reply=KEEP_REPLY_WAVS):
+    if not mic_file:
+        return gr.update(value=None), "", "No se recibió audio del micrófono.", latency_table_md()
+    trace = TurnTrace("voice_assistant_ui")
+    result = run_turn(trace, mic_file, whisper_size, whisper_device, whisper_task, whisper_lang, model_name, temperature, tts_speed, keep_reply)
+    trace.finish()  # también los turnos fallidos: sus spans dicen dónde se cortó
+    return (*result, latency_table_md())
 
 with gr.Blocks(title="Asistente de Voz Local", css=SPACE_INVADERS_CSS) as ui:
     gr.Markdown("# 🗣️ Asistente de Voz (Whisper + Ollama + Piper) — Offline")
@@ -183,11 +186,15 @@ with gr.Blocks(title="Asistente de Voz Local", css=SPACE_INVADERS_CSS) as ui:
             model_name = gr.Textbox(value=DEFAULT_MODEL, label="Modelo Ollama (ej: llama3.1 / mistral / qwen2.5:7b)")
             temperature = gr.Slider(0.0, 1.5, value=0.7, step=0.1, label="Temperatura (creatividad)")
             tts_speed = gr.Slider(0.5, 2.0, value=1.0, step=0.05, label="Velocidad de voz (Piper length_scale)")
+            keep_reply = gr.Checkbox(value=KEEP_REPLY_WAVS, label="Guardar respuesta (WAV en voice_out)")
+
+    with gr.Accordion("Latencias por etapa (p50/p95)", open=False):
+        latency_md = gr.Markdown(latency_table_md())
 
     btn.click(
         fn=pipeline,
-        inputs=[audio_in, whisper_size, whisper_device, whisper_task, whisper_lang, model_name, temperature, tts_speed],
-        outputs=[audio_out, t_user, t_assistant]
+        inputs=[audio_in, whisper_size, whisper_device, whisper_task, whisper_lang, model_name, temperature, tts_speed, keep_reply],
+        outputs=[audio_out, t_user, t_assistant, latency_md]
     )
 
 if __name__ == "__main__":
@@ -0,0 +1,224 @@
+# voice_common.py
+# Utilidades compartidas por las UIs de voz (transcribe_ui, voice_assistant_ui,
+# voice_assistant_live3).
+
+import datetime as dt
+import hashlib
+import json
+import os
+import subprocess
+import threading
+import time
+import wave
+from collections import OrderedDict, deque
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from faster_whisper import decode_audio
+
+# ---------- Ollama ----------
+# Mismo valor por defecto que el pin de la landing: con otro, cada petición rebajaría
+# (o quitaría) la residencia del modelo que la landing dejó fijado.
+_KEEP_ALIVE_RAW = os.environ.get("OLLAMA_KEEP_ALIVE") or os.environ.get("OLLAMA_PIN_KEEP_ALIVE") or "-1"
+OLLAMA_KEEP_ALIVE = int(_KEEP_ALIVE_RAW) if _KEEP_ALIVE_RAW.lstrip("-").isdigit() else _KEEP_ALIVE_RAW
+
+def ollama_stats(data: Dict, stats: Optional[Dict[str, float]]) -> None:
+    # Duraciones de Ollama en ns → ms, más los tokens de prompt y respuesta.
+    if stats is None:
+        return
+    for key in ("load_duration", "prompt_eval_duration", "eval_duration"):
+        if data.get(key) is not None:
+            stats[key.replace("_duration", "_ms")] = data[key] / 1e6
+    stats["prompt_tokens"] = data.get("prompt_eval_count", 0)
+    stats["eval_tokens"] = data.get("eval_count", 0)
+
+# ---------- Preprocesado de audio ----------
+# Se decodifica una vez a 16 kHz mono float32 (el formato que Whisper usa internamente),
+# se recorta el silencio de los extremos y se normaliza el nivel. El array resultante se
+# cachea por hash del fichero: reprocesar el mismo clip no vuelve a decodificar.
+ASR_SAMPLE_RATE = 16000
+_AUDIO_CACHE_MAX = 16
+_audio_cache = OrderedDict()
+_audio_cache_lock = threading.Lock()
+
+def _file_digest(path: str) -> str:
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def trim_silence(audio: np.ndarray, sr: int = ASR_SAMPLE_RATE, threshold_db: float = -40.0,
+                 frame_ms: int = 30, pad_ms: int = 200) -> np.ndarray:
+    # Umbral relativo a la trama más fuerte: funciona igual con micros de distinto nivel.
+    frame = int(sr * frame_ms / 1000)
+    n = len(audio) // frame
+    if n == 0:
+        return audio
+    rms = np.sqrt(np.mean(audio[: n * frame].reshape(n, frame) ** 2, axis=1) + 1e-12)
+    voiced = np.nonzero(20 * np.log10(rms / rms.max()) > threshold_db)[0]
+    if voiced.size == 0:
+        return audio
+    pad = int(sr * pad_ms / 1000)
+    start = max(0, voiced[0] * frame - pad)
+    end = min(len(audio), (voiced[-1] + 1) * frame + pad)
+    return audio[start:end]
+
+def normalize_level(audio: np.ndarray, peak: float = 0.95) -> np.ndarray:
+    current = float(np.max(np.abs(audio))) if audio.size else 0.0
+    if current < 1e-4:
+        return audio  # silencio: no amplificar ruido
+    return (audio * (peak / current)).astype(np.float32)
+
+def preprocess_audio(path: str) -> np.ndarray:
+    key = _file_digest(path)
+    with _audio_cache_lock:
+        cached = _audio_cache.get(key)
+        if cached is not None:
+            _audio_cache.move_to_end(key)
+            return cached
+    audio = normalize_level(trim_silence(decode_audio(path, sampling_rate=ASR_SAMPLE_RATE)))
+    with _audio_cache_lock:
+        _audio_cache[key] = audio
+        while len(_audio_cache) > _AUDIO_CACHE_MAX:
+            _audio_cache.popitem(last=False)
+    return audio
+
+# ---------- Piper (TTS) ----------
+_PIPER_RATES: Dict[str, int] = {}
+
+def piper_sample_rate(config_path: str) -> int:
+    if config_path not in _PIPER_RATES:
+        try:
+            with open(config_path, "r", encoding="utf-8") as f:
+                _PIPER_RATES[config_path] = int(json.load(f)["audio"]["sample_rate"])
+        except (OSError, KeyError, ValueError, TypeError):
+            _PIPER_RATES[config_path] = 22050
+    return _PIPER_RATES[config_path]
+
+def tts_piper_pcm(text: str,
+                  model_path: str,
+                  config_path: str,
+                  length_scale: float = 1.0,
+                  stats: Optional[Dict[str, float]] = None,
+                  piper_bin: str = "piper",
+                  error_label: str = "Error en Piper") -> Tuple[int, np.ndarray]:
+    # --output_raw: PCM int16 mono por stdout; se entrega a Gradio como (sr, array) sin pasar por disco
+    cmd = [
+        piper_bin,
+        "--model", model_path,
+        "--config", config_path,
+        "--length_scale", str(length_scale),
+        "--output_raw",
+    ]
+    t0 = time.perf_counter()
+    proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    err: List[bytes] = []
+
+    def feed():
+        # Si Piper sale antes de leer (modelo o config inválidos) el pipe se rompe; el
+        # fallo ya lo cuenta returncode con su stderr.
+        try:
+            proc.stdin.write(text.encode("utf-8"))
+        except OSError:
+            pass
+        finally:
+            try:
+                proc.stdin.close()
+            except OSError:
+                pass
+
+    feeder = threading.Thread(target=feed)
+    drainer = threading.Thread(target=lambda: err.append(proc.stderr.read()))
+    feeder.start()
+    drainer.start()
+    first = proc.stdout.read1(65536)
+    t_first = time.perf_counter()  # arranque + carga del modelo hasta el primer PCM
+    pcm = first + proc.stdout.read()
+    proc.wait()
+    feeder.join()
+    drainer.join()
+    if proc.returncode != 0:
+        raise RuntimeError(f"{error_label}:\n{b''.join(err).decode(errors='ignore')}")
+    if stats is not None:
+        stats["spawn_ms"] = (t_first - t0) * 1000
+        stats["synth_ms"] = (time.perf_counter() - t_first) * 1000
+    return piper_sample_rate(config_path), np.frombuffer(pcm, dtype=np.int16)
+
+def save_wav(out_wav, sample_rate: int, samples: np.ndarray) -> Path:
+    out_wav = Path(out_wav)
+    out_wav.parent.mkdir(parents=True, exist_ok=True)
+    with wave.open(str(out_wav), "wb") as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(sample_rate)
+        wf.writeframes(samples.tobytes())
+    return out_wav
+
+# ---------- Trazas de latencia ----------
+# Un TurnTrace por turno: spans por etapa (ms) → línea JSONL en TRACE_LOG y ventana
+# móvil en memoria para el panel p50/p95.
+TRACE_LOG = Path(os.environ.get("VOICE_TRACE_LOG", str(Path.home() / "ai" / "logs" / "voice_traces.jsonl")))
+TRACE_WINDOW = 200  # turnos para p50/p95 del panel de latencias
+_STAGE_MS: Dict[str, deque] = {}
+_TRACE_LOCK = threading.Lock()
+
+class TurnTrace:
+    def __init__(self, script: str):
+        self.script = script
+        self.started = dt.datetime.now().isoformat(timespec="seconds")
+        self.t0 = time.perf_counter()
+        self.spans: List[Dict] = []
+
+    @contextmanager
+    def span(self, stage: str):
+        rec = {"stage": stage}
+        t = time.perf_counter()
+        try:
+            yield rec
+        finally:
+            rec["ms"] = round((time.perf_counter() - t) * 1000, 1)
+            self.spans.append(rec)
+
+    def add(self, stage: str, ms: float, **extra):
+        self.spans.append({"stage": stage, "ms": round(ms, 1), **extra})
+
+    def add_llm(self, stats: Dict[str, float]):
+        # Desglose de Ollama (ver ollama_stats): evaluación del prompt y generación.
+        if "prompt_eval_ms" in stats:
+            self.add("llm_prompt_eval", stats["prompt_eval_ms"], tokens=stats["prompt_tokens"])
+        if "eval_ms" in stats:
+            self.add("llm_eval", stats["eval_ms"], tokens=stats["eval_tokens"])
+
+    def finish(self) -> Dict:
+        self.add("total", (time.perf_counter() - self.t0) * 1000)
+        for rec in self.spans:
+            if rec.get("audio_s"):
+                rec["rtf"] = round(rec["ms"] / 1000 / rec["audio_s"], 3)  # <1 = más rápido que tiempo real
+        record = {"ts": self.started, "script": self.script, "spans": self.spans}
+        with _TRACE_LOCK:
+            for rec in self.spans:
+                _STAGE_MS.setdefault(rec["stage"], deque(maxlen=TRACE_WINDOW)).append(rec["ms"])
+            try:
+                TRACE_LOG.parent.mkdir(parents=True, exist_ok=True)
+                with open(TRACE_LOG, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            except OSError:
+                pass
+        return record
+
+def trace_span(trace: Optional[TurnTrace], stage: str):
+    return trace.span(stage) if trace is not None else nullcontext({})
+
+def latency_table_md() -> str:
+    with _TRACE_LOCK:
+        stages = {k: list(v) for k, v in _STAGE_MS.items()}
+    if not stages:
+        return "_Sin turnos todavía._"
+    rows = ["| Etapa | n | p50 (ms) | p95 (ms) |", "|---|---:|---:|---:|"]
+    for stage, vals in stages.items():
+        p50, p95 = np.percentile(vals, [50, 95])
+        rows.append(f"| {stage} | {len(vals)} | {p50:.0f} | {p95:.0f} |")
+    return "\n".join(rows)